@@ -196,6 +196,59 @@ FEATURES = {
         'collaboration': True,
 }
 
+# The number of concepts written at a time with bulk inserts when importing
+# TBX files. Set to 0 to save every object individually.
+TBX_IMPORT_BATCH_SIZE = 500
+
+# Set to True to import TBX files in the background instead of during the
+# upload request. Uploaded files are kept in MEDIA_ROOT until they are
+# imported by the "process_tbx_imports" management command, which must be
+# kept running.
+TBX_IMPORT_IN_BACKGROUND = False
+# Background imports that don't report progress for this many seconds are
+# considered dead: they are marked as failed and their glossary is deleted.
+TBX_IMPORT_JOB_TIMEOUT = 3600
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Rendered TBX exports are kept in this directory, and served again until the
+# exported glossaries change. Set to None to render every export.
+TBX_EXPORT_CACHE_DIR = os.path.join(BASE_DIR, 'export_cache')
+# The disk space in bytes that the cached exports may take. The exports that
+# were used least recently are removed first.
+TBX_EXPORT_CACHE_SIZE = 100 * 1024 * 1024
+
+# The class that ranks partial matches in the advanced search, for example
+# "terminator.search.SearchBackend". By default it is chosen for the database:
+# PostgreSQL uses trigram indexes from pg_trgm, and SQLite an FTS5 table.
+SEARCH_BACKEND = None
+
+# The most terms that the autocompletion kept in memory of each process may
+# hold. Languages with more terms are looked up in the database instead.
+AUTOCOMPLETE_MAX_TERMS = 500000
+
+# How many compiled term spotting automata, one per glossary and language,
+# each process keeps in memory.
+TERM_SPOTTING_CACHE_SIZE = 20
+
+# The longest text, in characters, that the term spotting API accepts. Its
+# requests aren't limited by DATA_UPLOAD_MAX_MEMORY_SIZE.
+TERM_SPOTTING_MAX_LENGTH = 16 * 1024 * 1024
+
+# How long in seconds the rendered parts of the concept pages are cached. They
+# are invalidated whenever the concept or the related concepts shown with it
+# change, so this mostly limits how long unused entries take space in the cache.
+CONCEPT_CACHE_TIMEOUT = 24 * 3600
+
+# The list of concepts of a glossary is cached in chunks of concepts with ids
+# in ranges of this size, so that a change only renders one chunk again.
+GLOSSARY_CONCEPTS_CHUNK_SIZE = 1000
+
+# How long in seconds the roles of a user in glossaries are cached. They are
+# invalidated whenever the permissions of the user or its groups change, so
+# with several processes CACHES must use a backend that they share, like
+# memcached, and not the default local memory cache.
+GLOSSARY_ROLES_CACHE_TIMEOUT = 24 * 3600
+
 
 # Get local overrides
 try:
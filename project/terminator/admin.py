@@ -28,8 +28,6 @@ from django.utils.translation import ugettext_lazy, ungettext, ugettext as _
 
 from guardian.ctypes import get_content_type
 from guardian.models import Permission, UserObjectPermission
-from guardian.shortcuts import get_objects_for_user
-from guardian.utils import clean_orphan_obj_perms
 from simple_history.admin import SimpleHistoryAdmin
 
 from terminator.forms import (TerminatorConceptAdminForm,
@@ -37,19 +35,13 @@ from terminator.forms import (TerminatorConceptAdminForm,
                               TerminatorTranslationAdminForm,
                               ConceptInLanguageAdminForm)
 from terminator.models import *
-
-
-try:
-    from functools import lru_cache
-except ImportError:
-    from django.utils.lru_cache import lru_cache
+from terminator.permissions import glossary_permissions, request_cached
 
 
 class PartOfSpeechForLanguageInline(admin.TabularInline):
     model = PartOfSpeechForLanguage
     extra = 1
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(PartOfSpeechForLanguageInline, self).get_queryset(request)
         qs = qs.select_related("part_of_speech")
@@ -62,7 +54,6 @@ class AdministrativeStatusReasonForLanguageInline(admin.TabularInline):
     verbose_name = _("Administrative status reason for language")
     verbose_name_plural = _("Administrative status reasons for language")
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(AdministrativeStatusReasonForLanguageInline, self).get_queryset(request)
         qs = qs.select_related("administrativestatusreason")
@@ -107,7 +98,7 @@ class ChangePermissionFromQS(object):
     You must implement get_queryset() to filter by the appropriate
     permissions."""
 
-    @lru_cache()
+    @request_cached
     def has_change_permission(self, request, obj=None):
         if request.user.is_superuser:
             return True
@@ -126,13 +117,11 @@ class GlossaryAdmin(ChangePermissionFromQS, admin.ModelAdmin):
     ordering = ('name',)
     search_fields = ['name']
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(GlossaryAdmin, self).get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return get_objects_for_user(request.user,
-                                    ['owner'], qs, False)
+        return qs.filter(pk__in=glossary_permissions(request).glossaries('owner'))
 
     def get_exclude(self, request, obj=None):
         if not obj:
@@ -142,6 +131,9 @@ class GlossaryAdmin(ChangePermissionFromQS, admin.ModelAdmin):
 
     def save_model(self, request, obj, form, change):
         super(GlossaryAdmin, self).save_model(request, obj, form, change)
+        if change and 'source_language' in form.changed_data:
+            # Concepts are represented by their terms in the source language
+            obj.update_repr_caches()
         if form.is_valid() and form.has_changed():
             cleaned_data = form.cleaned_data
             permission_holders = form.get_collaborators()
@@ -181,14 +173,10 @@ class GlossaryAdmin(ChangePermissionFromQS, admin.ModelAdmin):
                             permission=perm,
                             user_id__in=remove_ids,
                     ).delete()
+                    # bulk_create() doesn't send signals to do this
+                    invalidate_glossary_roles(add_ids)
             User.objects.filter(id__in=staff_ids).update(is_staff=True)
 
-    def delete_model(self, request, obj):
-        super(GlossaryAdmin, self).delete_model(request, obj)
-        # Remove all orphaned per object permissions after deleting the
-        # glossary instance.
-        clean_orphan_obj_perms()
-
     def get_fields(self, request, obj=None):
         fields = super(GlossaryAdmin, self).get_fields(request, obj)
         if not settings.FEATURES.get('subscription', True):
@@ -230,7 +218,6 @@ class DefinitionInline(admin.TabularInline):
             return self.readonly_fields + ('language',)
         return self.readonly_fields
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(DefinitionInline, self).get_queryset(request)
         qs = qs.order_by('-is_finalized', 'language_id')
@@ -251,7 +238,6 @@ class ExternalResourceInline(admin.TabularInline):
     extra = 0
     fields =("address", "link_type", "description")
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(ExternalResourceInline, self).get_queryset(request)
         qs = qs.filter(language=None)
@@ -283,23 +269,22 @@ class ConceptAdmin(ChangePermissionFromQS, admin.ModelAdmin):
             }),
     )
 
-    @lru_cache()
-    def user_has_access(self, user, glossary):
-        return user.has_perm("terminologist", glossary)
+    def user_has_access(self, request, glossary):
+        return glossary_permissions(request).has_perm("terminologist", glossary)
 
-    @lru_cache()
+    @request_cached
     def has_add_permission(self, request):
         allowed = super(ConceptAdmin, self).has_add_permission(request)
         glossary_id = self._glossary_parameter(request)
         if glossary_id:
             glossary = Glossary.objects.get(pk=glossary_id)
-            return self.user_has_access(request.user, glossary)
+            return self.user_has_access(request, glossary)
         return allowed
 
     def has_delete_permission(self, request, obj=None):
         allowed = super(ConceptAdmin, self).has_delete_permission(request, obj)
         if obj:
-            return self.user_has_access(request.user, obj.glossary)
+            return self.user_has_access(request, obj.glossary_id)
         return allowed
 
     def get_readonly_fields(self, request, obj=None):
@@ -327,13 +312,8 @@ class ConceptAdmin(ChangePermissionFromQS, admin.ModelAdmin):
         return request.GET.get('glossary', None)
 
     def _glossaries_for(self, request):
-        if not "_glossaries_qs" in dir(self):
-            self._glossaries_qs = get_objects_for_user(request.user,
-                                        ['terminologist'],
-                                        Glossary, False)
-        return self._glossaries_qs
+        return glossary_permissions(request).glossaries('terminologist')
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(ConceptAdmin, self).get_queryset(request).select_related(
                "glossary")
@@ -440,7 +420,7 @@ class ConceptLanguageMixin(object):
             try:
                 qs = Concept.objects.filter(pk=obj_id)
                 concept = qs.first()
-                if request.user.has_perm("terminologist", concept.glossary):
+                if glossary_permissions(request).has_perm("terminologist", concept.glossary_id):
                     return qs
             except Concept.DoesNotExist:
                 raise PermissionDenied
@@ -467,9 +447,7 @@ class RelatedGlossaryListFilter(admin.SimpleListFilter):
         if request.user.is_superuser:
             glossaries = Glossary.objects.all()
         else:
-            glossaries = get_objects_for_user(request.user,
-                                        ['specialist'],
-                                        Glossary, False)
+            glossaries = glossary_permissions(request).glossaries('specialist')
         return [(glossary.pk, glossary.name) for glossary in glossaries]
 
     def queryset(self, request, queryset):
@@ -493,14 +471,11 @@ class ConceptInLanguageAdmin(ChangePermissionFromQS, admin.ModelAdmin):
     def has_add_permission(self, request):
         return False
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(ConceptInLanguageAdmin, self).get_queryset(request)
         if request.user.is_superuser:
             return qs
-        inner_qs = get_objects_for_user(request.user,
-                                        ['terminologist'],
-                                        Glossary, False)
+        inner_qs = glossary_permissions(request).glossaries('terminologist')
         return qs.filter(concept__glossary__in=inner_qs)
 
     def response_change(self, request, obj):
@@ -581,14 +556,11 @@ class TranslationAdmin(ChangePermissionFromQS, ConceptLanguageMixin, admin.Model
 
         return fieldsets
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(TranslationAdmin, self).get_queryset(request)
         if request.user.is_superuser:
             return qs
-        inner_qs = get_objects_for_user(request.user,
-                                        ['specialist'],
-                                        Glossary, False)
+        inner_qs = glossary_permissions(request).glossaries('specialist')
         return qs.filter(concept__glossary__in=inner_qs)
 
 
@@ -629,14 +601,11 @@ class DefinitionAdmin(ChangePermissionFromQS, ConceptLanguageMixin, SimpleHistor
             }),
     )
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(DefinitionAdmin, self).get_queryset(request)
         if request.user.is_superuser:
             return qs
-        inner_qs = get_objects_for_user(request.user,
-                                        ['specialist'],
-                                        Glossary, False)
+        inner_qs = glossary_permissions(request).glossaries('specialist')
         return qs.filter(concept__glossary__in=inner_qs)
 
     def response_change(self, request, obj):
@@ -644,6 +613,10 @@ class DefinitionAdmin(ChangePermissionFromQS, ConceptLanguageMixin, SimpleHistor
 
     def mark_finalized(modeladmin, request, queryset):
         queryset.update(is_finalized=True)
+        # update() doesn't send signals to do this
+        defer_glossary_version_update(
+                concept_ids=queryset.values_list('concept', flat=True).order_by(),
+        )
     mark_finalized.short_description = _(u"Mark selected definitions as finalized")
 
 admin.site.register(Definition, DefinitionAdmin)
@@ -672,14 +645,11 @@ class ProposalAdmin(ChangePermissionFromQS, admin.ModelAdmin):
     search_fields = ['term', 'definition']
     actions = ['convert_proposals']
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(ProposalAdmin, self).get_queryset(request)
         if request.user.is_superuser:
             return qs
-        inner_qs = get_objects_for_user(request.user,
-                                        ['terminologist'],
-                                        Glossary, False)
+        inner_qs = glossary_permissions(request).glossaries('terminologist')
         return qs.filter(for_glossary__in=inner_qs)
 
     def convert_proposals(self, request, queryset):
@@ -735,14 +705,11 @@ class ExternalResourceAdmin(ConceptLanguageMixin, admin.ModelAdmin):
             }),
     )
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(ExternalResourceAdmin, self).get_queryset(request)
         if request.user.is_superuser:
             return qs
-        inner_qs = get_objects_for_user(request.user,
-                                        ['specialist'],
-                                        Glossary, False)
+        inner_qs = glossary_permissions(request).glossaries('specialist')
         return qs.filter(concept__glossary__in=inner_qs)
 
 admin.site.register(ExternalResource, ExternalResourceAdmin)
@@ -787,14 +754,11 @@ class ContextSentenceAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         return False
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(ContextSentenceAdmin, self).get_queryset(request)
         if request.user.is_superuser:
             return qs
-        inner_qs = get_objects_for_user(request.user,
-                                        ['specialist'],
-                                        Glossary, False)
+        inner_qs = glossary_permissions(request).glossaries('specialist')
         return qs.filter(translation__concept__glossary__in=inner_qs)
 
 admin.site.register(ContextSentence, ContextSentenceAdmin)
@@ -812,14 +776,11 @@ class CorpusExampleAdmin(admin.ModelAdmin):
     def has_add_permission(self, request):
         return False
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(CorpusExampleAdmin, self).get_queryset(request)
         if request.user.is_superuser:
             return qs
-        inner_qs = get_objects_for_user(request.user,
-                                        ['specialist'],
-                                        Glossary, False)
+        inner_qs = glossary_permissions(request).glossaries('specialist')
         return qs.filter(translation__concept__glossary__in=inner_qs)
 
 admin.site.register(CorpusExample, CorpusExampleAdmin)
@@ -834,14 +795,11 @@ class CollaborationRequestAdmin(ChangePermissionFromQS, admin.ModelAdmin):
     search_fields = ['user__username']
     actions = ['accept_collaboration_requests']
 
-    @lru_cache()
     def get_queryset(self, request):
         qs = super(CollaborationRequestAdmin, self).get_queryset(request)
         if request.user.is_superuser:
             return qs
-        inner_qs = get_objects_for_user(request.user,
-                                        ['owner'],
-                                        Glossary, False)
+        inner_qs = glossary_permissions(request).glossaries('owner')
         return qs.filter(for_glossary__in=inner_qs)
 
     def has_add_permission(self, request):
@@ -0,0 +1,236 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+"""Prefix matching of terms for type-ahead, from memory.
+
+The terms of a language are loaded the first time that language is asked
+for, into one sorted list per glossary. Changes made in this process are
+applied from model signals once they are committed. Changes made by other
+processes are noticed through Glossary.terms_version, which is checked every
+few seconds, and cause the terms of the changed glossaries to be loaded
+again. Changes to other content of glossaries don't.
+"""
+
+from bisect import bisect_left, insort
+from collections import OrderedDict
+import heapq
+from itertools import islice
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from terminator.models import Glossary, Translation, glossary_terms_changed, search_key
+
+
+class PrefixIndex(object):
+    """Sorted in-memory lists of (search key, term, translation id).
+
+    At most max_terms terms are kept. The languages that were asked for least
+    recently are dropped to make room for others, and languages with more
+    terms than that are looked up in the database instead.
+    """
+
+    def __init__(self, max_terms=500000, check_interval=5):
+        self.max_terms = max_terms
+        self.check_interval = check_interval
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            # language -> {glossary id -> sorted list of entries}
+            self.languages = OrderedDict()
+            # translation id -> (language, glossary id, entry)
+            self.entries = {}
+            # glossary id -> Glossary.terms_version of the terms in memory
+            self.versions = {}
+            self.too_large = set()
+            self.checked = time.time()
+
+    def load(self, language, glossary_ids=None):
+        """Read the terms of a language, or of some of its glossaries.
+
+        Returns None if there are more than max_terms of them.
+        """
+        translations = Translation.objects.filter(language=language)
+        if glossary_ids is not None:
+            translations = translations.filter(concept__glossary__in=glossary_ids)
+        translations = translations.values_list(
+                'search_key', 'translation_text', 'pk', 'concept__glossary',
+        ).order_by()
+        lists = {}
+        for count, row in enumerate(translations.iterator()):
+            if count >= self.max_terms:
+                return None
+            lists.setdefault(row[3], []).append(row[:3])
+        # Sorted here, since the database might use a different collation.
+        for entries in lists.values():
+            entries.sort()
+        return lists
+
+    def register(self, language, lists):
+        for glossary_id, entries in lists.items():
+            for entry in entries:
+                self.entries[entry[2]] = (language, glossary_id, entry)
+
+    def unregister(self, lists):
+        for entries in lists.values():
+            for entry in entries:
+                del self.entries[entry[2]]
+
+    def get_language(self, language):
+        """The lists of a language, loading it if needed, or None if it is
+        too large to keep in memory."""
+        if language in self.too_large:
+            return None
+        lists = self.languages.pop(language, None)
+        if lists is None:
+            if not self.versions:
+                self.versions = dict(Glossary.objects.values_list('pk', 'terms_version'))
+            lists = self.load(language)
+            if lists is None:
+                self.too_large.add(language)
+                return None
+            self.register(language, lists)
+            while len(self.entries) > self.max_terms and self.languages:
+                oldest = next(iter(self.languages))
+                self.unregister(self.languages.pop(oldest))
+        # The most recently used languages are last.
+        self.languages[language] = lists
+        return lists
+
+    def check_versions(self):
+        """Load the terms of glossaries changed by other processes."""
+        if time.time() - self.checked < self.check_interval:
+            return
+        self.checked = time.time()
+        versions = dict(Glossary.objects.values_list('pk', 'terms_version'))
+        changed = set(pk for pk in set(versions) | set(self.versions)
+                      if versions.get(pk) != self.versions.get(pk))
+        self.versions = versions
+        if not changed:
+            return
+        # Languages that were too large might be small enough now.
+        self.too_large = set()
+        for language in list(self.languages):
+            lists = self.languages[language]
+            self.unregister(dict(
+                    (pk, lists.pop(pk)) for pk in changed if pk in lists
+            ))
+            new_lists = self.load(language, changed)
+            if new_lists is None:
+                self.unregister(self.languages.pop(language))
+            else:
+                lists.update(new_lists)
+                self.register(language, new_lists)
+
+    def applied(self, glossary_ids):
+        """Note that the latest changes to the terms of some glossaries were
+        applied from the signals of this process, and need no loading."""
+        with self.lock:
+            for pk in glossary_ids:
+                if pk in self.versions:
+                    self.versions[pk] += 1
+
+    def add(self, language, glossary_id, key, text, pk):
+        with self.lock:
+            self.remove(pk)
+            lists = self.languages.get(language)
+            if lists is None:
+                return
+            entry = (key, text, pk)
+            insort(lists.setdefault(glossary_id, []), entry)
+            self.entries[pk] = (language, glossary_id, entry)
+
+    def remove(self, pk):
+        with self.lock:
+            if pk not in self.entries:
+                return
+            language, glossary_id, entry = self.entries.pop(pk)
+            lists = self.languages[language]
+            lists[glossary_id].pop(bisect_left(lists[glossary_id], entry))
+
+    def lookup(self, language, prefix, glossary_id=None, limit=10):
+        """Up to limit different terms starting with prefix, in the order of
+        their search keys."""
+        prefix = search_key(prefix)
+        with self.lock:
+            self.check_versions()
+            lists = self.get_language(language)
+            if lists is None:
+                return self.lookup_database(language, prefix, glossary_id, limit)
+            if glossary_id is not None:
+                lists = [lists.get(glossary_id, [])]
+            else:
+                lists = lists.values()
+            matches = heapq.merge(*[
+                self.iter_prefix(entries, prefix) for entries in lists
+            ])
+            return list(islice(unique_terms(matches), limit))
+
+    def iter_prefix(self, entries, prefix):
+        i = bisect_left(entries, (prefix,))
+        while i < len(entries) and entries[i][0].startswith(prefix):
+            yield entries[i]
+            i += 1
+
+    def lookup_database(self, language, prefix, glossary_id, limit):
+        translations = Translation.objects.filter(
+                language=language,
+                search_key__startswith=prefix,
+        )
+        if glossary_id is not None:
+            translations = translations.filter(concept__glossary=glossary_id)
+        translations = translations.values_list(
+                'search_key', 'translation_text', 'pk',
+        ).order_by('search_key', 'translation_text', 'pk')
+        # Read a few more rows in case some terms are repeated.
+        return list(islice(unique_terms(translations[:limit * 3]), limit))
+
+
+def unique_terms(entries):
+    seen = set()
+    for key, text, pk in entries:
+        if text not in seen:
+            seen.add(text)
+            yield text
+
+
+index = PrefixIndex(
+        max_terms=getattr(settings, 'AUTOCOMPLETE_MAX_TERMS', 500000),
+)
+
+
+def translation_saved(sender, instance, **kwargs):
+    # Even if the language is not loaded yet, it could be before the commit.
+    args = (instance.language_id, instance.concept.glossary_id,
+            instance.search_key, instance.translation_text, instance.pk)
+    transaction.on_commit(lambda: index.add(*args))
+post_save.connect(translation_saved, sender=Translation)
+
+
+def translation_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: index.remove(pk))
+post_delete.connect(translation_deleted, sender=Translation)
+
+
+def terms_changed(sender, glossary_ids, reload_ids, **kwargs):
+    index.applied(glossary_ids - reload_ids)
+glossary_terms_changed.connect(terms_changed)
@@ -41,7 +41,7 @@ class LatestChangesGenericFeed(Feed):
         return self._ctype
 
     def items(self):
-        return LogEntry.objects.filter(content_type=self.ctype).order_by("-action_time")[:20]
+        return LogEntry.objects.filter(activity__content_type=self.ctype).order_by("-activity__action_time")[:20]
 
     def item_title(self, item):
         if item.is_addition():
@@ -101,7 +101,7 @@ class LatestChangesFeed(Feed):
         return self._ctypes
 
     def items(self):
-        return LogEntry.objects.filter(content_type__in=self.ctypes).order_by("-action_time")[:20]
+        return LogEntry.objects.filter(activity__content_type__in=self.ctypes).order_by("-activity__action_time")[:20]
 
     def item_title(self, item):
         if item.is_addition():
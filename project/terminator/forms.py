@@ -20,6 +20,7 @@ from django import forms
 from django.conf import settings
 from django.contrib.admin.widgets import FilteredSelectMultiple
 from django.forms.widgets import Textarea, TextInput, URLInput, Select
+from django.urls import reverse_lazy
 from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 
@@ -33,7 +34,13 @@ class SearchForm(forms.Form):
             max_length=100,
             min_length=2,
             label=_("Search string"),
-            widget=TextInput(attrs={"placeholder": _("Term to search for")}),
+            # Terms are suggested when there is a language to filter by in
+            # the advanced search, see autocomplete.js
+            widget=TextInput(attrs={
+                "placeholder": _("Term to search for"),
+                "data-autocomplete": reverse_lazy('terminator_autocomplete'),
+                "data-autocomplete-language": "id_filter_by_language",
+            }),
     )
 
 
@@ -41,6 +48,9 @@ class AdvancedSearchForm(SearchForm):
     also_show_partial_matches = forms.BooleanField(required=False,
         label=_("Also show partial matches")
     )
+    search_in_definitions = forms.BooleanField(required=False,
+        label=_("Search in definitions instead of terms")
+    )
     filter_by_glossary = forms.ModelChoiceField(
         queryset=Glossary.objects.all(), required=False,
         label=_("Filter by glossary")
@@ -0,0 +1,97 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+from terminator.models import delete_object_permissions
+from terminator.utils import chunks, query_params_limit
+
+
+class Command(BaseCommand):
+    help = ("Deletes the per object permissions of objects that don't exist "
+            "anymore, in batches. Glossaries delete their own permissions, so "
+            "this is only needed for other objects or for older data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help="The number of permissions to check at a time.",
+        )
+        parser.add_argument(
+            '--start-after', type=int, default=0, metavar='ID',
+            help="Continue after the permission with this id, as printed by "
+                 "an interrupted run.",
+        )
+
+    def handle(self, *args, **options):
+        for Model in (UserObjectPermission, GroupObjectPermission):
+            self.clean(Model, options)
+
+    def clean(self, Model, options):
+        permissions = Model.objects.order_by('pk')
+        deleted = 0
+        last_id = options['start_after']
+        while True:
+            batch = list(permissions.filter(
+                    pk__gt=last_id,
+            ).values_list('pk', 'content_type', 'object_pk')[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            orphans = self.orphans(batch)
+            if orphans:
+                with transaction.atomic():
+                    for ids in chunks(orphans, query_params_limit()):
+                        delete_object_permissions(Model.objects.filter(pk__in=ids))
+                deleted += len(orphans)
+            if options['verbosity'] > 0:
+                self.stdout.write("%s: %d deleted, checked up to id %d" % (
+                        Model._meta.verbose_name_plural, deleted, last_id))
+
+    def orphans(self, batch):
+        """The ids of the permissions in the batch with a missing object."""
+        by_ctype = {}
+        for pk, ctype_id, object_pk in batch:
+            by_ctype.setdefault(ctype_id, []).append((pk, object_pk))
+        orphans = []
+        for ctype_id, lines in by_ctype.items():
+            try:
+                model = ContentType.objects.get_for_id(ctype_id).model_class()
+            except ContentType.DoesNotExist:
+                # Left by a removed model
+                model = None
+            objects = {}
+            for pk, object_pk in lines:
+                try:
+                    objects[pk] = model._meta.pk.to_python(object_pk)
+                except (AttributeError, ValidationError):
+                    # No model, or an invalid object_pk
+                    objects[pk] = None
+            existing = set()
+            if model is not None:
+                values = [value for value in objects.values() if value is not None]
+                for values in chunks(values, query_params_limit()):
+                    # Like guardian, since a default manager might hide
+                    # objects that exist.
+                    existing.update(model._base_manager.filter(
+                            pk__in=values,
+                    ).values_list('pk', flat=True))
+            orphans.extend(pk for pk, value in objects.items() if value not in existing)
+        return orphans
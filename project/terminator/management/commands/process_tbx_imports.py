@@ -0,0 +1,51 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from terminator.models import ImportJob
+from terminator.views.tbx_import import reclaim_import_jobs, run_import_job
+
+
+class Command(BaseCommand):
+    help = ("Imports the TBX files uploaded while TBX_IMPORT_IN_BACKGROUND is "
+            "enabled. Runs until interrupted, unless --once is given. Imports "
+            "that stopped reporting progress for TBX_IMPORT_JOB_TIMEOUT "
+            "seconds are marked as failed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Process the queued imports and exit.",
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help="Seconds to wait before looking for new imports.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            for job in reclaim_import_jobs():
+                self.stdout.write("%s: %s" % (job.glossary_name, job.get_status_display()))
+            queued = ImportJob.objects.filter(status=ImportJob.QUEUED).order_by('pk')
+            for job in queued:
+                if run_import_job(job):
+                    self.stdout.write("%s: %s" % (job.glossary_name, job.get_status_display()))
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import BaseCommand, CommandError
+
+from terminator.models import Concept, Glossary, update_repr_caches
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the cached representation of the concepts of some "
+            "glossaries, or of all of them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'glossaries', nargs='*', type=int, metavar='glossary_id',
+            help="The glossaries to update. All glossaries if none is given.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help="The number of concepts to update at a time.",
+        )
+
+    def handle(self, *args, **options):
+        concepts = Concept.objects.order_by('pk')
+        if options['glossaries']:
+            glossaries = Glossary.objects.filter(pk__in=options['glossaries'])
+            missing = set(options['glossaries']) - set(glossaries.values_list('pk', flat=True))
+            if missing:
+                raise CommandError("No glossary with id %s" % ", ".join(str(pk) for pk in sorted(missing)))
+            concepts = concepts.filter(glossary__in=options['glossaries'])
+        total = concepts.count()
+        done = 0
+        last_id = 0
+        while True:
+            # Each batch continues after the last concept of the previous one,
+            # so that batches don't get slower as they go.
+            batch = list(concepts.filter(
+                    pk__gt=last_id,
+            ).values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            update_repr_caches(batch)
+            done += len(batch)
+            last_id = batch[-1]
+            if options['verbosity'] > 0:
+                self.stdout.write("%d/%d concepts updated" % (done, total))
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:34
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('terminator', '0023_rename_glossary_permissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('glossary_name', models.CharField(max_length=50, verbose_name='glossary name')),
+                ('tbx_file', models.FileField(blank=True, upload_to='tbx_imports', verbose_name='TBX file')),
+                ('status', models.CharField(choices=[('Q', 'Queued'), ('R', 'Running'), ('S', 'Succeeded'), ('F', 'Failed')], default='Q', max_length=1, verbose_name='status')),
+                ('message', models.TextField(blank=True, verbose_name='message')),
+                ('concepts_parsed', models.PositiveIntegerField(default=0, verbose_name='parsed concepts')),
+                ('terms_inserted', models.PositiveIntegerField(default=0, verbose_name='inserted terms')),
+                ('relations_resolved', models.PositiveIntegerField(default=0, verbose_name='resolved relations')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='finished')),
+                ('glossary', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='terminator.Glossary', verbose_name='glossary')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='user')),
+            ],
+            options={
+                'verbose_name': 'import job',
+                'verbose_name_plural': 'import jobs',
+            },
+        ),
+    ]
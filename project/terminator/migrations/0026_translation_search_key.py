@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 05:02
+from __future__ import unicode_literals
+
+import unicodedata
+
+from django.db import migrations, models
+
+from terminator.utils import update_in_bulk
+
+
+def search_key(text):
+    # A copy of terminator.models.search_key() at the time of this migration
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.split())[:200]
+
+
+def populate_search_keys(apps, schema_editor):
+    Translation = apps.get_model('terminator', 'Translation')
+    db_alias = schema_editor.connection.alias
+    translations = Translation.objects.using(db_alias).order_by('id').values_list('id', 'translation_text')
+    last_id = 0
+    while True:
+        batch = list(translations.filter(id__gt=last_id)[:1000])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        update_in_bulk(Translation, 'search_key', dict(
+            (pk, search_key(text)) for pk, text in batch
+        ), using=db_alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terminator', '0025_glossary_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='translation',
+            name='search_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200, verbose_name='search key'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(populate_search_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 06:10
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# Indexes for terminator.search. They depend on the database, so they are
+# created with raw SQL and only on the databases that support them.
+
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX terminator_translation_search_key_trgm "
+    "ON terminator_translation USING gin (search_key gin_trgm_ops)",
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS terminator_translation_search_key_trgm",
+]
+
+# An external content FTS5 table: only the index is stored, the text is read
+# from terminator_translation. The triggers keep the index up to date, also
+# for bulk inserts and updates that don't go through Translation.save().
+# Migrations that make SQLite rebuild terminator_translation (most changes of
+# its columns do) drop the triggers. They are created again after every
+# migrate, see terminator.search.create_fts_triggers().
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE terminator_translation_fts USING fts5("
+    "search_key, content='terminator_translation', content_rowid='id', "
+    "tokenize='trigram')",
+    "CREATE TRIGGER terminator_translation_fts_insert "
+    "AFTER INSERT ON terminator_translation BEGIN "
+    "INSERT INTO terminator_translation_fts(rowid, search_key) "
+    "VALUES (new.id, new.search_key); END",
+    "CREATE TRIGGER terminator_translation_fts_delete "
+    "AFTER DELETE ON terminator_translation BEGIN "
+    "INSERT INTO terminator_translation_fts(terminator_translation_fts, rowid, search_key) "
+    "VALUES ('delete', old.id, old.search_key); END",
+    "CREATE TRIGGER terminator_translation_fts_update "
+    "AFTER UPDATE OF search_key ON terminator_translation BEGIN "
+    "INSERT INTO terminator_translation_fts(terminator_translation_fts, rowid, search_key) "
+    "VALUES ('delete', old.id, old.search_key); "
+    "INSERT INTO terminator_translation_fts(rowid, search_key) "
+    "VALUES (new.id, new.search_key); END",
+    "INSERT INTO terminator_translation_fts(terminator_translation_fts) "
+    "VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS terminator_translation_fts_insert",
+    "DROP TRIGGER IF EXISTS terminator_translation_fts_delete",
+    "DROP TRIGGER IF EXISTS terminator_translation_fts_update",
+    "DROP TABLE IF EXISTS terminator_translation_fts",
+]
+
+
+def sqlite_has_trigram_fts(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                "CREATE VIRTUAL TABLE temp.terminator_fts_check "
+                "USING fts5(x, tokenize='trigram')"
+            )
+        except Exception:
+            return False
+        cursor.execute("DROP TABLE temp.terminator_fts_check")
+    return True
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRESQL_FORWARD
+    elif vendor == 'sqlite' and sqlite_has_trigram_fts(schema_editor):
+        statements = SQLITE_FORWARD
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRESQL_BACKWARD
+    elif vendor == 'sqlite':
+        statements = SQLITE_BACKWARD
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terminator', '0026_translation_search_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
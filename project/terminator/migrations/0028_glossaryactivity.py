@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 04:19
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+import django.db.models.deletion
+import re
+
+
+def activity_targets(Model):
+    # A copy of terminator.models.activity_targets() at the time of this
+    # migration
+    names = set(field.name for field in Model._meta.fields)
+    if Model._meta.model_name == 'glossary':
+        return {'glossary': 'pk'}
+    if Model._meta.model_name == 'concept':
+        return {'glossary': 'glossary', 'concept': 'pk'}
+    targets = {}
+    if 'concept' in names:
+        targets['glossary'] = 'concept__glossary'
+        targets['concept'] = 'concept'
+    elif 'translation' in names:
+        targets['glossary'] = 'translation__concept__glossary'
+        targets['concept'] = 'translation__concept'
+        targets['language'] = 'translation__language'
+    elif 'for_glossary' in names:
+        targets['glossary'] = 'for_glossary'
+    if 'language' in names:
+        targets['language'] = 'language'
+    return targets
+
+
+def object_id(entry):
+    return int(entry.object_id) if entry.object_id.isdigit() else None
+
+
+def populate_activity(apps, schema_editor):
+    LogEntry = apps.get_model('admin', 'LogEntry')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Concept = apps.get_model('terminator', 'Concept')
+    GlossaryActivity = apps.get_model('terminator', 'GlossaryActivity')
+    db_alias = schema_editor.connection.alias
+    model_classes = {}
+    for ctype in ContentType.objects.using(db_alias).filter(app_label='terminator'):
+        try:
+            model_classes[ctype.pk] = apps.get_model('terminator', ctype.model)
+        except LookupError:
+            pass
+    entries = LogEntry.objects.using(db_alias).filter(
+            content_type__in=list(model_classes),
+    ).order_by('id')
+    last_id = 0
+    while True:
+        batch = list(entries.filter(id__gt=last_id)[:500])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        found = {}
+        for ctype_id, Model in model_classes.items():
+            ids = set(int(entry.object_id) for entry in batch
+                      if entry.content_type_id == ctype_id and entry.object_id.isdigit())
+            targets = activity_targets(Model)
+            if not ids or not targets:
+                continue
+            for values in Model._base_manager.using(db_alias).filter(pk__in=ids).values(
+                    'pk', **dict(('activity_' + key, F(lookup)) for key, lookup in targets.items())):
+                found[(ctype_id, values['pk'])] = values
+        # Deleted objects name their concept in their description.
+        deleted_from = {}
+        for entry in batch:
+            if (entry.content_type_id, object_id(entry)) not in found:
+                match = re.search(r'#([\d]+)', entry.object_repr)
+                if match and 'concept' in activity_targets(model_classes[entry.content_type_id]):
+                    deleted_from[entry.id] = int(match.group(1))
+        concepts = dict(Concept.objects.using(db_alias).filter(
+                pk__in=set(deleted_from.values()),
+        ).values_list('pk', 'glossary'))
+        activities = []
+        for entry in batch:
+            activity = GlossaryActivity(
+                    log_entry_id=entry.id,
+                    content_type_id=entry.content_type_id,
+                    action_flag=entry.action_flag,
+                    action_time=entry.action_time,
+                    user_id=entry.user_id,
+            )
+            values = found.get((entry.content_type_id, object_id(entry)))
+            if values:
+                activity.glossary_id = values.get('activity_glossary')
+                activity.concept_id = values.get('activity_concept')
+                activity.language_id = values.get('activity_language')
+            elif deleted_from.get(entry.id) in concepts:
+                activity.concept_id = deleted_from[entry.id]
+                activity.glossary_id = concepts[activity.concept_id]
+            activities.append(activity)
+        GlossaryActivity.objects.using(db_alias).bulk_create(activities)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('admin', '0002_logentry_remove_auto_add'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('terminator', '0027_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GlossaryActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action_flag', models.PositiveSmallIntegerField(verbose_name='action flag')),
+                ('action_time', models.DateTimeField(db_index=True, verbose_name='action time')),
+            ],
+            options={
+                'verbose_name': 'glossary activity',
+                'verbose_name_plural': 'glossary activity',
+            },
+        ),
+        migrations.AddField(
+            model_name='glossaryactivity',
+            name='concept',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='terminator.Concept', verbose_name='concept'),
+        ),
+        migrations.AddField(
+            model_name='glossaryactivity',
+            name='content_type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType', verbose_name='content type'),
+        ),
+        migrations.AddField(
+            model_name='glossaryactivity',
+            name='glossary',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='terminator.Glossary', verbose_name='glossary'),
+        ),
+        migrations.AddField(
+            model_name='glossaryactivity',
+            name='language',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='terminator.Language', verbose_name='language'),
+        ),
+        migrations.AddField(
+            model_name='glossaryactivity',
+            name='log_entry',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='admin.LogEntry', verbose_name='log entry'),
+        ),
+        migrations.AddField(
+            model_name='glossaryactivity',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='user'),
+        ),
+        migrations.AddIndex(
+            model_name='glossaryactivity',
+            index=models.Index(fields=['glossary', 'action_time'], name='terminator_activity_glossary'),
+        ),
+        migrations.AddIndex(
+            model_name='glossaryactivity',
+            index=models.Index(fields=['content_type', 'action_time'], name='terminator_activity_ctype'),
+        ),
+        migrations.AddIndex(
+            model_name='glossaryactivity',
+            index=models.Index(fields=['user', 'action_time'], name='terminator_activity_user'),
+        ),
+        migrations.RunPython(populate_activity, migrations.RunPython.noop),
+    ]
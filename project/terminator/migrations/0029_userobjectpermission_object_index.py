@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 09:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# guardian only indexes the permissions of an object as part of its
+# (user, permission, object_pk) unique constraint, which can't be used to find
+# all the permissions on a glossary when it is deleted.
+
+INDEX = models.Index(fields=['content_type', 'object_pk'], name='terminator_uop_object')
+
+
+def add_index(apps, schema_editor):
+    UserObjectPermission = apps.get_model('guardian', 'UserObjectPermission')
+    schema_editor.add_index(UserObjectPermission, INDEX)
+
+
+def remove_index(apps, schema_editor):
+    UserObjectPermission = apps.get_model('guardian', 'UserObjectPermission')
+    schema_editor.remove_index(UserObjectPermission, INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guardian', '0001_initial'),
+        ('terminator', '0028_glossaryactivity'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_index, remove_index),
+    ]
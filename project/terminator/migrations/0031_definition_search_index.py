@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 09:12
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+# Indexes for the definitions in terminator.search, like those of the terms
+# in 0027_search_indexes.
+
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX terminator_definition_text_trgm "
+    "ON terminator_definition USING gin (text gin_trgm_ops)",
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS terminator_definition_text_trgm",
+]
+
+# The triggers are created after every migrate, see
+# terminator.search.create_fts_triggers().
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE terminator_definition_fts USING fts5("
+    "text, content='terminator_definition', content_rowid='id', "
+    "tokenize='trigram')",
+    "INSERT INTO terminator_definition_fts(terminator_definition_fts) "
+    "VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS terminator_definition_fts_insert",
+    "DROP TRIGGER IF EXISTS terminator_definition_fts_delete",
+    "DROP TRIGGER IF EXISTS terminator_definition_fts_update",
+    "DROP TABLE IF EXISTS terminator_definition_fts",
+]
+
+
+def sqlite_has_fts_table(schema_editor):
+    # 0027_search_indexes only creates it if SQLite supports it.
+    with schema_editor.connection.cursor() as cursor:
+        tables = schema_editor.connection.introspection.table_names(cursor)
+    return 'terminator_translation_fts' in tables
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRESQL_FORWARD
+    elif vendor == 'sqlite' and sqlite_has_fts_table(schema_editor):
+        statements = SQLITE_FORWARD
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRESQL_BACKWARD
+    elif vendor == 'sqlite':
+        statements = SQLITE_BACKWARD
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terminator', '0030_importjob_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 05:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('terminator', '0031_definition_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='glossary',
+            name='terms_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='terms version'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 06:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# Like 0029, for the permissions of groups, which are also deleted with their
+# glossary.
+
+INDEX = models.Index(fields=['content_type', 'object_pk'], name='terminator_gop_object')
+
+
+def add_index(apps, schema_editor):
+    GroupObjectPermission = apps.get_model('guardian', 'GroupObjectPermission')
+    schema_editor.add_index(GroupObjectPermission, INDEX)
+
+
+def remove_index(apps, schema_editor):
+    GroupObjectPermission = apps.get_model('guardian', 'GroupObjectPermission')
+    schema_editor.remove_index(GroupObjectPermission, INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guardian', '0001_initial'),
+        ('terminator', '0033_concept_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_index, remove_index),
+    ]
@@ -18,14 +18,16 @@
 
 from __future__ import unicode_literals
 
+from django.conf import settings
 from django.contrib.admin.models import LogEntry
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, Permission, User
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
-from django.db import models
-from django.db.models import Field, Transform
-from django.db.models.signals import post_delete
-from django.dispatch import receiver
+from django.db import models, transaction
+from django.db.models import Count, ExpressionWrapper, F, Max, OuterRef, Q, Subquery
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
 from django.urls import reverse
 from django.utils.encoding import force_text, python_2_unicode_compatible
 from django.utils.html import format_html, mark_safe
@@ -34,8 +36,13 @@ from django.utils.translation import ugettext_lazy as _
 from guardian.shortcuts import assign_perm, get_users_with_perms
 from simple_history.models import HistoricalRecords
 
+from terminator.search import create_fts_triggers
+from terminator.utils import chunks, query_params_limit, update_in_bulk
+
 import itertools
 import re
+import threading
+import unicodedata
 
 @python_2_unicode_compatible
 class PartOfSpeech(models.Model):
@@ -195,6 +202,11 @@ class Glossary(models.Model):
     # limit_choices_to = {'glossary__exact': self} in order to reduce the
     # options shown in the admin site.
     subject_fields = models.ManyToManyField('Concept', related_name='glossary_subject_fields', blank=True, verbose_name=_("subject fields"))
+    # Increased on every change to the exported content of the glossary, so
+    # that cached exports of older versions are not used.
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name=_("version"))
+    # Increased on the changes to the terms only, for the autocomplete index.
+    terms_version = models.PositiveIntegerField(default=0, editable=False, verbose_name=_("terms version"))
 
     class Meta:
         verbose_name = _("glossary")
@@ -208,6 +220,16 @@ class Glossary(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # The versions in memory might be stale. They are only increased
+            # in the database, see update_glossary_version().
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in ('version', 'terms_version')
+            ]
+        super(Glossary, self).save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('terminator_glossary_detail', kwargs={'pk': self.pk})
 
@@ -255,17 +277,18 @@ class Glossary(models.Model):
                     collaborators.append({'user': line.user, 'role': role})
         return collaborators
 
+    def update_repr_caches(self):
+        """Recompute the repr_cache of all the concepts in the glossary."""
+        update_repr_caches(self.concept_set.values_list('pk', flat=True))
+
     def get_recent_changes(self):
-        qs = LogEntry.objects.none()
-        for Model in (Translation, Definition, ExternalResource, ConceptInLanguage):
-            ctype = ContentType.objects.get_for_model(Model)
-            qs = qs.union(LogEntry.objects.filter(
-                content_type=ctype,
-                object_id__integer__in=Model.objects.filter(
-                    concept__glossary=self,
-                ),
-            ).order_by())
-        return process_recent_changes(qs.order_by("-action_time")[:5])
+        ctypes = ContentType.objects.get_for_models(
+                Translation, Definition, ExternalResource, ConceptInLanguage,
+        ).values()
+        return process_recent_changes(GlossaryActivity.objects.filter(
+                glossary=self,
+                content_type__in=ctypes,
+        ).order_by("-action_time")[:5])
 
 @python_2_unicode_compatible
 class Concept(models.Model):
@@ -276,6 +299,9 @@ class Concept(models.Model):
     # This keeps a readable version cached in this table so that no joining
     # with Translation is required for a human readable form.
     repr_cache = models.CharField(max_length=200, editable=False, null=True, blank=True, verbose_name=_("representation"))
+    # The version of the glossary when the concept, or a concept shown on its
+    # page, last changed. Cached fragments of its page use it in their keys.
+    version = models.PositiveIntegerField(default=0, editable=False, verbose_name=_("version"))
 
     class Meta:
         verbose_name = _("concept")
@@ -287,6 +313,15 @@ class Concept(models.Model):
             return self.repr_cache
         return _("Concept #%(concept_id)d") % {'concept_id': self.id}
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # The version in memory might be stale, see Glossary.save().
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'version'
+            ]
+        super(Concept, self).save(*args, **kwargs)
+
     def update_repr_cache(self):
         if not self.id:
             # can happen in test teardown and similar situations
@@ -301,9 +336,7 @@ class Concept(models.Model):
 
     def repr_from(self, translations):
         translations = sorted(translations, key=lambda t: t.cmp_key())
-        repr_ = ', '.join(t.translation_text for t in translations[:4])[:200]
-        repr_ = "#%d: %s" % (self.id, repr_)
-        return repr_
+        return concept_repr(self.id, [t.translation_text for t in translations])
 
     def source_language_finalized(self):
         return ConceptInLanguage.objects.filter(
@@ -343,12 +376,370 @@ class Concept(models.Model):
         return reverse('terminator_concept_detail', kwargs={'pk': self.pk})
 
 
+def concept_repr(concept_id, terms):
+    """The repr_cache of a concept, from its source terms in cmp_key() order."""
+    repr_ = ', '.join(terms[:4])[:200]
+    return "#%d: %s" % (concept_id, repr_)
+
+
+def update_repr_caches(concept_ids):
+    """Recompute the repr_cache of many concepts with a few queries.
+
+    concept_ids can be any iterable of Concept ids, for example those of a
+    whole glossary.
+    """
+    batch_size = max(query_params_limit() - 1, 1)
+    for batch in chunks(sorted(set(concept_ids)), batch_size):
+        src_terms = {}
+        by_language = {}
+        glossaries = {}
+        for pk, glossary_id, language_id in Concept.objects.filter(pk__in=batch).values_list(
+                'pk', 'glossary', 'glossary__source_language'):
+            src_terms[pk] = []
+            glossaries[pk] = glossary_id
+            by_language.setdefault(language_id, []).append(pk)
+        # One query per source language rather than a join with the glossary,
+        # which some databases plan badly.
+        for language_id, concept_ids in by_language.items():
+            translations = Translation.objects.filter(
+                    concept__in=concept_ids,
+                    language=language_id,
+            ).values_list(
+                    'concept', 'administrative_status', 'translation_text',
+            ).order_by()
+            for concept_id, status_id, text in translations:
+                src_terms[concept_id].append((term_cmp_key(status_id, text), text))
+        update_in_bulk(Concept, 'repr_cache', dict(
+                (pk, concept_repr(pk, [text for key, text in sorted(terms)]))
+                for pk, terms in src_terms.items()
+        ))
+        # The repr_cache is shown in the cached lists and concept pages.
+        defer_glossary_version_update(concept_ids=list(glossaries))
+
+
+_pending_repr_caches = threading.local()
+
+
+def defer_repr_cache_update(concept_id):
+    """Update the repr_cache of a concept once the transaction commits.
+
+    A concept that changes many times in one transaction is updated once.
+    Outside of a transaction, it is updated immediately.
+    """
+    pending = _pending_repr_caches.__dict__.setdefault('concept_ids', set())
+    pending.add(concept_id)
+    # The callbacks of a rolled back savepoint are dropped, so every change
+    # registers one. The first to run handles all pending concepts.
+    transaction.on_commit(flush_repr_caches)
+
+
+def flush_repr_caches():
+    """Update the repr_cache of the concepts that changed."""
+    concept_ids = _pending_repr_caches.__dict__.pop('concept_ids', None)
+    if concept_ids:
+        update_repr_caches(concept_ids)
+
+
 def update_repr_cache(sender, **kwargs):
     translation = kwargs.get('instance')
-    translation.concept.update_repr_cache()
+    defer_repr_cache_update(translation.concept_id)
 post_delete.connect(update_repr_cache, sender='terminator.Translation')
 
 
+_pending_glossary_versions = threading.local()
+
+# Sent once the terms_version of glossaries was increased. The changes to
+# terms given by concepts were also sent as signals of Translation, but those
+# of reload_ids were not.
+glossary_terms_changed = Signal(providing_args=['glossary_ids', 'reload_ids'])
+
+
+def defer_glossary_version_update(glossary_ids=(), concept_ids=(), translation_ids=(), terms=False):
+    """Increase the version of glossaries once the transaction commits.
+
+    The glossaries can also be given by the concepts or translations in them.
+    If terms changed, the terms_version of the glossaries is increased too.
+    A glossary that changes many times in one transaction is updated once.
+    Outside of a transaction, it is updated immediately.
+    """
+    pending = _pending_glossary_versions.__dict__
+    prefix = 'terms_' if terms else ''
+    # Deleted objects have no pk.
+    pending.setdefault(prefix + 'glossary_ids', set()).update(pk for pk in glossary_ids if pk)
+    pending.setdefault(prefix + 'concept_ids', set()).update(pk for pk in concept_ids if pk)
+    pending.setdefault('translation_ids', set()).update(pk for pk in translation_ids if pk)
+    transaction.on_commit(flush_glossary_versions)
+
+
+def flush_glossary_versions():
+    """Increase the version of the glossaries and concepts that changed.
+
+    The changed concepts, and the concepts whose pages show them, get the new
+    version of their glossary. So the versions of the concepts in a glossary
+    only increase, and a new or changed concept has the highest one.
+    """
+    pending = _pending_glossary_versions.__dict__
+    glossary_ids = pending.pop('glossary_ids', set())
+    concept_ids = pending.pop('concept_ids', set())
+    translation_ids = pending.pop('translation_ids', set())
+    reload_ids = pending.pop('terms_glossary_ids', set())
+    terms_concept_ids = pending.pop('terms_concept_ids', set())
+    batch_size = query_params_limit()
+    for batch in chunks(sorted(translation_ids), batch_size):
+        concept_ids.update(Translation.objects.filter(
+                pk__in=batch,
+        ).values_list('concept', flat=True).order_by())
+    concept_ids |= terms_concept_ids
+    terms_ids = set(reload_ids)
+    for batch in chunks(sorted(concept_ids), batch_size):
+        for pk, glossary_id in Concept.objects.filter(
+                pk__in=batch,
+        ).values_list('pk', 'glossary').order_by():
+            glossary_ids.add(glossary_id)
+            if pk in terms_concept_ids:
+                terms_ids.add(glossary_id)
+    # They are always in the same glossary.
+    neighbour_ids = set()
+    for batch in chunks(sorted(concept_ids), max(batch_size // 3, 1)):
+        neighbour_ids.update(neighbour_concepts(batch).values_list('pk', flat=True).distinct())
+    for batch in chunks(sorted(glossary_ids | terms_ids), batch_size):
+        Glossary.objects.filter(pk__in=batch).update(version=F('version') + 1)
+    for batch in chunks(sorted(terms_ids), batch_size):
+        Glossary.objects.filter(pk__in=batch).update(terms_version=F('terms_version') + 1)
+    glossary_version = Glossary.objects.filter(pk=OuterRef('glossary')).values('version')[:1]
+    for batch in chunks(sorted(concept_ids | neighbour_ids), batch_size):
+        Concept.objects.filter(pk__in=batch).update(version=Subquery(glossary_version))
+    if terms_ids:
+        glossary_terms_changed.send(sender=Glossary, glossary_ids=terms_ids, reload_ids=reload_ids)
+
+
+def update_glossary_version(sender, **kwargs):
+    instance = kwargs.get('instance')
+    if sender is Glossary:
+        if kwargs.get('created'):
+            return
+        defer_glossary_version_update(glossary_ids=[instance.pk])
+    elif sender is Concept:
+        # A concept moved to another glossary also changes the old one.
+        old_glossary_id = getattr(instance, '_old_glossary_id', None)
+        glossary_ids = [instance.glossary_id, old_glossary_id]
+        # The terms of a deleted concept can't be found through it anymore.
+        moved = old_glossary_id and old_glossary_id != instance.glossary_id
+        defer_glossary_version_update(
+                glossary_ids=glossary_ids,
+                # The old broader concept listed it as narrower.
+                concept_ids=[instance.pk, instance.broader_concept_id,
+                             getattr(instance, '_old_broader_concept_id', None)],
+                terms=bool(moved or kwargs.get('signal') is post_delete),
+        )
+    elif sender in (ContextSentence, CorpusExample):
+        defer_glossary_version_update(translation_ids=[instance.translation_id])
+    elif sender is Translation:
+        defer_glossary_version_update(concept_ids=[instance.concept_id], terms=True)
+    else:
+        defer_glossary_version_update(concept_ids=[instance.concept_id])
+post_save.connect(update_glossary_version, sender='terminator.Glossary')
+for model in ('Concept', 'ConceptInLanguage', 'Translation', 'Definition',
+              'ExternalResource', 'ContextSentence', 'CorpusExample'):
+    post_save.connect(update_glossary_version, sender='terminator.' + model)
+    post_delete.connect(update_glossary_version, sender='terminator.' + model)
+
+
+def update_related_glossary_version(sender, instance, action, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        defer_glossary_version_update(
+                glossary_ids=[instance.glossary_id],
+                concept_ids=pk_set or (),
+        )
+m2m_changed.connect(update_related_glossary_version, sender=Concept.related_concepts.through)
+
+
+def update_deleted_concept_neighbours(sender, instance, **kwargs):
+    # Its relations are deleted with it, before post_delete.
+    defer_glossary_version_update(
+            concept_ids=neighbour_concepts(instance.pk).values_list('pk', flat=True),
+    )
+pre_delete.connect(update_deleted_concept_neighbours, sender='terminator.Concept')
+
+
+def neighbour_concepts(concept_id):
+    """The related, broader and narrower concepts of a concept.
+
+    These are also the concepts whose pages show the terms of the concept.
+    concept_id can also be a list of ids.
+    """
+    lookup = '__in' if isinstance(concept_id, (list, tuple)) else ''
+    return Concept.objects.filter(
+            Q(**{'related_concepts' + lookup: concept_id}) |
+            Q(**{'broader_concept' + lookup: concept_id}) |
+            Q(**{'narrower_concepts' + lookup: concept_id})
+    ).order_by()
+
+
+def terms_and_definitions(terms, definitions, group_by):
+    """The terms and definitions to show, grouped by concept or by language.
+
+    terms and definitions are querysets of Translation and Definition, and
+    group_by is 'concept' or 'language'. Each group is a dictionary with the
+    terms in cmp_key() order and the definition. This takes two queries.
+    """
+    terms = terms.select_related('administrative_status', 'language').order_by()
+    groups = {}
+    # The same order as the repr_cache, which the database can't reproduce
+    # for terms that are not ASCII.
+    for term in sorted(terms, key=lambda t: t.cmp_key()):
+        groups.setdefault(getattr(term, group_by + '_id'), {}).setdefault("terms", []).append(term)
+    for definition in definitions:
+        groups.setdefault(getattr(definition, group_by + '_id'), {})["definition"] = definition
+    return groups
+
+
+def glossary_roles_cache_key(user_id):
+    """The cache key of the roles of a user, see GlossaryPermissions."""
+    return 'terminator:glossary_roles:%d' % user_id
+
+
+def invalidate_glossary_roles(user_ids=(), group_ids=()):
+    """Drop the cached roles of users, and of the members of groups.
+
+    They are dropped now and once the transaction commits, since the old
+    roles could be cached again meanwhile.
+    """
+    user_ids = set(pk for pk in user_ids if pk)
+    for batch in chunks(sorted(set(group_ids)), query_params_limit()):
+        user_ids.update(User.objects.filter(groups__in=batch).values_list('pk', flat=True))
+    keys = [glossary_roles_cache_key(pk) for pk in user_ids]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def delete_object_permissions(permissions):
+    """Delete a queryset of guardian permissions of users or of groups.
+
+    This is a single DELETE, instead of loading every permission to send its
+    signals, and the cached roles of their users are dropped.
+    """
+    if hasattr(permissions.model, 'group'):
+        invalidate_glossary_roles(group_ids=permissions.values_list('group', flat=True).distinct())
+    else:
+        invalidate_glossary_roles(user_ids=permissions.values_list('user', flat=True).distinct())
+    permissions._raw_delete(permissions.db)
+
+
+def delete_glossary_permissions(glossary_ids):
+    """Delete the guardian permissions of users and groups on some glossaries.
+
+    Each delete is a single DELETE using the index on the permissions of an
+    object, unlike guardian's clean_orphan_obj_perms() which checks every
+    permission.
+    """
+    from guardian.models import GroupObjectPermission, UserObjectPermission
+    object_pks = [str(pk) for pk in glossary_ids]
+    ctype = ContentType.objects.get_for_model(Glossary)
+    for Model in (UserObjectPermission, GroupObjectPermission):
+        for batch in chunks(object_pks, max(query_params_limit() - 1, 1)):
+            delete_object_permissions(Model.objects.filter(content_type=ctype, object_pk__in=batch))
+
+
+def update_glossary_roles(sender, instance, **kwargs):
+    # Any permission, since an update might have changed its content type.
+    if hasattr(instance, 'group_id'):
+        invalidate_glossary_roles(group_ids=[instance.group_id])
+    else:
+        invalidate_glossary_roles(user_ids=[instance.user_id])
+
+
+def glossary_roles_changing(sender, instance, **kwargs):
+    # An update might take the permission from its old user or group.
+    old = sender.objects.filter(pk=instance.pk).first() if instance.pk else None
+    if old is not None:
+        update_glossary_roles(sender, old)
+
+
+for model in ('UserObjectPermission', 'GroupObjectPermission'):
+    pre_save.connect(glossary_roles_changing, sender='guardian.' + model)
+    post_save.connect(update_glossary_roles, sender='guardian.' + model)
+    post_delete.connect(update_glossary_roles, sender='guardian.' + model)
+
+
+def update_global_glossary_roles(sender, instance, action, model, pk_set, **kwargs):
+    """Drop the cached roles after changes to groups and global permissions."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    user_ids = set()
+    group_ids = set()
+    if isinstance(instance, Permission):
+        if action == 'pre_clear':
+            user_ids.update(instance.user_set.values_list('pk', flat=True))
+            group_ids.update(instance.group_set.values_list('pk', flat=True))
+        elif model is Group:
+            group_ids.update(pk_set)
+        else:
+            user_ids.update(pk_set)
+    elif isinstance(instance, Group):
+        group_ids.add(instance.pk)
+        # Members that were removed aren't found through the group.
+        if model is User and pk_set:
+            user_ids.update(pk_set)
+    else:
+        user_ids.add(instance.pk)
+    invalidate_glossary_roles(user_ids, group_ids)
+for through in (User.groups.through, User.user_permissions.through, Group.permissions.through):
+    m2m_changed.connect(update_global_glossary_roles, sender=through)
+
+
+def glossary_deleted(sender, instance, **kwargs):
+    delete_glossary_permissions([instance.pk])
+post_delete.connect(glossary_deleted, sender='terminator.Glossary')
+
+
+def concept_list_chunk_size():
+    return getattr(settings, 'GLOSSARY_CONCEPTS_CHUNK_SIZE', 1000)
+
+
+def concept_list_chunks(glossary):
+    """The chunks of the list of concepts of a glossary, with their versions.
+
+    Concepts are listed in id order, and a chunk holds the concepts of the
+    glossary in a range of ids. The version of a chunk is the highest version
+    of its concepts with their count, which changes whenever a concept in it
+    is added, changed or deleted, so only those chunks are rendered again.
+    The chunks are cached for the current version of the glossary.
+    """
+    size = concept_list_chunk_size()
+    key = 'terminator:concept_list_chunks:%d:%d' % (glossary.pk, size)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == glossary.version:
+        versions = cached[1]
+    else:
+        versions = list(Concept.objects.filter(glossary=glossary).annotate(
+                number=ExpressionWrapper(F('id') / size, output_field=models.IntegerField()),
+        ).values('number').annotate(
+                highest=Max('version'),
+                count=Count('id'),
+        ).values_list('number', 'highest', 'count').order_by('number'))
+        cache.set(key, (glossary.version, versions),
+                  getattr(settings, 'CONCEPT_CACHE_TIMEOUT', 86400))
+    return [{
+        'number': number,
+        'version': '%d-%d-%d' % (size, highest, count),
+        'concepts': Concept.objects.filter(
+                glossary=glossary,
+                pk__gte=number * size,
+                pk__lt=(number + 1) * size,
+        ).only('id', 'repr_cache'),
+    } for number, highest, count in versions]
+
+
+def concept_glossary_changing(sender, instance, **kwargs):
+    if instance.pk:
+        instance._old_glossary_id, instance._old_broader_concept_id = Concept.objects.filter(
+                pk=instance.pk,
+        ).values_list('glossary', 'broader_concept').first() or (None, None)
+pre_save.connect(concept_glossary_changing, sender='terminator.Concept')
+
+
 class ConceptLangUrlMixin(object):
     def get_absolute_url(self):
         if self.concept.glossary.source_language_id == self.language_id:
@@ -367,6 +758,19 @@ class ConceptInLanguage(models.Model, ConceptLangUrlMixin):
     class Meta:
         unique_together = ("concept", "language")
 
+    @classmethod
+    def get_or_placeholder(cls, concept, language):
+        """The ConceptInLanguage, or an unsaved one if there is none yet.
+
+        Rows are only created when something is stored about them, like a
+        comment or a summary message, so that viewing a concept doesn't write
+        to the database.
+        """
+        try:
+            return cls.objects.get(concept=concept, language=language)
+        except cls.DoesNotExist:
+            return cls(concept=concept, language=language)
+
     def definition(self):
         try:
             return Definition.objects.get(concept=self.concept_id, language=self.language_id)
@@ -378,69 +782,24 @@ class ConceptInLanguage(models.Model, ConceptLangUrlMixin):
 
     def other_language_data(self):
         """Information on the (other) target languages"""
-        terms = Translation.objects.filter(concept=self.concept_id).exclude(
-                language=self.language_id,
-        ).select_related('administrative_status', 'language')
-
-        def cmp(t):
-            return t.language_id, t.cmp_key()
-        terms = sorted(terms, key=cmp)
-
-        languages = {}
-        for lang, terms in itertools.groupby(terms, lambda t: t.language_id):
-            languages[lang] = {"terms": list(terms)}
-
-        definitions = Definition.objects.filter(concept=self.concept_id).exclude(
-                language=self.language_id,
+        return terms_and_definitions(
+                Translation.objects.filter(concept=self.concept_id).exclude(language=self.language_id),
+                Definition.objects.filter(concept=self.concept_id).exclude(language=self.language_id),
+                'language',
         )
-        for definition in definitions:
-            lang = definition.language_id
-            if lang not in languages:
-                languages[lang] = {}
-            languages[lang]["definition"] = definition
-
-        return languages
 
     def related_concepts_data(self):
         """Information on related concepts in the same language."""
-        concept_qs = Concept.objects.filter(
-                id__in=self.concept.related_concepts.all(),
-        ).order_by().union(Concept.objects.filter(
-                id__in=self.concept.narrower_concepts.all(),
-        ).order_by())
-        if self.concept.broader_concept_id:
-            concept_qs = concept_qs.union(Concept.objects.filter(
-                id=self.concept.broader_concept_id,
-        ).order_by())
-
-        terms = Translation.objects.filter(
-            concept__in=concept_qs,
-            language=self.language_id,
-        ).select_related('administrative_status', 'language').order_by()
-
-        def cmp(t):
-            return t.concept_id, t.cmp_key()
-        terms = sorted(terms, key=cmp)
-
-        concepts = {}
-        for concept, terms in itertools.groupby(terms, lambda t: t.concept_id):
-            concepts[concept] = {"terms": list(terms)}
-
-        definitions = Definition.objects.filter(
-            # We join simply with the concepts collected above which results in
-            # a simpler query. This means that we won't collect definitions
-            # without terms.
-            #concept__in=concepts,
-            concept__in=concept_qs,
-            language=self.language_id,
+        concepts = neighbour_concepts(self.concept_id).values('pk')
+        return terms_and_definitions(
+                Translation.objects.filter(concept__in=concepts, language=self.language_id),
+                # Shown for concepts without terms
+                Definition.objects.filter(
+                    concept__in=concepts,
+                    language=self.language_id,
+                ).select_related('concept'),
+                'concept',
         )
-        for definition in definitions:
-            concept = definition.concept_id
-            if concept not in concepts:
-                concepts[concept] = {}
-            concepts[concept]["definition"] = definition
-
-        return concepts
 
     def __str__(self):
         return _("#%(concept)s — language code: %(iso_code)s") % {'iso_code': self.language_id, 'concept': self.concept_id}
@@ -486,11 +845,43 @@ class ConceptInLanguage(models.Model, ConceptLangUrlMixin):
     date_html.short_description = _("Date")
 
 
+def search_key(text):
+    """Normalise a term for searching.
+
+    The result is lower case, without accents and with the whitespace
+    collapsed, so that "Café  au lait" and "cafe au lait" are equal.
+    """
+    text = unicodedata.normalize('NFKD', force_text(text).lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(text.split())[:200]
+
+
+# The order of terms by administrative status. Others are ranked like terms
+# without a status.
+ADMINISTRATIVE_STATUS_RANKS = {
+        "preferredTerm-admn-sts": 0,
+        "admittedTerm-admn-sts": 2,
+        "supersededTerm-admn-sts": 3,
+        "deprecatedTerm-admn-sts": 4,
+}
+
+
+def term_cmp_key(administrative_status_id, translation_text):
+    """Translation.cmp_key() for terms that are not loaded as objects."""
+    # We return a tuple with the "quality" key, and the text to allow
+    # alphabetic sorting for all adminitted terms, for example.
+    return (ADMINISTRATIVE_STATUS_RANKS.get(administrative_status_id, 1), translation_text.lower())
+    #TODO: for proper i18n, use locale aware sorting/lowercasing for the
+    #language involved
+
+
 @python_2_unicode_compatible
 class Translation(models.Model, ConceptLangUrlMixin):
     concept = models.ForeignKey(Concept, on_delete=models.CASCADE, verbose_name=_("concept"))
     language = models.ForeignKey(Language, on_delete=models.PROTECT, verbose_name=_("language"))
     translation_text = models.CharField(max_length=100, verbose_name=_("translation text"))
+    # translation_text normalised with search_key(), for indexed searches
+    search_key = models.CharField(max_length=200, db_index=True, editable=False, verbose_name=_("search key"))
     is_finalized = models.BooleanField(default=False, verbose_name=_("Is finalized"))
     administrative_status = models.ForeignKey(AdministrativeStatus, null=True, blank=True, on_delete=models.SET_NULL, verbose_name=_("administrative status"))
     administrative_status_reason = models.ForeignKey(AdministrativeStatusReason, null=True, blank=True, on_delete=models.SET_NULL, verbose_name=_("administrative status reason"))
@@ -514,25 +905,17 @@ class Translation(models.Model, ConceptLangUrlMixin):
 
     def save(self, *args, **kwargs):
         update_repr_cache = kwargs.pop("update_repr_cache", True)
+        self.search_key = search_key(self.translation_text)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "translation_text" in update_fields:
+            kwargs["update_fields"] = list(update_fields) + ["search_key"]
         super(Translation, self).save(*args, **kwargs)
         if update_repr_cache:
-            self.concept.update_repr_cache()
+            defer_repr_cache_update(self.concept_id)
 
     def cmp_key(self):
         # used to sort terms according to their perceived worth
-        keys = {
-                "preferredTerm-admn-sts": 0,
-                "": 1,
-                None: 1,
-                "admittedTerm-admn-sts": 2,
-                "supersededTerm-admn-sts": 3,
-                "deprecatedTerm-admn-sts": 4,
-        }
-        # We return a tuple with the "quality" key, and the text to allow
-        # alphabetic sorting for all adminitted terms, for example.
-        return (keys.get(self.administrative_status_id, 1), self.translation_text.lower())
-        #TODO: for proper i18n, use locale aware sorting/lowercasing for the
-        #language involved
+        return term_cmp_key(self.administrative_status_id, self.translation_text)
 
 
 @python_2_unicode_compatible
@@ -570,6 +953,13 @@ class Definition(models.Model, ConceptLangUrlMixin):
         return _("Definition (%(iso_code)s) for %(concept)s: %(text)s") % trans_data
 
 
+def search_tables_migrated(sender, app_config, using, **kwargs):
+    # The search indexes of terms and definitions on SQLite
+    if app_config.label == 'terminator':
+        create_fts_triggers(using)
+post_migrate.connect(search_tables_migrated)
+
+
 @python_2_unicode_compatible
 class ExternalResource(models.Model):
     concept = models.ForeignKey(Concept, on_delete=models.CASCADE, verbose_name=_("concept"))
@@ -674,43 +1064,149 @@ class CollaborationRequest(models.Model):
         return _("%(user)s requested %(role)s for %(glossary)s") % trans_data
 
 
-@Field.register_lookup
-class IntegerValue(Transform):
-    lookup_name = 'integer'  # e.g. field__integer__in
 
-    def as_sql(self, compiler, connection):
-        sql, params = compiler.compile(self.lhs)
-        sql = 'CAST(%s AS INT)' % sql
-        return sql, params
+@python_2_unicode_compatible
+class ImportJob(models.Model):
+    """A TBX file waiting to be imported, or being imported, in the background.
+
+    The counters are updated while the import runs, so that the user can
+    follow the progress of big imports.
+    """
+    QUEUED = 'Q'
+    RUNNING = 'R'
+    SUCCEEDED = 'S'
+    FAILED = 'F'
+    STATUS_CHOICES = (
+        (QUEUED, _('Queued')),
+        (RUNNING, _('Running')),
+        (SUCCEEDED, _('Succeeded')),
+        (FAILED, _('Failed')),
+    )
+    # The glossary is deleted if the import fails.
+    glossary = models.ForeignKey(Glossary, null=True, on_delete=models.SET_NULL, verbose_name=_("glossary"))
+    glossary_name = models.CharField(max_length=50, verbose_name=_("glossary name"))
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name=_("user"))
+    tbx_file = models.FileField(upload_to="tbx_imports", blank=True, verbose_name=_("TBX file"))
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=QUEUED, verbose_name=_("status"))
+    message = models.TextField(blank=True, verbose_name=_("message"))
+    concepts_parsed = models.PositiveIntegerField(default=0, verbose_name=_("parsed concepts"))
+    terms_inserted = models.PositiveIntegerField(default=0, verbose_name=_("inserted terms"))
+    relations_resolved = models.PositiveIntegerField(default=0, verbose_name=_("resolved relations"))
+    created = models.DateTimeField(auto_now_add=True, verbose_name=_("created"))
+    # Set when the job starts running and on every progress report, so that
+    # jobs of workers that died can be told apart from slow imports.
+    updated = models.DateTimeField(null=True, blank=True, verbose_name=_("updated"))
+    finished = models.DateTimeField(null=True, blank=True, verbose_name=_("finished"))
+
+    class Meta:
+        verbose_name = _("import job")
+        verbose_name_plural = _("import jobs")
+
+    def __str__(self):
+        trans_data = {
+            'glossary': self.glossary_name,
+            'status': self.get_status_display(),
+        }
+        return _("Import of %(glossary)s (%(status)s)") % trans_data
 
+    def get_absolute_url(self):
+        return reverse('terminator_import_job', kwargs={'pk': self.pk})
+
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
+
+
+class GlossaryActivity(models.Model):
+    """A LogEntry with the glossary, concept and language it is about.
+
+    LogEntry only stores the id of the changed object as text, which can't be
+    joined efficiently. A row is added here for every LogEntry about our
+    models, so that recent changes can be listed with the indexes below.
+    """
+    log_entry = models.OneToOneField(LogEntry, on_delete=models.CASCADE, related_name='activity', verbose_name=_("log entry"))
+    glossary = models.ForeignKey(Glossary, null=True, on_delete=models.SET_NULL, verbose_name=_("glossary"))
+    concept = models.ForeignKey(Concept, null=True, on_delete=models.SET_NULL, verbose_name=_("concept"))
+    language = models.ForeignKey(Language, null=True, on_delete=models.SET_NULL, verbose_name=_("language"))
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, verbose_name=_("content type"))
+    action_flag = models.PositiveSmallIntegerField(verbose_name=_("action flag"))
+    action_time = models.DateTimeField(db_index=True, verbose_name=_("action time"))
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name=_("user"))
 
-def process_recent_changes(changes):
+    class Meta:
+        verbose_name = _("glossary activity")
+        verbose_name_plural = _("glossary activity")
+        indexes = [
+            models.Index(fields=['glossary', 'action_time'], name='terminator_activity_glossary'),
+            models.Index(fields=['content_type', 'action_time'], name='terminator_activity_ctype'),
+            models.Index(fields=['user', 'action_time'], name='terminator_activity_user'),
+        ]
+
+
+def activity_targets(Model):
+    """How to find the glossary, concept and language of objects of Model.
+
+    Returns a dictionary of lookups from Model for the keys "glossary",
+    "concept" and "language", as far as they apply.
+    """
+    names = set(field.name for field in Model._meta.fields)
+    if Model._meta.model_name == 'glossary':
+        return {'glossary': 'pk'}
+    if Model._meta.model_name == 'concept':
+        return {'glossary': 'glossary', 'concept': 'pk'}
+    targets = {}
+    if 'concept' in names:
+        targets['glossary'] = 'concept__glossary'
+        targets['concept'] = 'concept'
+    elif 'translation' in names:
+        targets['glossary'] = 'translation__concept__glossary'
+        targets['concept'] = 'translation__concept'
+        targets['language'] = 'translation__language'
+    elif 'for_glossary' in names:
+        targets['glossary'] = 'for_glossary'
+    if 'language' in names:
+        targets['language'] = 'language'
+    return targets
+
+
+def record_activity(sender, instance, created, raw, **kwargs):
+    if not created or raw:
+        return
+    Model = ContentType.objects.get_for_id(instance.content_type_id).model_class()
+    if Model is None or Model._meta.app_label != 'terminator':
+        return
+    activity = GlossaryActivity(
+            log_entry=instance,
+            content_type_id=instance.content_type_id,
+            action_flag=instance.action_flag,
+            action_time=instance.action_time,
+            user_id=instance.user_id,
+    )
+    targets = activity_targets(Model)
+    if targets:
+        values = Model._base_manager.filter(pk=instance.object_id).values(**dict(
+                ('activity_' + key, F(lookup)) for key, lookup in targets.items()
+        )).first()
+        if values:
+            activity.glossary_id = values.get('activity_glossary')
+            activity.concept_id = values.get('activity_concept')
+            activity.language_id = values.get('activity_language')
+        elif 'concept' in targets and Model is not Concept:
+            # The object was deleted already, but its description names the
+            # concept.
+            match = re.search(r'#([\d]+)', instance.object_repr)
+            if match:
+                concept = Concept.objects.filter(pk=int(match.group(1))).values('pk', 'glossary').first()
+                if concept:
+                    activity.concept_id = concept['pk']
+                    activity.glossary_id = concept['glossary']
+    activity.save()
+post_save.connect(record_activity, sender=LogEntry)
+
+
+def process_recent_changes(activities):
     """Helper to provide template variables for changes to certain models."""
-    log = []
-    changed_groups = sorted(changes, key=lambda o: o.content_type_id, reverse=True)
-    changed_groups = itertools.groupby(changed_groups, key=lambda o: o.content_type_id)
-    all_objects = {}
-
-    for content_type_id, model_changes in changed_groups:
-        Model = ContentType.objects.get_for_id(content_type_id).model_class()
-        all_objects[content_type_id] = Model.objects.in_bulk(c.object_id for c in model_changes)
-
-    # Some objects might have been deleted, so we have to check each one.
-    for logentry in changes:
-        models = all_objects[logentry.content_type_id]
-        obj = models.get(int(logentry.object_id))
-        if obj is None:
-            # object since deleted. Let's try to get the concept.
-            change = {"data": logentry}
-            match = re.search(r'#([\d]+)', logentry.object_repr)
-            concept_id = int(match.group(1))
-            if match and Concept.objects.filter(pk=concept_id).exists():
-                change["concept_id"] = concept_id
-            log.append(change)
-        else:
-            # object is there - let's assume it is still the same one.
-            log.append({
-                "data": logentry,
-                "concept_id": obj.concept_id,
-            })
-    return log
+    # The concept is unset in GlossaryActivity when the concept is deleted.
+    return [{
+        "data": activity.log_entry,
+        "concept_id": activity.concept_id,
+    } for activity in activities.select_related("log_entry")]
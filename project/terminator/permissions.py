@@ -0,0 +1,141 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+"""The roles of users in glossaries, loaded once and cached.
+
+The roles are the per object permissions of guardian on glossaries, given to
+the user or to its groups. Views, templates and the admin all ask
+glossary_permissions(request) instead of guardian, which would query the
+database for every check. The roles of a user are kept in the cache until
+the permissions of the user or of its groups change, see
+invalidate_glossary_roles(). The cache must be shared by all the processes
+serving the site, otherwise the others keep using the old roles.
+"""
+
+import functools
+import itertools
+
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.functional import cached_property
+from guardian.models import GroupObjectPermission, UserObjectPermission
+
+from terminator.models import Glossary, glossary_roles_cache_key
+
+
+GLOSSARY_ROLES = ("owner", "terminologist", "specialist")
+
+
+class GlossaryPermissions(object):
+    """The roles of a user in all glossaries, loaded with a few queries.
+
+    Like guardian, superusers have all roles and inactive users have none, and
+    the roles given to the groups of the user count too. Like
+    get_objects_for_user(), glossaries() also accepts the global permissions
+    of the user and its groups, but get_perms() doesn't, like get_perms().
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.is_superuser = user.is_active and user.is_superuser
+
+    @cached_property
+    def roles(self):
+        """A dictionary from glossary ids to the set of roles of the user.
+
+        The global roles of the user are under the key None.
+
+        It is kept in the cache until the permissions change.
+        """
+        roles = {}
+        if not self.user.is_authenticated or not self.user.is_active:
+            return roles
+        key = glossary_roles_cache_key(self.user.pk)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        ctype = ContentType.objects.get_for_model(Glossary)
+        user_lines = UserObjectPermission.objects.filter(
+                user=self.user,
+                content_type=ctype,
+                permission__codename__in=GLOSSARY_ROLES,
+        ).values_list('object_pk', 'permission__codename')
+        group_lines = GroupObjectPermission.objects.filter(
+                group__user=self.user,
+                content_type=ctype,
+                permission__codename__in=GLOSSARY_ROLES,
+        ).values_list('object_pk', 'permission__codename')
+        for object_pk, codename in itertools.chain(user_lines, group_lines):
+            roles.setdefault(int(object_pk), set()).add(codename)
+        roles[None] = set(Permission.objects.filter(
+                Q(user=self.user) | Q(group__user=self.user),
+                content_type=ctype,
+                codename__in=GLOSSARY_ROLES,
+        ).values_list('codename', flat=True))
+        cache.set(key, roles, getattr(settings, 'GLOSSARY_ROLES_CACHE_TIMEOUT', 86400))
+        return roles
+
+    def get_perms(self, glossary):
+        """The roles of the user in a glossary, or in a glossary id."""
+        if self.is_superuser:
+            return list(GLOSSARY_ROLES)
+        pk = getattr(glossary, 'pk', glossary)
+        roles = self.roles.get(pk, ()) if pk is not None else ()
+        return [role for role in GLOSSARY_ROLES if role in roles]
+
+    def has_perm(self, role, glossary):
+        return role in self.get_perms(glossary)
+
+    def glossaries(self, role):
+        """The glossaries where the user has a role, as a queryset."""
+        if self.is_superuser or role in self.roles.get(None, ()):
+            return Glossary.objects.all()
+        return Glossary.objects.filter(pk__in=[
+                pk for pk, roles in self.roles.items() if role in roles
+        ])
+
+
+def glossary_permissions(request, user=None):
+    """The GlossaryPermissions of a user, kept until the end of the request.
+
+    The user of the request is used if no user is given.
+    """
+    if user is None:
+        user = request.user
+    resolvers = request.__dict__.setdefault('_glossary_permissions', {})
+    if user.pk not in resolvers:
+        resolvers[user.pk] = GlossaryPermissions(user)
+    return resolvers[user.pk]
+
+
+def request_cached(method):
+    """Remember what a method returns for a request until the request ends.
+
+    This is for the methods of admin classes, which are called many times
+    while handling a request. The first argument after self must be the
+    request, and the others must be hashable.
+    """
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        results = request.__dict__.setdefault('_request_cached', {})
+        key = (id(self), method.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in results:
+            results[key] = method(self, request, *args, **kwargs)
+        return results[key]
+    return wrapper
@@ -0,0 +1,269 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+"""Ranked partial matching of terms.
+
+The backend for a database is chosen by get_search_backend(). All backends
+match terms against Translation.search_key, so the search string must be
+passed through terminator.models.search_key() first. Definitions are matched
+against their text.
+"""
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import BooleanField, ExpressionWrapper, F, FloatField, Func, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest, Length
+from django.utils.module_loading import import_string
+
+
+FTS_TABLE = 'terminator_translation_fts'
+DEFINITION_FTS_TABLE = 'terminator_definition_fts'
+
+# The FTS5 tables of the SQLite backend, with the table and the column that
+# they index. Each one is kept up to date by three triggers.
+FTS_TABLES = {
+    FTS_TABLE: ('terminator_translation', 'search_key'),
+    DEFINITION_FTS_TABLE: ('terminator_definition', 'text'),
+}
+
+
+class SearchBackend(object):
+    """Substring matching that works on every database.
+
+    Shorter terms that contain the search string are considered better
+    matches. Without an index for substrings, every term has to be read.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    def partial_matches(self, queryset, key):
+        """Narrow queryset to the translations that contain or resemble key.
+
+        The translations are annotated with a "rank" between 0 and 1, and
+        ordered with the best matches first.
+        """
+        queryset = queryset.filter(search_key__contains=key)
+        rank = ExpressionWrapper(
+                Value(float(len(key))) / Greatest(Length('search_key'), 1),
+                output_field=FloatField(),
+        )
+        return queryset.annotate(rank=rank).order_by('-rank', 'id')
+
+    def definition_matches(self, queryset, text):
+        """Narrow queryset to the definitions that contain text.
+
+        Case is ignored, at least for ASCII letters.
+        """
+        return queryset.filter(text__icontains=text)
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    """Trigram matching with the pg_trgm extension.
+
+    Terms that contain the search string or are similar enough to it (see
+    pg_trgm.similarity_threshold) are found through a GIN index, and ranked
+    by their trigram similarity. The definitions containing a text are found
+    through another trigram index.
+    """
+
+    def partial_matches(self, queryset, key):
+        from django.contrib.postgres.lookups import TrigramSimilar
+        from django.contrib.postgres.search import TrigramSimilarity
+        search_key_field = queryset.model._meta.get_field('search_key')
+        if 'trigram_similar' not in search_key_field.get_lookups():
+            search_key_field.__class__.register_lookup(TrigramSimilar)
+        queryset = queryset.filter(
+                Q(search_key__contains=key) | Q(search_key__trigram_similar=key)
+        )
+        rank = TrigramSimilarity('search_key', key)
+        return queryset.annotate(rank=rank).order_by('-rank', 'id')
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """Trigram matching with an FTS5 table.
+
+    The tables are created by the migrations if SQLite supports the FTS5
+    trigram tokenizer (version 3.34 or newer), and kept up to date by
+    triggers. They find the terms sharing trigrams with the search string.
+    Like pg_trgm, these are ranked by their trigram similarity with the
+    search string, and only those that contain the search string or are
+    similar enough to it are kept. The definitions containing a text of
+    three characters or more are also found through them. Otherwise this
+    falls back to plain substring matching.
+    """
+
+    # Like the default of pg_trgm.similarity_threshold
+    similarity_threshold = 0.3
+    # The trigrams are parameters of the query, repeated wherever the rank is
+    # used. Longer search strings are only matched as substrings, to stay
+    # within the limit of parameters of SQLite.
+    max_trigrams = 100
+
+    def __init__(self, using='default'):
+        super(SQLiteSearchBackend, self).__init__(using)
+        self._tables = None
+
+    def has_fts_table(self, table=FTS_TABLE):
+        if self._tables is None:
+            with connections[self.using].cursor() as cursor:
+                self._tables = set(connections[self.using].introspection.table_names(cursor))
+        return table in self._tables
+
+    def similarity(self, table, key):
+        """The trigram similarity of the search_key of every row with key.
+
+        As in pg_trgm, it is the number of shared trigrams divided by the
+        number of trigrams in either string, and the strings are padded with
+        spaces so that their beginning and end count more. The trigrams of a
+        term are counted with repetitions.
+        """
+        padded = u"  %s " % key
+        trigrams = sorted(set(padded[i:i+3] for i in range(len(padded) - 2)))
+        shared = " + ".join(
+                ["(instr('  ' || %s.search_key || ' ', %%s) > 0)" % table] * len(trigrams)
+        )
+        # The number of shared trigrams is computed once, and used twice.
+        return RawSQL(
+                '(SELECT shared * 1.0 / (%d + length(%s.search_key) + 1 - shared) '
+                'FROM (SELECT %s AS shared))' % (len(trigrams), table, shared),
+                trigrams,
+                output_field=FloatField(),
+        )
+
+    def partial_matches(self, queryset, key):
+        trigrams = set(key[i:i+3] for i in range(len(key) - 2))
+        if not trigrams or len(trigrams) > self.max_trigrams or not self.has_fts_table():
+            return super(SQLiteSearchBackend, self).partial_matches(queryset, key)
+        query = " OR ".join(
+                '"%s"' % trigram.replace('"', '""') for trigram in sorted(trigrams)
+        )
+        table = queryset.model._meta.db_table
+        # The other filters of queryset apply to the same rows, so all the
+        # matches in the wanted glossaries and languages are found.
+        # RawSQL in an __in lookup gets wrapped in two pairs of parentheses,
+        # which SQLite reads as a single value instead of a subquery.
+        queryset = queryset.extra(
+                where=['%s.id IN (SELECT rowid FROM %s WHERE %s MATCH %%s)' % (
+                    table, FTS_TABLE, FTS_TABLE)],
+                params=[query],
+        )
+        queryset = queryset.annotate(rank=self.similarity(table, key)).filter(
+                Q(rank__gte=self.similarity_threshold) | Q(search_key__contains=key)
+        )
+        return queryset.order_by('-rank', 'id')
+
+    def definition_matches(self, queryset, text):
+        # Shorter texts have no trigram to look for.
+        if len(text) < 3 or not self.has_fts_table(DEFINITION_FTS_TABLE):
+            return super(SQLiteSearchBackend, self).definition_matches(queryset, text)
+        # A phrase of trigrams matches the texts that contain it.
+        match = FTSMatch(DEFINITION_FTS_TABLE, '"%s"' % text.replace('"', '""'))
+        return queryset.annotate(fts_match=match).filter(fts_match=True)
+
+
+class FTSMatch(Func):
+    """Whether the id of a row is among the matches of an FTS5 query.
+
+    Unlike extra(), this also works in subqueries, where the table of the
+    rows has another alias.
+    """
+
+    def __init__(self, fts_table, query):
+        super(FTSMatch, self).__init__(F('id'), output_field=BooleanField())
+        self.fts_table = fts_table
+        self.query = query
+
+    def as_sql(self, compiler, connection):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return '%s IN (SELECT rowid FROM %s WHERE %s MATCH %%s)' % (
+                sql, self.fts_table, self.fts_table), params + [self.query]
+
+
+def fts_triggers(fts_table):
+    """The statements that create the triggers of an FTS5 table if missing.
+
+    The table indexes a column of another table, which has the text. The
+    triggers keep the index up to date, also for bulk inserts and updates
+    that don't go through save().
+    """
+    table, column = FTS_TABLES[fts_table]
+    names = {'fts': fts_table, 'table': table, 'column': column}
+    return [
+        "CREATE TRIGGER IF NOT EXISTS %(fts)s_insert "
+        "AFTER INSERT ON %(table)s BEGIN "
+        "INSERT INTO %(fts)s(rowid, %(column)s) "
+        "VALUES (new.id, new.%(column)s); END" % names,
+        "CREATE TRIGGER IF NOT EXISTS %(fts)s_delete "
+        "AFTER DELETE ON %(table)s BEGIN "
+        "INSERT INTO %(fts)s(%(fts)s, rowid, %(column)s) "
+        "VALUES ('delete', old.id, old.%(column)s); END" % names,
+        "CREATE TRIGGER IF NOT EXISTS %(fts)s_update "
+        "AFTER UPDATE OF %(column)s ON %(table)s BEGIN "
+        "INSERT INTO %(fts)s(%(fts)s, rowid, %(column)s) "
+        "VALUES ('delete', old.id, old.%(column)s); "
+        "INSERT INTO %(fts)s(rowid, %(column)s) "
+        "VALUES (new.id, new.%(column)s); END" % names,
+    ]
+
+
+def create_fts_triggers(using='default', **kwargs):
+    """Create the missing triggers of the FTS5 tables, and rebuild their index.
+
+    Migrations that make SQLite rebuild a table (most changes of its columns
+    do) drop its triggers, so this runs after every migrate.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        tables = set(connection.introspection.table_names(cursor))
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        triggers = set(name for name, in cursor.fetchall())
+        for fts_table in sorted(FTS_TABLES):
+            names = [fts_table + suffix for suffix in ('_insert', '_delete', '_update')]
+            if fts_table not in tables or triggers.issuperset(names):
+                continue
+            for statement in fts_triggers(fts_table):
+                cursor.execute(statement)
+            # Changes made without the triggers are missing from the index.
+            cursor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (fts_table, fts_table))
+
+
+BACKENDS = {
+    'postgresql': PostgreSQLSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+_backends = {}
+
+
+def get_search_backend(using='default'):
+    """The search backend for a database.
+
+    settings.SEARCH_BACKEND can name a backend class to use instead of the
+    one for the database vendor.
+    """
+    if using not in _backends:
+        backend_class = getattr(settings, 'SEARCH_BACKEND', None)
+        if backend_class:
+            backend_class = import_string(backend_class)
+        else:
+            vendor = connections[using].vendor
+            backend_class = BACKENDS.get(vendor, SearchBackend)
+        _backends[using] = backend_class(using)
+    return _backends[using]
@@ -0,0 +1,47 @@
+// Suggests existing terms while typing, with a <datalist> filled from the
+// autocomplete API. Inputs need a data-autocomplete attribute with the URL of
+// the API, including the language parameter, or a
+// data-autocomplete-language attribute naming a field to read it from.
+
+function setupAutocomplete(input) {
+    var list = document.createElement("datalist");
+    var timer = null;
+    list.id = input.id + "_suggestions";
+    input.parentNode.appendChild(list);
+    input.setAttribute("list", list.id);
+    input.setAttribute("autocomplete", "off");
+
+    function suggest() {
+        var url = input.getAttribute("data-autocomplete");
+        var languageField = input.getAttribute("data-autocomplete-language");
+        if (languageField) {
+            languageField = document.getElementById(languageField);
+            if (!languageField || !languageField.value) {
+                return;
+            }
+            url += (url.indexOf("?") < 0 ? "?" : "&") + "language=" + encodeURIComponent(languageField.value);
+        }
+        url += (url.indexOf("?") < 0 ? "?" : "&") + "q=" + encodeURIComponent(input.value);
+        fetch(url).then(function (response) {
+            return response.ok ? response.json() : {terms: []};
+        }).then(function (data) {
+            list.innerHTML = "";
+            data.terms.forEach(function (term) {
+                var option = document.createElement("option");
+                option.value = term;
+                list.appendChild(option);
+            });
+        });
+    }
+
+    input.addEventListener("input", function () {
+        clearTimeout(timer);
+        if (input.value.trim().length) {
+            timer = setTimeout(suggest, 150);
+        }
+    });
+}
+
+document.addEventListener("DOMContentLoaded", function () {
+    document.querySelectorAll("input[data-autocomplete]").forEach(setupAutocomplete);
+});
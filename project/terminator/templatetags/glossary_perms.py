@@ -0,0 +1,33 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+from django import template
+
+from terminator.permissions import GlossaryPermissions, glossary_permissions
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def get_glossary_perms(context, glossary):
+    """The roles of the current user in a glossary.
+
+    Usage: {% get_glossary_perms glossary as glossary_perms %}
+    """
+    request = getattr(context, 'request', None)
+    if request is None:
+        return GlossaryPermissions(context['user']).get_perms(glossary)
+    return glossary_permissions(request).get_perms(glossary)
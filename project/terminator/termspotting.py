@@ -0,0 +1,196 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+"""Finding the terms of a glossary in a text.
+
+The terms of a glossary in a language are compiled into an Aho-Corasick
+automaton, which finds all of them in one pass over the text. Automata are
+kept in memory until the glossary changes, as told by Glossary.version.
+"""
+
+from collections import deque, OrderedDict
+import threading
+import unicodedata
+
+from django.conf import settings
+
+from terminator.models import Translation
+from terminator.utils import chunks, query_params_limit
+
+
+class Automaton(object):
+    """An Aho-Corasick automaton for a set of strings.
+
+    patterns is an iterable of (string, value). iter_matches() yields the
+    start, end and value of every occurrence of the strings in a text, in
+    time linear in the length of the text and the number of occurrences.
+    """
+
+    def __init__(self, patterns):
+        goto = [{}]
+        outputs = [[]]
+        for string, value in patterns:
+            node = 0
+            for char in string:
+                child = goto[node].get(char)
+                if child is None:
+                    child = len(goto)
+                    goto[node][char] = child
+                    goto.append({})
+                    outputs.append([])
+                node = child
+            outputs[node].append((len(string), value))
+
+        # fail: the node for the longest proper suffix that is in the trie.
+        # dict_link: the next node along the fail links that has outputs.
+        fail = [0] * len(goto)
+        dict_link = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                state = fail[child]
+                dict_link[child] = state if outputs[state] else dict_link[state]
+
+        self.goto = goto
+        self.outputs = outputs
+        self.fail = fail
+        self.dict_link = dict_link
+
+    def iter_matches(self, text):
+        goto, outputs, fail, dict_link = self.goto, self.outputs, self.fail, self.dict_link
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            state = node if outputs[node] else dict_link[node]
+            while state:
+                for length, value in outputs[state]:
+                    yield end - length, end, value
+                state = dict_link[state]
+
+
+def fold_text(text):
+    """The text as terminator.models.search_key() would fold it, and the
+    position in text of every character of the folded text."""
+    folded = []
+    positions = []
+    for i, char in enumerate(text):
+        if char.isspace():
+            if folded and folded[-1] != ' ':
+                folded.append(' ')
+                positions.append(i)
+            continue
+        for folded_char in unicodedata.normalize('NFKD', char.lower()):
+            if not unicodedata.combining(folded_char):
+                folded.append(folded_char)
+                positions.append(i)
+    return ''.join(folded), positions
+
+
+def build_automaton(glossary, language):
+    translations = Translation.objects.filter(
+            concept__glossary=glossary,
+            language=language,
+    ).exclude(search_key='').only(
+            'search_key', 'concept', 'translation_text', 'administrative_status',
+    ).order_by()
+    return Automaton(
+            (translation.search_key, (translation.cmp_key(), translation.pk,
+                                      translation.concept_id,
+                                      translation.translation_text))
+            for translation in translations.iterator()
+    )
+
+
+_automata = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_automaton(glossary, language):
+    """The automaton for the terms of a glossary in a language."""
+    key = (glossary.pk, language)
+    with _lock:
+        version, automaton = _automata.pop(key, (None, None))
+    if version != glossary.version:
+        version = glossary.version
+        automaton = build_automaton(glossary, language)
+    with _lock:
+        _automata[key] = (version, automaton)
+        while len(_automata) > getattr(settings, 'TERM_SPOTTING_CACHE_SIZE', 20):
+            _automata.popitem(last=False)
+    return automaton
+
+
+def spot_terms(text, glossary, language, target_language=None):
+    """Find the terms of a glossary in a language that occur in text.
+
+    Only whole words are matched, ignoring case and accents. Returns a list
+    of dictionaries with the start and end of each occurrence in text, the
+    matched term and its concept, ordered by position. Several terms at the
+    same position are ordered like on the concept pages, by
+    Translation.cmp_key(). With a target_language, the terms of the concept
+    in that language are included, also ordered by cmp_key().
+    """
+    folded, positions = fold_text(text)
+    automaton = get_automaton(glossary, language)
+    matches = []
+    for start, end, value in automaton.iter_matches(folded):
+        if start > 0 and folded[start - 1].isalnum():
+            continue
+        if end < len(folded) and folded[end].isalnum():
+            continue
+        matches.append((positions[start], positions[end - 1] + 1, value))
+    matches.sort(key=lambda match: (match[0], -match[1], match[2][0]))
+
+    targets = {}
+    if target_language:
+        concept_ids = sorted(set(match[2][2] for match in matches))
+        translations = []
+        for batch in chunks(concept_ids, query_params_limit() - 1):
+            translations.extend(Translation.objects.filter(
+                    concept__in=batch,
+                    language=target_language,
+            ).only(
+                    'concept', 'translation_text', 'administrative_status',
+            ).order_by())
+        for translation in sorted(translations, key=lambda t: t.cmp_key()):
+            targets.setdefault(translation.concept_id, []).append({
+                'id': translation.pk,
+                'text': translation.translation_text,
+                'administrative_status': translation.administrative_status_id,
+            })
+
+    results = []
+    for start, end, (cmp_key, pk, concept_id, term) in matches:
+        result = {
+            'start': start,
+            'end': end,
+            'text': text[start:end],
+            'term': term,
+            'translation': pk,
+            'concept': concept_id,
+        }
+        if target_language:
+            result['targets'] = targets.get(concept_id, [])
+        results.append(result)
+    return results
@@ -1,10 +1,14 @@
 # -*- coding: UTF-8 -*-
 from __future__ import print_function
 
+import json
 import os.path
+import shutil
+import tempfile
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.http import FileResponse
 from django.test import TestCase
 from django.test.client import Client
 from django.utils import six
@@ -113,6 +117,9 @@ class URLsB(TestCase):
     fixtures = ['test_data']
 
     def setUp(self):
+        from django.core.cache import cache
+        # Cached fragments of pages would outlive the data of other tests
+        cache.clear()
         self.c = Client()
         self.user = User.objects.create_user(username="test", email="test@test.com", password="test")
         self.user.save()
@@ -182,6 +189,231 @@ class URLsB(TestCase):
             "filter_by_language": "en",
             })
         self.assertNotContains(response, "No results found.")
+        # Case and accents don't matter
+        response = self.c.get('/search/', {"search_string": "VENTA"})
+        self.assertContains(response, u"vent\u00e1")
+
+    def test_ranked_search(self):
+        from terminator.search import get_search_backend, SearchBackend
+        Translation.objects.create(concept_id=1, language_id="gl",
+                                   translation_text="pestanas laterais")
+        for backend in (get_search_backend(), SearchBackend()):
+            qs = backend.partial_matches(Translation.objects.all(), "pestana")
+            texts = [t.translation_text for t in qs]
+            # Shorter terms first, some backends also find similar terms
+            self.assertEqual(set(texts[:2]), set([u"pesta\u00f1a", "pestana"]))
+            self.assertEqual(texts[2], "pestanas laterais")
+            self.assertTrue(all(0 < t.rank <= 1 for t in qs))
+        if getattr(get_search_backend(), 'has_fts_table', lambda: False)():
+            qs = get_search_backend().partial_matches(
+                    Translation.objects.all(), "pestna")
+            self.assertIn(u"pesta\u00f1a", [t.translation_text for t in qs])
+            # Sharing a trigram or two is not enough.
+            Translation.objects.create(concept_id=1, language_id="gl",
+                                       translation_text="banana")
+            qs = get_search_backend().partial_matches(
+                    Translation.objects.all(), "pestana")
+            self.assertNotIn("banana", [t.translation_text for t in qs])
+            # Other filters apply to all the matches.
+            Translation.objects.create(concept_id=4, language_id="gl",
+                                       translation_text="pestanas")
+            qs = get_search_backend().partial_matches(
+                    Translation.objects.filter(concept__glossary=2), "pestana")
+            self.assertEqual([t.translation_text for t in qs], ["pestanas"])
+        response = self.c.get('/advanced_search/', {
+            "search_string": "PESTANA",
+            "also_show_partial_matches": True,
+            })
+        self.assertContains(response, "pestanas laterais")
+
+    def test_long_ranked_search(self):
+        from terminator.search import get_search_backend
+        # Many trigrams stay within the limit of query parameters.
+        key = search_key(u"".join(six.unichr(0x3b1 + i % 25) + "ab"[i % 2] for i in range(50)))
+        Translation.objects.create(concept_id=1, language_id="gl", translation_text=key)
+        response = self.c.get('/advanced_search/', {
+            "search_string": key,
+            "also_show_partial_matches": True,
+        })
+        self.assertEqual([r["translation"].translation_text for r in response.context['search_results']], [key])
+        # Longer ones are only matched as substrings.
+        key = u"".join(six.unichr(0x4e00 + i) for i in range(150))
+        Translation.objects.create(concept_id=1, language_id="gl", translation_text=key + "x")
+        Translation.objects.create(concept_id=1, language_id="gl", translation_text=key[1:])
+        qs = get_search_backend().partial_matches(Translation.objects.all(), key)
+        self.assertEqual([t.translation_text for t in qs], [key + "x"])
+
+    def test_definition_search(self):
+        from django.db import connection
+        from terminator.search import create_fts_triggers, get_search_backend
+        Definition.objects.create(concept_id=9, language_id="gl",
+                                  text=u"Peza plana de madeira (qz), coma unha PORTA.")
+        for text in ("porta", "plana de", "QZ"):
+            response = self.c.get('/advanced_search/', {
+                "search_string": text,
+                "search_in_definitions": True,
+            })
+            texts = [r["translation"].translation_text for r in response.context['search_results']]
+            # Only the terms in the language of the definition
+            self.assertEqual(texts, [u"t\u00e1boa"])
+        response = self.c.get('/advanced_search/', {
+            "search_string": "portal",
+            "search_in_definitions": True,
+        })
+        self.assertContains(response, "No results found.")
+
+        backend = get_search_backend()
+        if getattr(backend, 'has_fts_table', lambda table: False)('terminator_definition_fts'):
+            # A migration that rebuilt the table dropped the triggers.
+            with connection.cursor() as cursor:
+                cursor.execute("DROP TRIGGER terminator_definition_fts_insert")
+            definition = Definition.objects.create(concept_id=1, language_id="gl", text="Un buraco")
+            self.assertFalse(backend.definition_matches(Definition.objects.all(), "buraco"))
+            create_fts_triggers()
+            self.assertEqual(list(backend.definition_matches(Definition.objects.all(), "buraco")),
+                             [definition])
+            definition.text = "Un oco"
+            definition.save()
+            self.assertFalse(backend.definition_matches(Definition.objects.all(), "buraco"))
+
+    def test_search_pages(self):
+        from terminator.search import get_search_backend
+        for i in range(45):
+            Translation.objects.create(concept_id=1 + i % 3, language_id="gl",
+                                       translation_text="tab")
+        exact = Translation.objects.filter(search_key="tab")
+        partial = get_search_backend().partial_matches(
+                Translation.objects.all(), "tab")
+        for params, expected in (
+                ({}, exact),
+                ({"also_show_partial_matches": True}, partial)):
+            params["search_string"] = "tab"
+            url = '/advanced_search/'
+            seen = []
+            while url:
+                response = self.c.get(url, params)
+                params = None
+                results = response.context['search_results']
+                self.assertTrue(len(results) <= 20)
+                seen.extend(r["translation"].pk for r in results)
+                url = response.context['next_page_url']
+                if url:
+                    url = '/advanced_search/' + url
+            self.assertEqual(sorted(seen), sorted(t.pk for t in expected))
+
+    def test_autocomplete(self):
+        from terminator.autocomplete import index, PrefixIndex
+        index.clear()
+        response = self.c.get('/api/autocomplete/', {"language": "gl", "q": "PES"})
+        terms = json.loads(response.content.decode('utf-8'))['terms']
+        self.assertTrue(terms)
+        # Languages that don't fit in memory are looked up in the database
+        self.assertEqual(terms, PrefixIndex(max_terms=1).lookup("gl", "pes"))
+        response = self.c.get('/api/autocomplete/', {"language": "gl", "q": "pes", "glossary": 999})
+        self.assertEqual(json.loads(response.content.decode('utf-8'))['terms'], [])
+        response = self.c.get('/api/autocomplete/', {"q": "pes"})
+        self.assertEqual(response.status_code, 400)
+
+        # What the signal handlers do once changes are committed
+        t = Translation.objects.create(concept_id=1, language_id="gl",
+                                       translation_text="Pestanas laterais")
+        index.add("gl", 1, t.search_key, t.translation_text, t.pk)
+        self.assertIn("Pestanas laterais", index.lookup("gl", "pestanas", glossary_id=1))
+        index.remove(t.pk)
+        self.assertEqual(index.lookup("gl", "pestanas"), [])
+
+    def test_autocomplete_versions(self):
+        from django.db.models import F
+        from terminator.autocomplete import index
+        self.addCleanup(setattr, index, 'check_interval', index.check_interval)
+        index.check_interval = 0
+        flush_glossary_versions()
+        index.clear()
+        index.lookup("gl", "pes")
+        # Other changes to glossaries don't load the terms again.
+        Definition.objects.filter(concept__glossary=1).first().save()
+        flush_glossary_versions()
+        with self.assertNumQueries(1):
+            index.lookup("gl", "pes")
+        # Neither do the changes to terms applied from the signals.
+        t = Translation.objects.create(concept_id=1, language_id="gl",
+                                       translation_text="Pestanas laterais")
+        flush_glossary_versions() # What happens on commit
+        index.add("gl", 1, t.search_key, t.translation_text, t.pk)
+        with self.assertNumQueries(1):
+            self.assertIn("Pestanas laterais", index.lookup("gl", "pestanas"))
+        # Changes to terms made by other processes are loaded.
+        Translation.objects.filter(pk=t.pk).update(
+                translation_text="Pestanas superiores",
+                search_key="pestanas superiores",
+        )
+        Glossary.objects.filter(pk=1).update(terms_version=F('terms_version') + 1)
+        self.assertEqual(index.lookup("gl", "pestanas"), ["Pestanas superiores"])
+        # So are bulk changes in this process.
+        Translation.objects.filter(pk=t.pk).update(translation_text="Pestanas", search_key="pestanas")
+        defer_glossary_version_update(glossary_ids=[1], terms=True)
+        flush_glossary_versions()
+        self.assertEqual(index.lookup("gl", "pestanas"), ["Pestanas"])
+
+    def test_lookup(self):
+        response = self.c.post('/api/lookup/', json.dumps({
+            "language": "en",
+            "terms": ["TAB", "xanela", "tab"],
+            "target_language": "gl",
+        }), content_type="application/json")
+        results = json.loads(response.content.decode('utf-8'))['results']
+        self.assertEqual([r["term"] for r in results], ["TAB", "xanela", "tab"])
+        self.assertEqual(results[0]["matches"], results[2]["matches"])
+        self.assertEqual(results[1]["matches"], [])
+        match = results[0]["matches"][0]
+        self.assertEqual(match["text"], "tab")
+        self.assertTrue(match["translations"])
+        self.assertTrue(all(t["language"] == "gl" for t in match["translations"]))
+        response = self.c.post('/api/lookup/', "[]", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        for languages in ({"language": ["en"]}, {"language": "en", "target_language": {}}):
+            languages["terms"] = ["tab"]
+            response = self.c.post('/api/lookup/', json.dumps(languages),
+                                   content_type="application/json")
+            self.assertEqual(response.status_code, 400)
+
+    def test_spot(self):
+        text = u"Open a new T\u00c1B, or a tabbed window."
+        response = self.c.post('/api/spot/', json.dumps({
+            "text": text,
+            "glossary": 1,
+            "language": "en",
+            "target_language": "gl",
+        }), content_type="application/json")
+        matches = json.loads(response.content.decode('utf-8'))['matches']
+        self.assertEqual([(m["start"], m["end"], m["term"]) for m in matches],
+                         [(11, 14, "tab"), (28, 34, "window")])
+        self.assertEqual(matches[0]["text"], u"T\u00c1B")
+        self.assertTrue(matches[0]["targets"])
+        # Changed glossaries get a new automaton
+        Translation.objects.create(concept_id=1, language_id="en",
+                                   translation_text="tabbed window")
+        flush_glossary_versions() # What happens on commit
+        from terminator.termspotting import spot_terms
+        matches = spot_terms(text, Glossary.objects.get(pk=1), "en")
+        self.assertEqual([m["term"] for m in matches], ["tab", "tabbed window", "window"])
+
+        # Longer texts than Django takes as a request body can be spotted
+        with self.settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100):
+            response = self.c.post('/api/spot/', json.dumps({
+                "text": text * 20, "glossary": 1, "language": "en"}),
+                content_type="application/json")
+        self.assertEqual(len(json.loads(response.content.decode('utf-8'))["matches"]), 60)
+
+        for data in (
+                {"text": "tab" * 100, "language": "en"},
+                {"text": text, "language": ["en"]},
+                {"text": text, "language": "en", "target_language": ["gl"]}):
+            data["glossary"] = 1
+            with self.settings(TERM_SPOTTING_MAX_LENGTH=200):
+                response = self.c.post('/api/spot/', json.dumps(data),
+                                       content_type="application/json")
+            self.assertEqual(response.status_code, 400)
 
     def test_concept(self):
         response = self.c.get('/concepts/1/')
@@ -283,6 +515,28 @@ class URLsB(TestCase):
         self.assertContains(response, "already present")
         self.assertContains(response, "SEARCHxxx")
 
+    def test_recent_changes(self):
+        from django.core.cache import cache
+        from terminator.models import GlossaryActivity
+        self.c.login(username='usuario', password='usuario')
+        response = self.c.post('/concepts_source/1/', data={
+            "translation": "SEARCHxxx",
+        })
+        self.assertContains(response, "successnote")
+        activity = GlossaryActivity.objects.get()
+        self.assertEqual((activity.glossary_id, activity.concept_id, activity.language_id), (1, 1, "en"))
+        self.assertIn("SEARCHxxx", activity.log_entry.object_repr)
+
+        cache.clear()  # The index page is cached
+        for url in ('/glossaries/1/', '/', '/profiles/usuario/', '/feeds/all/'):
+            response = self.c.get(url)
+            self.assertContains(response, "SEARCHxxx")
+
+        # Changes to deleted objects are still listed.
+        Translation.objects.filter(translation_text="SEARCHxxx").delete()
+        response = self.c.get('/glossaries/1/')
+        self.assertContains(response, "SEARCHxxx")
+
     def test_definition_history(self):
         self.c.login(username='usuario', password='usuario')
         response = self.c.get('/concepts_source/1/')
@@ -296,6 +550,242 @@ class URLsB(TestCase):
         self.assertContains(response, "today")
         self.assertContains(response, "usuario", count=4) #header + history
 
+    def test_concept_page_cache(self):
+        from django.db import connection
+        from django.db.models import F
+        from django.test.utils import CaptureQueriesContext
+        self.c.get('/concepts_source/1/')
+        Concept.objects.get(pk=1).related_concepts.add(2)
+        flush_glossary_versions() # What happens on commit
+        with CaptureQueriesContext(connection) as uncached:
+            self.c.get('/concepts_source/1/')
+        with CaptureQueriesContext(connection) as cached:
+            self.c.get('/concepts_source/1/')
+        self.assertLess(len(cached), len(uncached))
+        cached_count = len(cached)
+        Translation.objects.create(concept_id=1, language_id="en", translation_text="cached term")
+        Translation.objects.create(concept_id=2, language_id="en", translation_text="related term")
+        flush_glossary_versions() # What happens on commit
+        response = self.c.get('/concepts_source/1/')
+        self.assertContains(response, "cached term")
+        self.assertContains(response, "related term")
+        # Changes made by other processes are seen through the version in
+        # the database, without any signals in this process.
+        Translation.objects.filter(translation_text="cached term").update(translation_text="other process")
+        Concept.objects.filter(pk=1).update(version=F('version') + 1)
+        self.assertContains(self.c.get('/concepts_source/1/'), "other process")
+
+        # Changes to unrelated concepts keep the page cached
+        self.c.get('/concepts_source/1/')
+        Translation.objects.create(concept_id=3, language_id="en", translation_text="unrelated term")
+        flush_glossary_versions()
+        with CaptureQueriesContext(connection) as unrelated:
+            self.c.get('/concepts_source/1/')
+        # Only the fragments with the neighbouring concepts by id
+        self.assertEqual(len(unrelated), cached_count + 4)
+
+    def test_glossary_permissions(self):
+        from terminator.permissions import GlossaryPermissions
+        glossary = Glossary.objects.get(pk=1)
+        glossary.assign_terminologist_permissions(self.user)
+        perms = GlossaryPermissions(self.user)
+        self.assertEqual(perms.get_perms(glossary), ["terminologist"])
+        with self.assertNumQueries(0):
+            self.assertTrue(perms.has_perm("terminologist", 1))
+            self.assertFalse(perms.has_perm("owner", glossary))
+        self.assertEqual(list(perms.glossaries("terminologist")), [glossary])
+        self.assertEqual(list(perms.glossaries("owner")), [])
+
+        self.user.is_staff = True
+        self.user.save()
+        self.login()
+        response = self.c.get('/admin/terminator/concept/')
+        self.assertEqual(response.context["cl"].result_count, Concept.objects.filter(glossary=1).count())
+        response = self.c.get('/admin/terminator/glossary/')
+        self.assertEqual(response.status_code, 403)
+
+        # Cached until the permissions change
+        with self.assertNumQueries(0):
+            self.assertEqual(GlossaryPermissions(self.user).get_perms(1), ["terminologist"])
+        glossary.assign_owner_permissions(self.user)
+        self.assertEqual(GlossaryPermissions(self.user).get_perms(1), ["owner", "terminologist"])
+
+    def test_glossary_group_permissions(self):
+        from django.contrib.auth.models import Group, Permission
+        from guardian.shortcuts import assign_perm
+        from terminator.permissions import GlossaryPermissions
+        glossary = Glossary.objects.get(pk=1)
+        group = Group.objects.create(name="Terminologists")
+        assign_perm('terminologist', group, glossary)
+        self.user.groups.add(group)
+        perms = GlossaryPermissions(self.user)
+        self.assertEqual(perms.get_perms(glossary), ["terminologist"])
+        self.assertEqual(list(perms.glossaries("terminologist")), [glossary])
+        self.assertEqual(list(perms.glossaries("specialist")), [])
+
+        # Global permissions give the role in every glossary, but only where
+        # guardian's get_objects_for_user() accepts them.
+        other_group = Group.objects.create(name="Specialists")
+        other_group.permissions.add(Permission.objects.get(codename="specialist"))
+        self.user.groups.add(other_group)
+        perms = GlossaryPermissions(self.user)
+        self.assertEqual(perms.get_perms(glossary), ["terminologist"])
+        self.assertEqual(perms.glossaries("specialist").count(), Glossary.objects.count())
+
+    def test_glossary_permissions_revoked(self):
+        from django.contrib.auth.models import Group, Permission
+        from guardian.models import GroupObjectPermission, UserObjectPermission
+        from guardian.shortcuts import assign_perm
+        from terminator.permissions import GlossaryPermissions
+        glossary = Glossary.objects.get(pk=1)
+        glossary.assign_terminologist_permissions(self.user)
+        glossary.assign_owner_permissions(self.user)
+        self.assertEqual(GlossaryPermissions(self.user).get_perms(1), ["owner", "terminologist"])
+        UserObjectPermission.objects.filter(user=self.user, permission__codename="owner").delete()
+        self.assertEqual(GlossaryPermissions(self.user).get_perms(1), ["terminologist"])
+        # An update to another role
+        permission = UserObjectPermission.objects.get(user=self.user)
+        permission.permission = Permission.objects.get(codename="specialist")
+        permission.save()
+        self.assertEqual(GlossaryPermissions(self.user).get_perms(1), ["specialist"])
+        # Or to another user
+        other = User.objects.create_user(username="other")
+        self.assertEqual(GlossaryPermissions(other).get_perms(1), [])
+        permission.user = other
+        permission.save()
+        self.assertEqual(GlossaryPermissions(self.user).get_perms(1), [])
+        self.assertEqual(GlossaryPermissions(other).get_perms(1), ["specialist"])
+
+        # Through groups
+        group = Group.objects.create(name="Owners")
+        group.user_set.add(self.user)
+        assign_perm('owner', group, glossary)
+        self.assertEqual(GlossaryPermissions(self.user).get_perms(1), ["owner"])
+        group.user_set.remove(self.user)
+        self.assertEqual(GlossaryPermissions(self.user).get_perms(1), [])
+        self.user.groups.add(group)
+        self.assertEqual(GlossaryPermissions(self.user).get_perms(1), ["owner"])
+        GroupObjectPermission.objects.filter(group=group).delete()
+        self.assertEqual(GlossaryPermissions(self.user).get_perms(1), [])
+        owner = Permission.objects.get(codename="owner")
+        self.assertEqual(GlossaryPermissions(self.user).glossaries("owner").count(), 0)
+        group.permissions.add(owner)
+        self.assertEqual(GlossaryPermissions(self.user).glossaries("owner").count(), Glossary.objects.count())
+        owner.group_set.clear()
+        self.assertEqual(GlossaryPermissions(self.user).glossaries("owner").count(), 0)
+        self.user.user_permissions.add(owner)
+        self.assertEqual(GlossaryPermissions(self.user).glossaries("owner").count(), Glossary.objects.count())
+
+    def test_glossary_permissions_deleted(self):
+        from django.contrib.auth.models import Group
+        from django.contrib.contenttypes.models import ContentType
+        from django.core.management import call_command
+        from guardian.models import GroupObjectPermission, UserObjectPermission
+        from guardian.shortcuts import assign_perm
+        from terminator import utils
+        from terminator.permissions import GlossaryPermissions
+        glossary = Glossary.objects.create(name="Doomed", source_language_id='en')
+        glossary.assign_owner_permissions(self.user)
+        assign_perm('owner', Group.objects.create(name="Doomed owners"), glossary)
+        glossary_id = glossary.pk
+        self.assertEqual(GlossaryPermissions(self.user).get_perms(glossary_id), ["owner"])
+        glossary.delete()
+        self.assertFalse(UserObjectPermission.objects.filter(object_pk=str(glossary_id)).exists())
+        self.assertFalse(GroupObjectPermission.objects.filter(object_pk=str(glossary_id)).exists())
+        self.assertEqual(GlossaryPermissions(self.user).get_perms(glossary_id), [])
+
+        # Left by older versions, and by a removed model
+        count = UserObjectPermission.objects.count()
+        orphan = UserObjectPermission.objects.filter(object_pk='1').first()
+        orphan.pk = None
+        orphan.object_pk = '999'
+        UserObjectPermission.objects.bulk_create([orphan])
+        orphan.pk = None
+        orphan.object_pk = '998'
+        orphan.content_type_id = ContentType.objects.order_by('-pk').first().pk + 1
+        UserObjectPermission.objects.bulk_create([orphan])
+        self.addCleanup(utils.MAX_QUERY_PARAMS.update, dict(utils.MAX_QUERY_PARAMS))
+        utils.MAX_QUERY_PARAMS['sqlite'] = 2
+        out = six.StringIO()
+        call_command('clean_orphan_permissions', batch_size=5, stdout=out)
+        self.assertEqual(UserObjectPermission.objects.count(), count)
+        self.assertFalse(UserObjectPermission.objects.filter(object_pk='999').exists())
+        self.assertIn("2 deleted", out.getvalue())
+
+    def test_concept_in_language_admin(self):
+        ConceptInLanguage.objects.filter(concept=1, language='en').delete()
+        self.c.get('/concepts/1/en/')
+        self.assertFalse(ConceptInLanguage.objects.filter(concept=1, language='en').exists())
+        self.login()
+        response = self.c.get('/concepts/1/en/admin')
+        self.assertEqual(response.status_code, 403)
+        self.c.login(username='usuario', password='usuario')
+        response = self.c.get('/concepts/1/en/admin')
+        cil = ConceptInLanguage.objects.get(concept=1, language='en')
+        self.assertRedirects(response, '/admin/terminator/conceptinlanguage/%d/change/' % cil.pk)
+
+    def test_glossary_concepts_cache(self):
+        from django.db.models import F
+        from terminator.models import update_repr_caches
+        self.login()
+        self.c.get('/glossaries/1/concepts/')
+        concept = Concept.objects.create(glossary_id=1)
+        flush_glossary_versions() # What happens on commit
+        response = self.c.get('/glossaries/1/concepts/')
+        self.assertContains(response, "Concept #%d" % concept.pk)
+        Translation.objects.create(concept=concept, language_id="en", translation_text="listed term")
+        update_repr_caches([concept.pk])
+        flush_glossary_versions()
+        response = self.c.get('/glossaries/1/concepts/')
+        self.assertContains(response, "listed term")
+        concept.delete()
+        flush_glossary_versions()
+        response = self.c.get('/glossaries/1/concepts/')
+        self.assertNotContains(response, "listed term")
+
+        # Changes made by other processes are seen through the version in
+        # the database, without any signals in this process.
+        Concept.objects.bulk_create([Concept(glossary_id=1, repr_cache="other process")])
+        response = self.c.get('/glossaries/1/concepts/')
+        self.assertNotContains(response, "other process")
+        Glossary.objects.filter(pk=1).update(version=F('version') + 1)
+        Concept.objects.filter(repr_cache="other process").update(
+                version=Glossary.objects.get(pk=1).version)
+        response = self.c.get('/glossaries/1/concepts/')
+        self.assertContains(response, "other process")
+
+        # Only the chunk with the changed concept is rendered again
+        with self.settings(GLOSSARY_CONCEPTS_CHUNK_SIZE=4):
+            self.c.get('/glossaries/1/concepts/')
+            with self.assertNumQueries(3):
+                self.c.get('/glossaries/1/concepts/')
+            Translation.objects.create(concept_id=1, language_id="en", translation_text="chunked term")
+            update_repr_caches([1])
+            flush_glossary_versions()
+            # And the chunks with their versions
+            with self.assertNumQueries(5):
+                response = self.c.get('/glossaries/1/concepts/')
+            self.assertContains(response, "chunked term")
+
+    def test_language_data(self):
+        Concept.objects.filter(pk=2).update(broader_concept=1)
+        Translation.objects.create(concept_id=2, language_id="en", translation_text="Narrower",
+                                   administrative_status_id="admittedTerm-admn-sts")
+        Translation.objects.create(concept_id=2, language_id="en", translation_text="narrowest")
+        Translation.objects.create(concept_id=2, language_id="en", translation_text="best",
+                                   administrative_status_id="deprecatedTerm-admn-sts")
+        # Ordered like the repr_cache, which databases don't lowercase alike
+        Translation.objects.create(concept_id=2, language_id="en", translation_text=u"\u00c9cru")
+        Translation.objects.create(concept_id=2, language_id="en", translation_text=u"\u00e9bano")
+        cil = ConceptInLanguage(concept_id=1, language_id="en")
+        with self.assertNumQueries(2):
+            related = cil.related_concepts_data()
+        self.assertEqual([t.translation_text for t in related[2]["terms"]],
+                         ["narrowest", "window", u"\u00e9bano", u"\u00c9cru", "Narrower", "best"])
+        with self.assertNumQueries(2):
+            others = ConceptInLanguage(concept_id=2, language_id="gl").other_language_data()
+        self.assertEqual(others["en"]["terms"], sorted(others["en"]["terms"], key=lambda t: t.cmp_key()))
+
     def test_concept_target(self):
         # language not added to glossary
         response = self.c.get('/concepts/2/gl/edit')
@@ -433,7 +923,11 @@ class TBXURLs(TestCase):
     def is_tbx(self, response):
         assert "attachment;" in response['Content-Disposition']
         assert "tbx" in response['Content-Disposition']
-        self.assertContains(response, '<martif type="TBX"')
+        self.assertEqual(response.status_code, 200)
+        # The export is streamed, so the content can only be read once.
+        content = b''.join(response.streaming_content)
+        self.assertIn(b'<martif type="TBX"', content)
+        return content
 
     def not_tbx(self, response):
         assert 'Content-Disposition' not in response
@@ -462,8 +956,8 @@ class TBXURLs(TestCase):
             "from_glossaries": 2,
             "export_terms": "all",
         })
-        self.is_tbx(response)
-        self.assertNotContains(response, 'xref')
+        content = self.is_tbx(response)
+        self.assertNotIn(b'xref', content)
 
         r = ExternalResource(concept_id=7, language=None, link_type_id="externalCrossReference")
         r.save()
@@ -471,8 +965,186 @@ class TBXURLs(TestCase):
             "from_glossaries": 2,
             "export_terms": "all",
         })
-        self.is_tbx(response)
-        self.assertContains(response, 'xref')
+        content = self.is_tbx(response)
+        self.assertIn(b'xref', content)
+
+    def test_export_windows(self):
+        from terminator.views.tbx_export import ConceptWindows
+        glossary = Glossary.objects.create(name="windows", source_language_id='en')
+        other = Glossary.objects.create(name="other", source_language_id='en')
+        concepts = []
+        for i in range(5):
+            concept = Concept.objects.create(glossary=glossary)
+            Translation.objects.create(concept=concept, language_id='en', translation_text="term %d" % i)
+            Definition.objects.create(concept=concept, language_id='en', text="definition %d" % i)
+            concepts.append(concept.pk)
+            # Concepts of other glossaries in the same id range
+            Concept.objects.create(glossary=other)
+        Translation.objects.create(concept_id=concepts[3], language_id='gl', translation_text="termo")
+        windows = ConceptWindows(
+                [glossary],
+                Translation.objects.all(),
+                Definition.objects.all(),
+                ExternalResource.objects.all(),
+                ConceptInLanguage.objects.all(),
+        )
+        windows.window_size = 2
+        # Per window: concepts, translations with their corpus examples and
+        # context sentences, definitions, resources and summaries. Then one
+        # query to find that there are no more concepts.
+        with self.assertNumQueries(3 * 7 + 1):
+            result = [
+                (
+                    [concept.pk for concept in window],
+                    dict((key, [t.translation_text for t in rows]) for key, rows in tr_dict.items()),
+                    dict((key, [d.text for d in rows]) for key, rows in def_dict.items()),
+                )
+                for window, (tr_dict, def_dict, resource_dict, summary_dict) in windows
+            ]
+        self.assertEqual([window for window, translations, definitions in result],
+                         [concepts[0:2], concepts[2:4], concepts[4:]])
+        self.assertEqual(result[1][1], {
+            (concepts[2], 'en'): ["term 2"],
+            (concepts[3], 'en'): ["term 3"],
+            (concepts[3], 'gl'): ["termo"],
+        })
+        self.assertEqual(result[2][2], {(concepts[4], 'en'): ["definition 4"]})
+
+    def test_export_cache(self):
+        self.login()
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        data = {"from_glossaries": 1, "export_terms": "all"}
+        with self.settings(TBX_EXPORT_CACHE_DIR=cache_dir):
+            first = self.is_tbx(self.c.post('/export/', data=data))
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            response = self.c.post('/export/', data=data)
+            self.assertIsInstance(response, FileResponse)
+            self.assertEqual(self.is_tbx(response), first)
+
+            # A change to the glossary content invalidates the cached export.
+            translation = Translation.objects.filter(concept__glossary=1).first()
+            translation.translation_text = "changed term"
+            translation.save()
+            flush_glossary_versions() # What happens on commit
+            changed = self.is_tbx(self.c.post('/export/', data=data))
+            self.assertIn(b"changed term", changed)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+        with self.settings(TBX_EXPORT_CACHE_DIR=cache_dir, TBX_EXPORT_CACHE_SIZE=len(changed)):
+            self.is_tbx(self.c.post('/export/', data={"from_glossaries": 2, "export_terms": "all"}))
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_glossary_version(self):
+        flush_glossary_versions()
+        stale = Glossary.objects.get(pk=1)
+        version = stale.version
+        concept = Concept.objects.filter(glossary=1).first()
+        for text in ("one", "two"):
+            Translation.objects.create(concept=concept, language_id='en', translation_text=text)
+        Definition.objects.filter(concept__glossary=1).first().save()
+        # Many changes in one transaction are one update on commit
+        self.assertEqual(Glossary.objects.get(pk=1).version, version)
+        terms_version = stale.terms_version
+        # The terms and the versions of the concepts changed too
+        with self.assertNumQueries(5):
+            flush_glossary_versions()
+        self.assertEqual(Glossary.objects.get(pk=1).version, version + 1)
+        self.assertEqual(Glossary.objects.get(pk=1).terms_version, terms_version + 1)
+
+        # Saving an outdated instance doesn't take the version back.
+        stale.description = "changed"
+        stale.save()
+        flush_glossary_versions()
+        self.assertEqual(Glossary.objects.get(pk=1).version, version + 2)
+        self.assertEqual(Glossary.objects.get(pk=1).terms_version, terms_version + 1)
+
+        # Moving a concept changes both glossaries.
+        other_version = Glossary.objects.get(pk=2).version
+        concept.glossary_id = 2
+        concept.save()
+        flush_glossary_versions()
+        self.assertEqual(Glossary.objects.get(pk=1).version, version + 3)
+        self.assertEqual(Glossary.objects.get(pk=2).version, other_version + 1)
+
+        # Admin actions that update querysets
+        User.objects.create_superuser("admin", "admin@test.com", "admin")
+        self.c.login(username="admin", password="admin")
+        definition = Definition.objects.filter(concept__glossary=1).first()
+        response = self.c.post('/admin/terminator/definition/', {
+                'action': 'mark_finalized',
+                '_selected_action': [definition.pk],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Definition.objects.get(pk=definition.pk).is_finalized)
+        flush_glossary_versions()
+        self.assertEqual(Glossary.objects.get(pk=1).version, version + 4)
+
+    def test_export_cache_language(self):
+        from django.utils import translation
+        from terminator.views.tbx_export import ExportCache
+        export_cache = ExportCache("unused", 0)
+        glossaries = list(Glossary.objects.all())
+        keys = set()
+        for language in ("en", "gl"):
+            with translation.override(language):
+                keys.add(export_cache.key(glossaries, ["en"], False, "all"))
+        self.assertEqual(len(keys), 2)
+
+    def test_export_changes(self):
+        from django.contrib.admin.models import LogEntry, DELETION
+        from django.utils import timezone
+        self.login()
+        since = timezone.now()
+        cil, created = ConceptInLanguage.objects.get_or_create(concept_id=1, language_id="gl")
+        cil.save()
+        deleted = Concept.objects.create(glossary_id=1)
+        LogEntry.objects.log_action(
+            user_id=self.user.pk,
+            content_type_id=ContentType.objects.get_for_model(Concept).pk,
+            object_id=deleted.pk,
+            object_repr=force_text(deleted),
+            action_flag=DELETION,
+        )
+        deleted_id = deleted.pk
+        deleted.delete()
+        # Deletions in other glossaries are not reported.
+        elsewhere = Concept.objects.create(glossary_id=2)
+        LogEntry.objects.log_action(
+            user_id=self.user.pk,
+            content_type_id=ContentType.objects.get_for_model(Concept).pk,
+            object_id=elsewhere.pk,
+            object_repr=force_text(elsewhere),
+            action_flag=DELETION,
+        )
+        elsewhere.delete()
+        # A deleted term changes its concept.
+        term = Translation.objects.filter(concept__glossary=1).exclude(concept=1).first()
+        LogEntry.objects.log_action(
+            user_id=self.user.pk,
+            content_type_id=ContentType.objects.get_for_model(Translation).pk,
+            object_id=term.pk,
+            object_repr=force_text(term),
+            action_flag=DELETION,
+        )
+        term.delete()
+
+        data = {"glossary": 1, "since": since.isoformat(), "format": "json"}
+        response = self.c.get('/export/changes/', data=data)
+        changes = json.loads(b''.join(response.streaming_content).decode('utf-8'))
+        self.assertEqual([c["id"] for c in changes["concepts"]], sorted([1, term.concept_id]))
+        self.assertEqual(changes["deleted"], [deleted_id])
+
+        data["format"] = "tbx"
+        content = self.is_tbx(self.c.get('/export/changes/', data=data))
+        self.assertIn(b'<termEntry id="cid-1">', content)
+        self.assertIn(('<termEntry id="cid-%d">' % deleted_id).encode('utf-8'), content)
+        self.assertEqual(content.count(b"<termEntry"), 3)
+
+        for since in ("yesterday", "2020-13-01T00:00"):
+            data["since"] = since
+            response = self.c.get('/export/changes/', data=data)
+            self.assertEqual(response.status_code, 400)
 
     def test_tbx_import(self):
         self.login()
@@ -530,6 +1202,243 @@ class TBXURLs(TestCase):
                 self.assertContains(response, "Already exists a glossary with the given name. You should provide another one.")
 
 
+class TBXImportTests(TestCase):
+
+    fixtures = ['test_data']
+
+    def glossary_data(self, glossary):
+        # Everything, except the actual ids
+        data = []
+        concepts = list(glossary.concept_set.order_by('id'))
+        index = dict((c.pk, i) for i, c in enumerate(concepts))
+        for concept in concepts:
+            data.append((
+                (concept.repr_cache or "").split(":")[-1],
+                index.get(concept.subject_field_id),
+                index.get(concept.broader_concept_id),
+                sorted(index[c.pk] for c in concept.related_concepts.all()),
+            ))
+            for t in concept.translation_set.order_by('id'):
+                data.append((
+                    t.language_id, t.translation_text, t.is_finalized,
+                    t.administrative_status_id,
+                    t.administrative_status_reason_id, t.part_of_speech_id,
+                    t.grammatical_gender_id, t.grammatical_number_id, t.note,
+                    list(t.contextsentence_set.values_list('text')),
+                    list(t.corpusexample_set.values_list('address', 'description')),
+                ))
+            for d in concept.definition_set.order_by('language'):
+                data.append((d.language_id, d.text, d.source, d.is_finalized,
+                             d.history.count()))
+            for r in concept.externalresource_set.order_by('id'):
+                data.append((r.language_id, r.address, r.link_type_id, r.description))
+        data.append(list(glossary.other_languages.values_list('pk')))
+        return data
+
+    def test_bulk_import(self):
+        from terminator.views.tbx_import import BulkTBXImporter, TBXImporter
+        Language(iso_code="zu").save()
+        results = []
+        for name, importer in (
+                ("row", TBXImporter),
+                ("bulk", lambda g: BulkTBXImporter(g, batch_size=1))):
+            glossary = Glossary.objects.create(name=name, source_language_id='en')
+            with open(os.path.join(os.path.dirname(__file__), 'most.tbx'), 'rb') as f:
+                importer(glossary).run(f)
+            results.append(self.glossary_data(glossary))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(len(results[1][0][3]), 1) # related concept
+
+    def test_bulk_import_concurrent_insert(self):
+        from terminator.views.tbx_import import BulkTBXImporter
+
+        others = []
+
+        class ConcurrentImporter(BulkTBXImporter):
+            def bulk_create(self, model, objs, new_rows):
+                if model is Concept:
+                    # Somebody else adds a concept while we import.
+                    others.append(Concept.objects.create(glossary=self.glossary).pk)
+                super(ConcurrentImporter, self).bulk_create(model, objs, new_rows)
+
+        Language(iso_code="zu").save()
+        expected = Glossary.objects.create(name="expected", source_language_id='en')
+        glossary = Glossary.objects.create(name="concurrent", source_language_id='en')
+        with open(os.path.join(os.path.dirname(__file__), 'most.tbx'), 'rb') as f:
+            BulkTBXImporter(expected).run(f)
+        with open(os.path.join(os.path.dirname(__file__), 'most.tbx'), 'rb') as f:
+            ConcurrentImporter(glossary, batch_size=1).run(f)
+        self.assertEqual(len(others), 2)
+        self.assertFalse(Concept.objects.filter(pk__in=others).exclude(repr_cache=None))
+        Concept.objects.filter(pk__in=others).delete()
+        self.assertEqual(self.glossary_data(glossary), self.glossary_data(expected))
+
+    def element_data(self, tag, attributes, text, children):
+        return (tag, sorted(attributes), text.strip(), children)
+
+    def dom_data(self, node):
+        # The elements as the old minidom importer saw them
+        return self.element_data(
+            node.tagName,
+            node.attributes.items(),
+            u"".join(n.data for n in node.childNodes if n.nodeType == n.TEXT_NODE),
+            [self.dom_data(n) for n in node.childNodes if n.nodeType == n.ELEMENT_NODE],
+        )
+
+    def etree_data(self, element):
+        return self.element_data(
+            element.tag,
+            element.attrib.items(),
+            (element.text or u"") + u"".join(c.tail or u"" for c in element),
+            [self.etree_data(c) for c in element],
+        )
+
+    def test_streamed_term_entries(self):
+        from xml.dom import minidom
+        from terminator.views.tbx_import import iter_term_entries
+        path = os.path.join(os.path.dirname(__file__), 'most.tbx')
+        with open(path, 'rb') as f:
+            expected = [self.dom_data(node) for node in
+                        minidom.parse(f).getElementsByTagName(u"termEntry")]
+        with open(path, 'rb') as f:
+            streamed = [self.etree_data(e) for e in iter_term_entries(f)]
+        # minidom reports xml:lang with its prefix
+        self.assertEqual(
+            json.dumps(streamed).replace("{http://www.w3.org/XML/1998/namespace}", "xml:"),
+            json.dumps(expected),
+        )
+        self.assertEqual(len(streamed), 2)
+
+    def test_namespaced_import(self):
+        from terminator.views.tbx_import import TBXImporter
+        Language(iso_code="zu").save()
+        with open(os.path.join(os.path.dirname(__file__), 'most.tbx'), 'rb') as f:
+            content = f.read()
+        namespaced = content.replace(
+                b'<martif ', b'<martif xmlns="urn:iso:std:iso:30042:ed-2" ')
+        self.assertNotEqual(namespaced, content)
+        results = []
+        for name, tbx in (("plain", content), ("namespaced", namespaced)):
+            glossary = Glossary.objects.create(name=name, source_language_id='en')
+            TBXImporter(glossary).run(six.BytesIO(tbx))
+            results.append(self.glossary_data(glossary))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(Glossary.objects.get(name="namespaced").concept_set.count(), 2)
+
+    def test_background_import(self):
+        from django.core.management import call_command
+        from terminator.models import ImportJob
+        User.objects.create_user(username="test", password="test")
+        c = Client()
+        c.login(username='test', password='test')
+        Language(iso_code="zu").save()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        with self.settings(TBX_IMPORT_IN_BACKGROUND=True, MEDIA_ROOT=media_root):
+            with open(os.path.join(os.path.dirname(__file__), 'most.tbx'), 'rb') as f:
+                response = c.post('/import/', {
+                    "name": "background",
+                    "description": "test description",
+                    "source_language": 'en',
+                    'imported_file': f
+                })
+            job = ImportJob.objects.get()
+            self.assertRedirects(response, job.get_absolute_url())
+            self.assertContains(c.get(job.get_absolute_url()), "Queued")
+            call_command('process_tbx_imports', once=True, stdout=six.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.SUCCEEDED)
+        self.assertEqual(job.concepts_parsed, job.glossary.concept_set.count())
+        self.assertEqual(job.terms_inserted, Translation.objects.filter(concept__glossary=job.glossary).count())
+        self.assertFalse(job.tbx_file)
+        self.assertContains(c.get(job.get_absolute_url()), "succesful")
+        # The glossary can be deleted after the import.
+        job.glossary.delete()
+        self.assertContains(c.get(job.get_absolute_url()), "succesful")
+
+    def test_failed_import_job(self):
+        from django.core.files.base import ContentFile
+        from terminator.models import ImportJob
+        from terminator.views.tbx_import import run_import_job
+        user = User.objects.create_user(username="test", password="test")
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        for name in ("invalid", "lost"):
+            with self.settings(MEDIA_ROOT=media_root):
+                glossary = Glossary.objects.create(name=name, source_language_id='en')
+                job = ImportJob(glossary=glossary, glossary_name=name, user=user)
+                job.tbx_file.save("%s.tbx" % name, ContentFile(b"<martif>"))
+                if name == "lost":
+                    # The file can't be opened any more.
+                    os.remove(job.tbx_file.path)
+                self.assertTrue(run_import_job(job))
+            job.refresh_from_db()
+            self.assertEqual(job.status, ImportJob.FAILED)
+            self.assertTrue(job.message)
+            self.assertIsNone(job.glossary)
+            self.assertFalse(Glossary.objects.filter(name=name))
+
+    def test_reclaim_import_jobs(self):
+        import datetime
+        from django.core.management import call_command
+        from django.utils.timezone import now
+        from terminator.models import ImportJob
+        user = User.objects.create_user(username="test", password="test")
+        glossary = Glossary.objects.create(name="half", source_language_id='en')
+        concept = Concept.objects.create(glossary=glossary)
+        Concept.objects.create(glossary=glossary, broader_concept=concept)
+        jobs = {}
+        for name, minutes in (("dead", 61), ("slow", 59)):
+            jobs[name] = ImportJob.objects.create(
+                    glossary=glossary if name == "dead" else None,
+                    glossary_name=name,
+                    user=user,
+                    status=ImportJob.RUNNING,
+                    updated=now() - datetime.timedelta(minutes=minutes),
+            )
+        out = six.StringIO()
+        with self.settings(TBX_IMPORT_JOB_TIMEOUT=3600):
+            call_command('process_tbx_imports', once=True, stdout=out)
+        self.assertIn("dead: Failed", out.getvalue())
+        for job in jobs.values():
+            job.refresh_from_db()
+        self.assertEqual(jobs["dead"].status, ImportJob.FAILED)
+        self.assertIsNotNone(jobs["dead"].finished)
+        self.assertFalse(Glossary.objects.filter(name="half"))
+        self.assertEqual(jobs["slow"].status, ImportJob.RUNNING)
+
+
+class UtilsTests(TestCase):
+
+    fixtures = ['test_data']
+
+    def test_prefetch_in_batches(self):
+        from terminator import utils
+        concept = Concept.objects.create(glossary=Glossary.objects.get(pk=1))
+        for i in range(5):
+            translation = Translation.objects.create(
+                    concept=concept, language_id='en', translation_text="term %d" % i)
+            for j in range(i):
+                ContextSentence.objects.create(translation=translation, text="sentence %d" % j)
+        translations = list(Translation.objects.filter(concept=concept).order_by('pk'))
+        self.addCleanup(utils.MAX_QUERY_PARAMS.update, dict(utils.MAX_QUERY_PARAMS))
+        utils.MAX_QUERY_PARAMS['sqlite'] = 2
+        # One query per batch of two translations
+        with self.assertNumQueries(3):
+            utils.prefetch_in_batches(iter(translations), "contextsentence_set")
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                    [len(t.contextsentence_set.all()) for t in translations],
+                    [0, 1, 2, 3, 4],
+            )
+            self.assertEqual(
+                    [s.text for s in translations[2].contextsentence_set.all()],
+                    ["sentence 0", "sentence 1"],
+            )
+        with self.assertNumQueries(0):
+            utils.prefetch_in_batches([], "contextsentence_set")
+
+
 class AdminFormTests(TestCase):
     fixtures = ['test_data']
 
@@ -715,6 +1624,7 @@ class ConceptTest(SharedTests, TestCase):
         tr = self.translation
         tr.translation_text = u"abcd"
         tr.save()
+        flush_repr_caches() # What happens on commit
         self.model.refresh_from_db()
         repr_cache = self.model.repr_cache
         assert repr_cache.startswith('#')
@@ -727,6 +1637,7 @@ class ConceptTest(SharedTests, TestCase):
                 administrative_status_id='preferredTerm-admn-sts',
         )
         tr.save()
+        flush_repr_caches() # What happens on commit
         self.model.refresh_from_db()
         repr_cache = self.model.repr_cache
         assert repr_cache.startswith('#')
@@ -737,10 +1648,35 @@ class ConceptTest(SharedTests, TestCase):
         s.save()
         tr.administrative_status_id = 'deprecatedTerm-admn-sts'
         tr.save()
+        flush_repr_caches() # What happens on commit
         self.model.refresh_from_db()
         repr_cache = self.model.repr_cache
         assert 'abcd, xyz' in repr_cache
 
+    def test_repr_cache_coalesced(self):
+        for text in (u"one", u"two", u"three"):
+            Translation.objects.create(concept=self.model,
+                                       language=self.translation.language,
+                                       translation_text=text)
+        # One query for the concepts, one for their translations and one to
+        # update them, however many translations changed.
+        with self.assertNumQueries(3):
+            flush_repr_caches()
+        self.model.refresh_from_db()
+        self.assertIn(u"three", self.model.repr_cache)
+
+    def test_rebuild_repr_cache(self):
+        from django.core.management import call_command, CommandError
+        Concept.objects.filter(pk=self.model.pk).update(repr_cache="stale")
+        out = six.StringIO()
+        call_command('rebuild_repr_cache', self.model.glossary_id, batch_size=1, stdout=out)
+        self.model.refresh_from_db()
+        self.assertEqual(self.model.repr_cache, self.model.repr_from(
+                self.model.translation_set.filter(language=self.model.glossary.source_language)))
+        self.assertIn("1/1 concepts updated", out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('rebuild_repr_cache', 9999, stdout=out)
+
 
 class ConceptInLanguageTest(SharedTests, TestCase):
     klass = ConceptInLanguage
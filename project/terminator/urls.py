@@ -23,6 +23,7 @@ from django_comments.feeds import LatestCommentFeed
 
 from terminator import feeds
 from terminator import views
+from terminator.views import api
 from terminator.models import Concept, Glossary, Proposal, Translation
 from terminator_comments_app.feeds import CommentThreadFeed
 
@@ -72,6 +73,9 @@ urlpatterns = [
             model=Concept,
         ),
         name='terminator_concept_target'),
+    url(r'^concepts/(?P<pk>\d+)/(?P<lang>\w+)/admin$',
+        views.concept_in_language_admin,
+        name='terminator_concept_in_language_admin'),
 
 
     # Search URLs
@@ -82,6 +86,17 @@ urlpatterns = [
         views.search,
         name='terminator_advanced_search'),
 
+    # API URLs
+    url(r'^api/autocomplete/$',
+        api.autocomplete,
+        name='terminator_autocomplete'),
+    url(r'^api/lookup/$',
+        api.lookup,
+        name='terminator_lookup'),
+    url(r'^api/spot/$',
+        api.spot,
+        name='terminator_spot'),
+
     # Feed URLs
     url(r'^feeds/glossaries/$',
         feeds.LatestChangesGenericFeed(Glossary),
@@ -155,19 +170,26 @@ if settings.FEATURES.get("autoterm"):
 # Import URLs
 if settings.FEATURES.get("import_tbx"):
     from terminator.views import tbx_import
-    urlpatterns.append(
+    urlpatterns.extend([
         url(r'^import/$',
             tbx_import.import_view,
             name='terminator_import'),
-    )
+        url(r'^import/(?P<pk>\d+)/$',
+            tbx_import.import_job_view,
+            name='terminator_import_job'),
+    ])
 
 # Export URLs
 if settings.FEATURES.get("export_tbx"):
-    urlpatterns.append(
+    from terminator.views import tbx_export
+    urlpatterns.extend([
         url(r'^export/$',
             views.export,
-            name='terminator_export')
-    )
+            name='terminator_export'),
+        url(r'^export/changes/$',
+            tbx_export.export_changes,
+            name='terminator_export_changes'),
+    ])
 
 # Proposal URLs
 if settings.FEATURES.get("proposals"):
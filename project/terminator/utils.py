@@ -0,0 +1,103 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+"""Helpers for working with many rows at a time."""
+
+from django.db import connections
+from django.db.models import Case, Q, Value, When
+from django.db.models import prefetch_related_objects
+
+
+# The most query parameters to use for long IN (...) lists and similar, per
+# database vendor. SQLite refuses more than 999 parameters by default, long
+# lists are slow to plan on PostgreSQL, MySQL can run into its
+# max_allowed_packet, and Oracle allows at most 1000 items in a list.
+MAX_QUERY_PARAMS = {
+    'sqlite': 999,
+    'postgresql': 2000,
+    'mysql': 2000,
+    'oracle': 1000,
+}
+
+
+def query_params_limit(using='default'):
+    """The number of parameters a single query should use at most."""
+    return MAX_QUERY_PARAMS.get(connections[using].vendor, 1000)
+
+
+def chunks(items, size):
+    """Split a list into lists of at most size items."""
+    for i in range(0, len(items), size):
+        yield items[i:i+size]
+
+
+def update_in_bulk(model, field_name, values, using='default'):
+    """Set a different value of one field for many rows.
+
+    values is a dictionary of primary key -> new value. Instead of one UPDATE
+    per row, this issues one UPDATE with a CASE expression per batch of rows.
+    """
+    field = model._meta.get_field(field_name)
+    if field.is_relation:
+        # The values are primary keys of the related model.
+        field = field.target_field
+    items = sorted(values.items())
+    # Every row needs three query parameters: pk and value in the CASE, and
+    # the pk in the WHERE clause.
+    batch_size = max(query_params_limit(using) // 3, 1)
+    for batch in chunks(items, batch_size):
+        cases = [When(pk=pk, then=Value(value)) for pk, value in batch]
+        model.objects.using(using).filter(
+                pk__in=[pk for pk, value in batch],
+        ).update(**{field_name: Case(*cases, output_field=field)})
+
+
+def prefetch_in_batches(instances, *lookups):
+    """prefetch_related_objects() that splits long lists of instances.
+
+    Each batch of instances gets its own queries, so that the IN (...) lists
+    stay within query_params_limit(). Every lookup is applied to a batch of
+    instances, so nested lookups should only follow relations that don't
+    multiply the number of objects much.
+    """
+    instances = list(instances)
+    if not instances:
+        return
+    batch_size = query_params_limit(instances[0]._state.db or 'default')
+    for batch in chunks(instances, batch_size):
+        prefetch_related_objects(batch, *lookups)
+
+
+def keyset_filter(ordering, values):
+    """A filter for the rows that come after a row in a given ordering.
+
+    ordering is a list of field names as for order_by(), which should end
+    with a unique field. values are the values of those fields in the last
+    row of the previous page. Unlike OFFSET, this lets the database start
+    reading at the right place in an index.
+    """
+    condition = Q()
+    for i, field_name in enumerate(ordering):
+        if field_name.startswith('-'):
+            lookup = field_name[1:] + '__lt'
+        else:
+            lookup = field_name + '__gt'
+        equal = dict(
+                (name.lstrip('-'), value)
+                for name, value in zip(ordering[:i], values)
+        )
+        condition |= Q(**{lookup: values[i]}) & Q(**equal)
+    return condition
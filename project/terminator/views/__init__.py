@@ -16,7 +16,8 @@
 # You should have received a copy of the GNU General Public License along with
 # Terminator. If not, see <http://www.gnu.org/licenses/>.
 
-from itertools import groupby, islice
+from itertools import islice
+import json
 import re
 
 from django.conf import settings
@@ -27,26 +28,27 @@ from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import PermissionDenied
 from django.core.paginator import EmptyPage, InvalidPage, Paginator
 from django.db import transaction, DatabaseError
-from django.db.models import Prefetch, Q
-from django.db.models import OuterRef, Subquery
-from django.db.models import prefetch_related_objects
-from django.http import HttpResponse
+from django.db.models import F, FloatField, Func, Prefetch
+from django.db.models import Exists, OuterRef, Subquery
 from django.shortcuts import (get_object_or_404, render, Http404, redirect)
-from django.template import loader
+from django.urls import reverse
 from django.utils.encoding import force_text
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import urlencode
 from django.utils.translation import ugettext_lazy as _
 from django.views.decorators.csrf import csrf_protect
 from django.views.generic import DetailView, ListView, TemplateView
 from django_comments.models import Comment
 
-from guardian.core import ObjectPermissionChecker
-from guardian.shortcuts import get_perms
-
 from terminator.forms import (AdvancedSearchForm, CollaborationRequestForm,
                               ExportForm, ProposalForm, SearchForm,
                               SubscribeForm, ConceptInLanguageForm,
                               ExternalResourceForm)
 from terminator.models import *
+from terminator.permissions import glossary_permissions
+from terminator.search import get_search_backend
+from terminator.utils import keyset_filter, prefetch_in_batches
+from terminator.views.tbx_export import export_glossaries_to_TBX
 
 
 def terminator_profile_detail(request, username):
@@ -69,24 +71,23 @@ def terminator_profile_detail(request, username):
         comments = paginator.page(page)
     except (EmptyPage, InvalidPage):
         comments = paginator.page(paginator.num_pages)
-    prefetch_related_objects(comments.object_list,
+    prefetch_in_batches(comments.object_list,
             'content_object__concept',
             'content_object__concept__glossary',
     )
     glossary_list = list(Glossary.objects.all())
     user_glossaries = []
-    checker = ObjectPermissionChecker(user)
-    checker.prefetch_perms(glossary_list)
+    permissions = glossary_permissions(request, user)
     for glossary in glossary_list:
-        if checker.has_perm('owner', glossary):
+        if permissions.has_perm('owner', glossary):
             user_glossaries.append({'glossary': glossary, 'role': _(u"owner")})
-        elif checker.has_perm('terminologist', glossary):
+        elif permissions.has_perm('terminologist', glossary):
             user_glossaries.append({'glossary': glossary, 'role': _(u"terminologist")})
-        elif checker.has_perm('specialist', glossary):
+        elif permissions.has_perm('specialist', glossary):
             user_glossaries.append({'glossary': glossary, 'role': _(u"specialist")})
 
     ctypes = ContentType.objects.get_for_models(Translation, Definition, ExternalResource).values()
-    recent_changes = process_recent_changes(LogEntry.objects.filter(
+    recent_changes = process_recent_changes(GlossaryActivity.objects.filter(
                 content_type__in=ctypes,
                 user=user,
             ).order_by("-action_time")[:10])
@@ -212,15 +213,12 @@ class ConceptDetailView(TerminatorDetailView):
             language = Language.objects.get(pk=self.kwargs.get('lang'))
         except Language.DoesNotExist:
             raise Http404
-        concept_in_language, created = ConceptInLanguage.objects.get_or_create(
-                concept=context['concept'],
-                language=language,
-        )
+        concept_in_language = ConceptInLanguage.get_or_placeholder(context['concept'], language)
         context['current_language'] = language
-        translations = context['concept'].translation_set.filter(
+        translations = list(context['concept'].translation_set.filter(
                 language=language,
-            ).select_related("administrative_status", "part_of_speech"). \
-            prefetch_related("corpusexample_set", "contextsentence_set")
+        ).select_related("administrative_status", "part_of_speech"))
+        prefetch_in_batches(translations, "corpusexample_set", "contextsentence_set")
         context['translations'] = translations
         context['concept_in_lang'] = concept_in_language
         context['finalized'] = concept_in_language.is_finalized
@@ -246,9 +244,9 @@ class ConceptSourceView(TerminatorDetailView):
         return self.object.glossary.source_language
 
     def get_concept_in_lang(self):
-        self.concept_in_lang, _c = ConceptInLanguage.objects.get_or_create(
-                concept=self.object,
-                language=self.object.glossary.source_language,
+        self.concept_in_lang = ConceptInLanguage.get_or_placeholder(
+                self.object,
+                self.object.glossary.source_language,
         )
         # Avoid the query if the template uses concept_in_lang.concept:
         self.concept_in_lang.concept = self.object
@@ -276,7 +274,7 @@ class ConceptSourceView(TerminatorDetailView):
         message_class = ""
         user = self.request.user
         if user.is_authenticated:
-            glossary_perms = get_perms(user, concept.glossary)
+            glossary_perms = glossary_permissions(self.request).get_perms(concept.glossary)
             may_edit = self.may_edit(glossary_perms)
         else:
             glossary_perms = []
@@ -325,6 +323,12 @@ class ConceptSourceView(TerminatorDetailView):
                     )
                     message = _("Your contribution was saved: %s") % value
                     message_class = "successnote"
+            if message_class == "successnote":
+                # The page shown now must not come from the cached fragments
+                # of the previous version, even inside a transaction.
+                flush_glossary_versions()
+                concept.refresh_from_db(fields=['version'])
+                concept.glossary.refresh_from_db(fields=['version'])
 
         context['glossary_perms'] = glossary_perms
         context['may_edit'] = may_edit
@@ -332,8 +336,10 @@ class ConceptSourceView(TerminatorDetailView):
         context['message_class'] = message_class
         context['current_language'] = language
         translations = translations.select_related('administrative_status').order_by()
-        translations = sorted(translations, key=lambda t: t.cmp_key())
-        context['translations'] = translations
+        # Only loaded if the cached fragments of the page need them.
+        context['translations'] = SimpleLazyObject(
+                lambda: sorted(translations, key=lambda t: t.cmp_key()))
+        context['cache_timeout'] = getattr(settings, 'CONCEPT_CACHE_TIMEOUT', 86400)
         context['definition'] = definition
         context['concept_in_lang'] = self.get_concept_in_lang()
         if definition:
@@ -341,6 +347,10 @@ class ConceptSourceView(TerminatorDetailView):
         form = ConceptInLanguageForm(initial=initial)
         for field in ('translation', 'definition'):
             form.fields[field].widget.attrs['lang'] = language.iso_code
+        form.fields['translation'].widget.attrs['data-autocomplete'] = '%s?%s' % (
+                reverse('terminator_autocomplete'),
+                urlencode({'language': language.iso_code, 'glossary': concept.glossary_id}),
+        )
 
         # Customise fields a bit to suit permissions and workflow
         if not may_edit and definition:
@@ -380,11 +390,7 @@ class ConceptTargetView(ConceptSourceView):
 
     def get_concept_in_lang(self):
         if not self.concept_in_lang:
-            concept_in_lang, created = ConceptInLanguage.objects.get_or_create(
-                    concept=self.object,
-                    language=self.language,
-            )
-            self.concept_in_lang = concept_in_lang
+            self.concept_in_lang = ConceptInLanguage.get_or_placeholder(self.object, self.language)
         return self.concept_in_lang
 
     def may_edit(self, glossary_perms):
@@ -393,16 +399,37 @@ class ConceptTargetView(ConceptSourceView):
 
     def get_context_data(self, **kwargs):
         context = super(ConceptTargetView, self).get_context_data(**kwargs)
-        other_languages = self.get_concept_in_lang().other_language_data()
-        if self.source_language_id in other_languages:
-            # Shouldn't happen, but could be if terms+definition was deleted in
-            # source language and URLs are manipulated. for example.
-            context['source_language'] = other_languages[self.source_language_id]
-            del other_languages[self.source_language_id]
-        context['other_languages'] = other_languages
+        other_languages = SimpleLazyObject(self.get_concept_in_lang().other_language_data)
+        # Only loaded if the cached fragments of the page need them.
+        context['source_language'] = SimpleLazyObject(
+                lambda: other_languages.get(self.source_language_id, {}))
+        context['other_languages'] = SimpleLazyObject(lambda: dict(
+                (lang, data) for lang, data in other_languages.items()
+                # Shouldn't happen, but could be if terms+definition was
+                # deleted in source language and URLs are manipulated.
+                if lang != self.source_language_id
+        ))
         return context
 
 
+@login_required
+def concept_in_language_admin(request, pk, lang):
+    """Redirect to the admin page of a concept in a language.
+
+    The ConceptInLanguage is created first if there is none yet, since the
+    admin can't add them.
+    """
+    concept = get_object_or_404(Concept, pk=pk)
+    language = get_object_or_404(Language, pk=lang)
+    if not glossary_permissions(request).has_perm('terminologist', concept.glossary):
+        raise PermissionDenied
+    concept_in_lang, created = ConceptInLanguage.objects.get_or_create(
+            concept=concept,
+            language=language,
+    )
+    return redirect('admin:terminator_conceptinlanguage_change', concept_in_lang.pk)
+
+
 class GlossaryDetailView(TerminatorDetailView):
     def post(self, request, *args, **kwargs):
         if not settings.FEATURES.get('collaboration', True) and \
@@ -466,11 +493,7 @@ class GlossaryDetailView(TerminatorDetailView):
                     content_type=cil_ctype,
                     is_public=True,
                     is_removed=False,
-                    #the __integer transform changes the str object_pk into an
-                    #INT that can be joined by the database
-                    object_pk__integer__in=ConceptInLanguage.objects.filter(
-                        concept__glossary=self.object,
-                    ),
+                    thread__glossary=self.object,
                 ).
                 select_related("user").
                 prefetch_related("content_object", "content_object__concept")[:5],
@@ -482,6 +505,12 @@ class GlossaryConceptsView(LoginRequiredMixin, TerminatorDetailView):
     def get_template_names(self):
         return "terminator/glossary_concepts.html"
 
+    def get_context_data(self, **kwargs):
+        context = super(GlossaryConceptsView, self).get_context_data(**kwargs)
+        context['concept_chunks'] = concept_list_chunks(self.object)
+        context['cache_timeout'] = getattr(settings, 'CONCEPT_CACHE_TIMEOUT', 86400)
+        return context
+
 
 @csrf_protect
 def terminator_index(request):
@@ -520,7 +549,7 @@ def terminator_index(request):
             ConceptInLanguage,
     ).values()
 
-    recent_changes = LogEntry.objects.filter(
+    recent_changes = GlossaryActivity.objects.filter(
             content_type__in=language_ctypes,
     ).order_by("-action_time")[:8]
 
@@ -545,173 +574,14 @@ def terminator_index(request):
                 ).
                 select_related("user").
                 prefetch_related("content_object", "content_object__concept")[:8],
-        'latest_glossary_changes': LogEntry.objects.filter(content_type=glossary_ctype).order_by("-action_time")[:8],
-        'latest_concept_changes': LogEntry.objects.filter(content_type=concept_ctype).order_by("-action_time")[:8],
+        'latest_glossary_changes': LogEntry.objects.filter(activity__content_type=glossary_ctype).order_by("-activity__action_time")[:8],
+        'latest_concept_changes': LogEntry.objects.filter(activity__content_type=concept_ctype).order_by("-activity__action_time")[:8],
         'latest_changes': latest_changes,
     }
 
     return render(request, 'index.html', context)
 
 
-def export_glossaries_to_TBX(glossaries, desired_languages=None, export_all_definitions=False, export_terms="all"):
-    if desired_languages is None:
-        desired_languages = []
-    if not glossaries:
-        raise Http404
-    elif len(glossaries) == 1:
-        glossary_data = glossaries[0]
-    else:
-        glossary_description = _("TBX file created by exporting the following "
-                                 "glossaries: ")
-        glossaries_names_list = []
-        for gloss in glossaries:
-            glossaries_names_list.append(gloss.name)
-        glossary_description += ", ".join(glossaries_names_list)
-        glossary_data = {
-            "name": _("Terminator TBX exported glossary"),
-            "description": glossary_description,
-        }
-    data = {
-        'glossary': glossary_data,
-        'concepts': [],
-    }
-
-    preferred = AdministrativeStatus.objects.get(name="Preferred")
-    admitted = AdministrativeStatus.objects.get(name="Admitted")
-    not_recommended = AdministrativeStatus.objects.get(name="Not recommended")
-
-    concept_qs = Concept.objects.filter(glossary__in=glossaries).order_by("glossary", "id")
-
-    #Give template an indication of whether any related concepts are used:
-    data["use_related_concepts"] = Concept.objects.filter(
-            related_concepts__id__in=concept_qs,
-    ).exists()
-
-    translation_filter = Q()
-    if export_terms == 'preferred':
-        translation_filter |= Q(administrative_status=preferred)
-    elif export_terms == 'preferred+admitted':
-        translation_filter |= Q(administrative_status=preferred)
-        translation_filter |= Q(administrative_status=admitted)
-    elif export_terms == 'preferred+admitted+not_recommended':
-        translation_filter |= Q(administrative_status__in=(preferred, admitted, not_recommended))
-
-    # Only the finished summary messages are exported
-    summary_filter = Q(is_finalized=True)
-    definition_filter = Q()
-    if not export_all_definitions:
-        definition_filter &= Q(is_finalized=True)
-
-    # Assume that there is at least a term or a definition for a used language.
-    glossary_filter = Q(concept__glossary__in=glossaries)
-    translations = Translation.objects.filter(glossary_filter & translation_filter)
-    definitions = Definition.objects.filter(glossary_filter & definition_filter)
-    used_languages = set(translations.values_list('language', flat=True).distinct())
-    used_languages.update(definitions.values_list('language', flat=True).distinct())
-    used_languages.difference_update(set(desired_languages))
-    used_languages = sorted(used_languages)
-
-    def key_func(obj):
-        return (obj.concept_id, obj.language_id)
-
-    def query_lookup_dict(qs):
-        results = {}
-        for key, group in groupby(qs, key_func):
-            results[key] = list(group)
-        return results
-
-    translations = translations.select_related(
-            'part_of_speech',
-            'grammatical_number',
-            'grammatical_gender',
-            'administrative_status',
-            'administrative_status_reason',
-    )
-    if "sqlite" in settings.DATABASES['default']['ENGINE']:
-        # SQLite can't handle more than 999 translations (by default). We do it
-        # in batches so that testing with SQLite is still possible.
-        bool(translations)
-        for i in range(0, len(translations), 999):
-            prefetch_related_objects(translations[i:i+999], "corpusexample_set", "contextsentence_set")
-    else:
-        translations = translations.prefetch_related("corpusexample_set", "contextsentence_set")
-
-    tr_dict = query_lookup_dict(translations)
-    def_dict = query_lookup_dict(definitions)
-
-    resources = ExternalResource.objects.filter(glossary_filter)
-    resource_dict = query_lookup_dict(resources)
-
-    summaries = ConceptInLanguage.objects.filter(glossary_filter & summary_filter).only('summary')
-    summary_dict = query_lookup_dict(summaries)
-
-    def generate_concepts():
-        #generator so that we don't keep things in memory
-        for concept in concept_qs.iterator():
-            concept_data = {
-                'concept': concept,
-                'languages': [],
-                'externalresources': resource_dict.get((concept.id, None), [])
-            }
-
-            for language_code in used_languages:
-                key = (concept.id, language_code)
-
-                lang_translations = tr_dict.get(key, [])
-                lang_resources = resource_dict.get(key, [])
-
-                lang_summary_message = summary_dict.get(key, None)
-                if lang_summary_message:
-                    assert len(lang_summary_message) == 1
-                    lang_summary_message = lang_summary_message[0].summary
-
-                lang_definition = def_dict.get(key, None)
-                if lang_definition:
-                    assert len(lang_definition) == 1
-                    lang_definition = lang_definition[0]
-
-                if not any((lang_translations, lang_resources, lang_definition, lang_summary_message)):
-                    # no real content
-                    continue
-
-                lang_data = {
-                    'iso_code': language_code,
-                    'translations': lang_translations,
-                    'externalresources': lang_resources,
-                    'definition': lang_definition,
-                    'summarymessage': lang_summary_message,
-                }
-                concept_data['languages'].append(lang_data)
-            if concept_data['languages']:
-                yield concept_data
-
-    data['concepts'] = generate_concepts()
-
-    #TODO:
-    # Raise Http404 if there are no concepts in the resulting glossary
-    #if not data['concepts']:
-    #    raise Http404
-    # Important enough? Can't easily do with generator.
-
-    # Create the HttpResponse object with the appropriate header.
-    response = HttpResponse(content_type='application/x-tbx')
-    if len(glossaries) == 1:
-        from django.utils.six.moves.urllib_parse import quote
-        encoded_name = b"%s.tbx" % quote(glossaries[0].name).encode('utf-8')
-        response['Content-Disposition'] = "attachment; filename=\"%s\"; filename*=UTF-8''%s" % (encoded_name, encoded_name)
-        # http://test.greenbytes.de/tech/tc2231/
-        # The encoding of filename is wrong, but seems like it will trigger the
-        # right bugs in older browsers that don't support filename* to actually
-        # display the right filename.
-    else:
-        response['Content-Disposition'] = 'attachment; filename=terminator_several_exported_glossaries.tbx'
-
-    # Create the response
-    t = loader.get_template('export.tbx')
-    response.write(t.render({'data': data}))
-    return response
-
-
 def autoterm(request, language_code):
     #TODO Make this view to export for any language pair and not only for
     # english and another language.
@@ -751,8 +621,20 @@ def export(request):
     return render(request, 'export.html', context)
 
 
+def parse_search_cursor(value, length):
+    """The values of the last result of the previous page, or None."""
+    try:
+        values = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    return values
+
+
 def search(request):
     search_results = None
+    next_page_url = None
     if request.method == 'GET' and 'search_string' in request.GET:
         if "advanced" in request.path:
             search_form = AdvancedSearchForm(request.GET)
@@ -761,6 +643,7 @@ def search(request):
 
         if search_form.is_valid():
             qs = Translation.objects.all()
+            ranked = False
             data = search_form.cleaned_data
             search_string = data['search_string']
             if "advanced" in request.path:
@@ -782,18 +665,57 @@ def search(request):
                 if admin_status_filter:
                     qs = qs.filter(administrative_status=admin_status_filter)
 
-                if data['also_show_partial_matches']:
-                    qs = qs.filter(translation_text__icontains=search_string)
+                if data['search_in_definitions']:
+                    # The terms of the concepts in the languages of the
+                    # definitions
+                    definitions = get_search_backend(qs.db).definition_matches(
+                            Definition.objects.filter(
+                                concept=OuterRef('concept'),
+                                language=OuterRef('language'),
+                            ),
+                            search_string.strip(),
+                    )
+                    qs = qs.annotate(
+                            defined=Exists(definitions.values('id')),
+                    ).filter(defined=True)
+                elif data['also_show_partial_matches']:
+                    backend = get_search_backend(qs.db)
+                    qs = backend.partial_matches(qs, search_key(search_string))
+                    ranked = True
                 else:
-                    qs = qs.filter(translation_text__iexact=search_string)
+                    qs = qs.filter(search_key=search_key(search_string))
             else:
-                qs = qs.filter(translation_text__iexact=search_string)
+                qs = qs.filter(search_key=search_key(search_string))
 
-            # Limit for better worst-case performance. Consider pager.
+            # Results are shown a page at a time. The next page starts after
+            # the last result of this one, so that deep pages are as cheap to
+            # find as the first one.
             limit = 20
             if request.user.is_authenticated:
                 limit = 100
-
+            if ranked:
+                # Rounded, so that the rank of the last result can be compared
+                # exactly when looking for the next page.
+                qs = qs.annotate(rank_key=Func(F('rank') * 1000000,
+                        function='ROUND', output_field=FloatField()))
+                ordering = ['-rank_key', 'id']
+            else:
+                ordering = ['concept_id', 'language_id', 'id']
+            qs = qs.order_by(*ordering)
+            after = parse_search_cursor(request.GET.get('after'), len(ordering))
+            if after:
+                qs = qs.filter(keyset_filter(ordering, after))
+            keys = list(qs.values_list(
+                    *[name.lstrip('-') for name in ordering])[:limit + 1])
+            if len(keys) > limit:
+                keys = keys[:limit]
+                next_query = request.GET.copy()
+                next_query['after'] = json.dumps(list(keys[-1]),
+                                                 separators=(',', ':'))
+                next_page_url = '?' + next_query.urlencode()
+            position = dict((key[-1], i) for i, key in enumerate(keys))
+
+            qs = Translation.objects.filter(pk__in=list(position))
             definition = Definition.objects.filter(
                     concept=OuterRef('concept'),
                     language=OuterRef('language'),
@@ -804,7 +726,7 @@ def search(request):
                     'concept',
                     'concept__glossary',
                     'administrative_status',
-            )[:limit]
+            )
             deferred_fields = (
                     'administrative_status_reason',
                     'administrative_status__description',
@@ -819,15 +741,23 @@ def search(request):
                     'concept__glossary__description',
                     'concept__glossary__source_language',
             )
+            qs = sorted(qs.defer(*deferred_fields),
+                        key=lambda trans: position[trans.pk])
+            if ranked:
+                # Keep the translations of each concept together, starting
+                # with the concept of the best match.
+                concept_position = {}
+                for i, trans in enumerate(qs):
+                    concept_position.setdefault(trans.concept_id, i)
+                qs.sort(key=lambda trans: concept_position[trans.concept_id])
             inner_qs = Translation.objects.defer()
-            qs = qs.prefetch_related(Prefetch(
+            prefetch_in_batches(qs, Prefetch(
                     'concept__translation_set', queryset=inner_qs, to_attr="others"))
-            qs = qs.defer(*deferred_fields)
 
             previous_concept = None
 
             search_results = []
-            for trans in qs:# Translations are ordered by (concept, language)
+            for trans in qs:# Translations are grouped by concept
                 # If this is the first translation for this concept
                 if previous_concept != trans.concept_id:
                     is_first = True
@@ -852,6 +782,7 @@ def search(request):
     context = {
         'search_form': search_form,
         'search_results': search_results,
+        'next_page_url': next_page_url,
         'next': request.get_full_path(),
     }
 
@@ -0,0 +1,175 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+"""JSON views for tools and scripts."""
+
+import json
+
+from django.conf import settings
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import six
+from django.utils.translation import ugettext_lazy as _
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from terminator import autocomplete as autocomplete_index
+from terminator.models import Definition, Glossary, Translation, search_key
+from terminator.termspotting import spot_terms
+from terminator.utils import chunks, prefetch_in_batches, query_params_limit
+
+
+# The most terms that can be looked up in one request.
+MAX_LOOKUP_TERMS = 5000
+
+
+def autocomplete(request):
+    """Terms starting with the q parameter, for type-ahead.
+
+    The language parameter is required. The glossary parameter limits the
+    terms to one glossary, and limit (at most 50) sets how many are returned.
+    """
+    language = request.GET.get('language', '')
+    prefix = request.GET.get('q', '')
+    if not language or not prefix.strip():
+        return HttpResponseBadRequest(_("The language and q parameters are required."))
+    glossary_id = request.GET.get('glossary', '')
+    glossary_id = int(glossary_id) if glossary_id.isdigit() else None
+    limit = request.GET.get('limit', '')
+    limit = min(int(limit), 50) if limit.isdigit() else 10
+    terms = autocomplete_index.index.lookup(language, prefix, glossary_id, limit)
+    return JsonResponse({'terms': terms})
+
+
+def valid_languages(language, target_language):
+    """Whether the language codes of a request are strings, as they should.
+
+    The target language is optional.
+    """
+    return isinstance(language, six.string_types) and (
+            target_language is None or isinstance(target_language, six.string_types))
+
+
+def term_json(translation):
+    return {
+        'id': translation.pk,
+        'language': translation.language_id,
+        'text': translation.translation_text,
+        'administrative_status': translation.administrative_status_id,
+        'is_finalized': translation.is_finalized,
+    }
+
+
+@csrf_exempt
+@require_POST
+def lookup(request):
+    """Look up many terms at once, for CAT tools.
+
+    The body is a JSON object with "language", a list of "terms", and
+    optionally "glossary" and "target_language". Each term is compared by its
+    search key, and the answer lists the matching terms per given term, with
+    their definitions and the other terms of their concepts.
+    """
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        language = data['language']
+        terms = data['terms']
+        glossary_id = data.get('glossary')
+        target_language = data.get('target_language')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return HttpResponseBadRequest(_("The request must be a JSON object with a language and a list of terms."))
+    if glossary_id is not None and not isinstance(glossary_id, int):
+        return HttpResponseBadRequest(_("The glossary must be a number."))
+    if not valid_languages(language, target_language):
+        return HttpResponseBadRequest(_("The languages must be language codes."))
+    if not isinstance(terms, list) or len(terms) > MAX_LOOKUP_TERMS or \
+            not all(isinstance(term, six.string_types) for term in terms):
+        return HttpResponseBadRequest(_("The terms must be a list of at most %d strings.") % MAX_LOOKUP_TERMS)
+
+    keys = {}
+    for term in terms:
+        keys.setdefault(search_key(term), set()).add(term)
+    definition = Definition.objects.filter(
+            concept=OuterRef('concept'),
+            language=OuterRef('language'),
+    )
+    qs = Translation.objects.filter(language=language)
+    if glossary_id is not None:
+        qs = qs.filter(concept__glossary=glossary_id)
+    qs = qs.annotate(definition=Subquery(definition.values('text')))
+    qs = qs.select_related('concept').order_by('concept_id', 'id')
+    matches = []
+    for batch in chunks(sorted(keys), query_params_limit(qs.db) - 2):
+        matches.extend(qs.filter(search_key__in=batch))
+
+    others = Translation.objects.order_by('id')
+    if target_language:
+        others = others.filter(language=target_language)
+    else:
+        others = others.exclude(language=language)
+    prefetch_in_batches(matches, Prefetch(
+            'concept__translation_set', queryset=others, to_attr='others'))
+
+    found = dict((term, []) for term in terms)
+    for translation in matches:
+        match = term_json(translation)
+        match['concept'] = translation.concept_id
+        match['glossary'] = translation.concept.glossary_id
+        match['definition'] = translation.definition
+        match['translations'] = [
+            term_json(other)
+            for other in sorted(translation.concept.others, key=lambda t: t.cmp_key())
+        ]
+        for term in keys[translation.search_key]:
+            found[term].append(match)
+    return JsonResponse({'results': [
+        {'term': term, 'matches': found[term]} for term in terms
+    ]})
+
+
+@csrf_exempt
+@require_POST
+def spot(request):
+    """Find the terms of a glossary that occur in a text.
+
+    The body is a JSON object with "text", "glossary", "language" and
+    optionally "target_language". See terminator.termspotting.spot_terms()
+    for the answer. The text may be several megabytes long, up to the
+    TERM_SPOTTING_MAX_LENGTH setting, so the body is read from the stream
+    instead of request.body, which DATA_UPLOAD_MAX_MEMORY_SIZE limits.
+    """
+    max_length = getattr(settings, 'TERM_SPOTTING_MAX_LENGTH', 16 * 1024 * 1024)
+    # Escaped JSON takes at most six bytes per character
+    if int(request.META.get('CONTENT_LENGTH') or 0) > 6 * max_length + 1024:
+        return HttpResponseBadRequest(_("The text must be at most %d characters long.") % max_length)
+    try:
+        data = json.loads(request.read().decode('utf-8'))
+        text = data['text']
+        glossary_id = data['glossary']
+        language = data['language']
+        target_language = data.get('target_language')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return HttpResponseBadRequest(_("The request must be a JSON object with a text, a glossary and a language."))
+    if not isinstance(text, six.string_types) or not isinstance(glossary_id, int):
+        return HttpResponseBadRequest(_("The text must be a string and the glossary a number."))
+    if len(text) > max_length:
+        return HttpResponseBadRequest(_("The text must be at most %d characters long.") % max_length)
+    if not valid_languages(language, target_language):
+        return HttpResponseBadRequest(_("The languages must be language codes."))
+    glossary = get_object_or_404(Glossary, pk=glossary_id)
+    matches = spot_terms(text, glossary, language, target_language)
+    return JsonResponse({'matches': matches})
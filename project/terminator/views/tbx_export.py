@@ -0,0 +1,524 @@
+# -*- coding: UTF-8 -*-
+#
+# Copyright 2011, 2013 Leandro Regueiro
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+from itertools import groupby, islice
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.admin.models import DELETION
+from django.contrib.auth.decorators import login_required
+from django.db.models import Q
+from django.http import (FileResponse, Http404, HttpResponseBadRequest,
+                         StreamingHttpResponse)
+from django.template import loader
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_text
+from django.utils.translation import get_language, ugettext_lazy as _
+
+from terminator.models import *
+from terminator.utils import chunks, prefetch_in_batches, query_params_limit
+
+
+def key_func(obj):
+    return (obj.concept_id, obj.language_id)
+
+
+def query_lookup_dict(qs):
+    results = {}
+    for key, group in groupby(qs, key_func):
+        results[key] = list(group)
+    return results
+
+
+class ConceptWindows(object):
+    """Reads the concepts to export together with their data, a window at a
+    time.
+
+    The concepts of every glossary are read in id order, window_size at a
+    time. The translations, definitions, resources and summaries of a window
+    are then read with one query each over the same range of concept ids, so
+    only the data of one window is in memory at a time, however big the
+    glossaries are.
+
+    If concept_ids is given, only those concepts are read, and their data is
+    read by concept id instead of by range.
+    """
+    window_size = 500
+
+    def __init__(self, glossaries, translations, definitions, resources, summaries, concept_ids=None):
+        self.glossaries = sorted(glossaries, key=lambda g: g.pk)
+        self.translations = translations
+        self.definitions = definitions
+        self.resources = resources
+        self.summaries = summaries
+        self.concept_ids = concept_ids
+
+    def __iter__(self):
+        for glossary in self.glossaries:
+            concepts = Concept.objects.filter(glossary=glossary).select_related(
+                    'broader_concept',
+                    'subject_field',
+            )
+            if self.concept_ids is not None:
+                for ids in chunks(sorted(self.concept_ids), self.window_size):
+                    window = list(concepts.filter(id__in=ids).order_by('id'))
+                    if window:
+                        yield window, self.window_data(glossary, window)
+                continue
+            last_id = 0
+            while True:
+                window = list(concepts.filter(id__gt=last_id).order_by('id')[:self.window_size])
+                if not window:
+                    break
+                last_id = window[-1].pk
+                yield window, self.window_data(glossary, window)
+
+    def rows(self, qs, glossary, window):
+        if self.concept_ids is not None:
+            qs = qs.filter(concept_id__in=[concept.pk for concept in window])
+        else:
+            qs = qs.filter(
+                    concept__glossary=glossary,
+                    concept_id__gte=window[0].pk,
+                    concept_id__lte=window[-1].pk,
+            )
+        return qs.order_by('concept_id', 'language_id', 'id')
+
+    def window_data(self, glossary, window):
+        """Returns lookup dictionaries of (concept id, language id) -> rows
+        for translations, definitions, resources and summaries."""
+        translations = list(self.rows(self.translations, glossary, window))
+        prefetch_in_batches(translations, "corpusexample_set", "contextsentence_set")
+        return (
+            query_lookup_dict(translations),
+            query_lookup_dict(self.rows(self.definitions, glossary, window)),
+            query_lookup_dict(self.rows(self.resources, glossary, window)),
+            query_lookup_dict(self.rows(self.summaries, glossary, window)),
+        )
+
+
+class ExportCache(object):
+    """Rendered TBX exports stored on disk.
+
+    An export is stored under a key made from the glossaries with their
+    versions, the export options and the language of the user, so a changed
+    glossary never matches an older export. Once the stored exports take more
+    than max_size bytes, the least recently used ones are removed.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    @classmethod
+    def from_settings(cls):
+        directory = getattr(settings, "TBX_EXPORT_CACHE_DIR", None)
+        if not directory:
+            return None
+        max_size = getattr(settings, "TBX_EXPORT_CACHE_SIZE", 100 * 1024 * 1024)
+        return cls(directory, max_size)
+
+    def key(self, glossaries, desired_languages, export_all_definitions, export_terms):
+        options = repr((
+            sorted((glossary.pk, glossary.version) for glossary in glossaries),
+            sorted(force_text(getattr(language, 'pk', language)) for language in desired_languages),
+            bool(export_all_definitions),
+            force_text(export_terms),
+            # The export of several glossaries has translated headers.
+            get_language(),
+        ))
+        return hashlib.sha1(options.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".tbx")
+
+    def open(self, key):
+        """Returns the stored export as an open file, or None."""
+        path = self.path(key)
+        try:
+            f = open(path, 'rb')
+        except (IOError, OSError):
+            return None
+        try:
+            # The modification time tells which exports were used last.
+            os.utime(path, None)
+        except OSError:
+            pass
+        return f
+
+    def store(self, key, parts):
+        """Pass through the parts of an export while writing them to disk.
+
+        The export is only stored once all of it was written, so an
+        interrupted download doesn't leave a truncated export behind.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for part in parts:
+                    part = part.encode('utf-8')
+                    f.write(part)
+                    yield part
+            os.rename(temp_path, self.path(key))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        exports = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".tbx"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            exports.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for mtime, size, path in exports)
+        for mtime, size, path in sorted(exports):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Another process removed it already.
+                pass
+            total_size -= size
+
+
+def set_filename(response, glossaries):
+    if len(glossaries) == 1:
+        from django.utils.six.moves.urllib_parse import quote
+        encoded_name = b"%s.tbx" % quote(glossaries[0].name).encode('utf-8')
+        response['Content-Disposition'] = "attachment; filename=\"%s\"; filename*=UTF-8''%s" % (encoded_name, encoded_name)
+        # http://test.greenbytes.de/tech/tc2231/
+        # The encoding of filename is wrong, but seems like it will trigger the
+        # right bugs in older browsers that don't support filename* to actually
+        # display the right filename.
+    else:
+        response['Content-Disposition'] = 'attachment; filename=terminator_several_exported_glossaries.tbx'
+    return response
+
+
+def export_glossaries_to_TBX(glossaries, desired_languages=None, export_all_definitions=False, export_terms="all"):
+    if desired_languages is None:
+        desired_languages = []
+    if not glossaries:
+        raise Http404
+
+    cache = ExportCache.from_settings()
+    if cache:
+        cache_key = cache.key(glossaries, desired_languages, export_all_definitions, export_terms)
+        cached_export = cache.open(cache_key)
+        if cached_export:
+            response = FileResponse(cached_export, content_type='application/x-tbx')
+            return set_filename(response, glossaries)
+
+    data = export_data(glossaries, desired_languages, export_all_definitions, export_terms)
+
+    #TODO:
+    # Raise Http404 if there are no concepts in the resulting glossary
+    #if not data['concepts']:
+    #    raise Http404
+    # Important enough? Can't easily do with generator.
+
+    # Create the response object with the appropriate header. The
+    # document is sent while it is rendered, so that big exports don't have
+    # to fit in memory.
+    content = render_tbx(data)
+    if cache:
+        content = cache.store(cache_key, content)
+    response = StreamingHttpResponse(content, content_type='application/x-tbx')
+    return set_filename(response, glossaries)
+
+
+def export_data(glossaries, desired_languages, export_all_definitions=False, export_terms="all", concept_ids=None):
+    """Returns the data for the export templates.
+
+    The concepts are a generator, so that they are only read from the
+    database while the export is rendered. If concept_ids is given, only
+    those concepts are exported.
+    """
+    if len(glossaries) == 1:
+        glossary_data = glossaries[0]
+    else:
+        glossary_description = _("TBX file created by exporting the following "
+                                 "glossaries: ")
+        glossaries_names_list = []
+        for gloss in glossaries:
+            glossaries_names_list.append(gloss.name)
+        glossary_description += ", ".join(glossaries_names_list)
+        glossary_data = {
+            "name": _("Terminator TBX exported glossary"),
+            "description": glossary_description,
+        }
+    data = {
+        'glossary': glossary_data,
+        'concepts': [],
+    }
+
+    preferred = AdministrativeStatus.objects.get(name="Preferred")
+    admitted = AdministrativeStatus.objects.get(name="Admitted")
+    not_recommended = AdministrativeStatus.objects.get(name="Not recommended")
+
+    concept_qs = Concept.objects.filter(glossary__in=glossaries)
+
+    #Give template an indication of whether any related concepts are used:
+    data["use_related_concepts"] = Concept.objects.filter(
+            related_concepts__id__in=concept_qs,
+    ).exists()
+
+    translation_filter = Q()
+    if export_terms == 'preferred':
+        translation_filter |= Q(administrative_status=preferred)
+    elif export_terms == 'preferred+admitted':
+        translation_filter |= Q(administrative_status=preferred)
+        translation_filter |= Q(administrative_status=admitted)
+    elif export_terms == 'preferred+admitted+not_recommended':
+        translation_filter |= Q(administrative_status__in=(preferred, admitted, not_recommended))
+
+    # Only the finished summary messages are exported
+    summary_filter = Q(is_finalized=True)
+    definition_filter = Q()
+    if not export_all_definitions:
+        definition_filter &= Q(is_finalized=True)
+
+    # Assume that there is at least a term or a definition for a used language.
+    glossary_filter = Q(concept__glossary__in=glossaries)
+    translations = Translation.objects.filter(glossary_filter & translation_filter)
+    definitions = Definition.objects.filter(glossary_filter & definition_filter)
+    used_languages = set(translations.values_list('language', flat=True).distinct())
+    used_languages.update(definitions.values_list('language', flat=True).distinct())
+    used_languages.difference_update(set(desired_languages))
+    used_languages = sorted(used_languages)
+
+    translations = translations.select_related(
+            'part_of_speech',
+            'grammatical_number',
+            'grammatical_gender',
+            'administrative_status',
+            'administrative_status_reason',
+    )
+    resources = ExternalResource.objects.filter(glossary_filter)
+    summaries = ConceptInLanguage.objects.filter(glossary_filter & summary_filter).only('concept', 'language', 'summary')
+    windows = ConceptWindows(glossaries, translations, definitions, resources, summaries, concept_ids)
+
+    def generate_concepts():
+        #generator so that we don't keep things in memory
+        for window, (tr_dict, def_dict, resource_dict, summary_dict) in windows:
+            for concept in window:
+                concept_data = {
+                    'concept': concept,
+                    'languages': [],
+                    'externalresources': resource_dict.get((concept.id, None), [])
+                }
+
+                for language_code in used_languages:
+                    key = (concept.id, language_code)
+
+                    lang_translations = tr_dict.get(key, [])
+                    lang_resources = resource_dict.get(key, [])
+
+                    lang_summary_message = summary_dict.get(key, None)
+                    if lang_summary_message:
+                        assert len(lang_summary_message) == 1
+                        lang_summary_message = lang_summary_message[0].summary
+
+                    lang_definition = def_dict.get(key, None)
+                    if lang_definition:
+                        assert len(lang_definition) == 1
+                        lang_definition = lang_definition[0]
+
+                    if not any((lang_translations, lang_resources, lang_definition, lang_summary_message)):
+                        # no real content
+                        continue
+
+                    lang_data = {
+                        'iso_code': language_code,
+                        'translations': lang_translations,
+                        'externalresources': lang_resources,
+                        'definition': lang_definition,
+                        'summarymessage': lang_summary_message,
+                    }
+                    concept_data['languages'].append(lang_data)
+                if concept_data['languages']:
+                    yield concept_data
+
+    data['concepts'] = generate_concepts()
+    return data
+
+
+def render_tbx(data, chunk_size=100):
+    """Render the TBX document in parts, chunk_size concepts at a time."""
+    yield loader.render_to_string('export_header.tbx', {'data': data})
+    concepts_template = loader.get_template('export_concepts.tbx')
+    concepts = iter(data['concepts'])
+    chunk = list(islice(concepts, chunk_size))
+    while chunk:
+        yield concepts_template.render({'data': data, 'concepts': chunk})
+        chunk = list(islice(concepts, chunk_size))
+    yield loader.render_to_string('export_footer.tbx', {'data': data})
+
+
+def changed_concepts(glossaries, since):
+    """Find the concepts that changed since the given time.
+
+    Returns the ids of the concepts in the glossaries that were added or
+    changed, and the ids of the concepts that were deleted from them. Changes
+    are found through ConceptInLanguage.date, the definition history and the
+    GlossaryActivity of the admin and the concept pages.
+    """
+    concepts = Concept.objects.filter(glossary__in=glossaries)
+    changed = set(concepts.filter(id__in=ConceptInLanguage.objects.filter(
+            date__gte=since,
+    ).values('concept')).values_list('id', flat=True))
+    changed.update(concepts.filter(id__in=Definition.history.filter(
+            history_date__gte=since,
+    ).values('concept')).values_list('id', flat=True))
+
+    activity = GlossaryActivity.objects.filter(
+            glossary__in=glossaries,
+            action_time__gte=since,
+    )
+    # The activity of a deleted concept has no concept any more, but its
+    # glossary is kept.
+    changed.update(concepts.filter(id__in=activity.filter(
+            concept__isnull=False,
+    ).values('concept')).values_list('id', flat=True))
+    deleted = set(int(object_id) for object_id in activity.filter(
+            content_type=ContentType.objects.get_for_model(Concept),
+            action_flag=DELETION,
+    ).values_list('log_entry__object_id', flat=True))
+    # Only report deleted concepts that are really gone.
+    for ids in chunks(sorted(deleted), query_params_limit()):
+        deleted.difference_update(Concept.objects.filter(id__in=ids).values_list('id', flat=True))
+    return changed, deleted
+
+
+def tbx_representation(obj):
+    if obj is None:
+        return None
+    return obj.tbx_representation
+
+
+def concept_json(concept_data):
+    """A dictionary with the exported data of a concept, for JSON."""
+    concept = concept_data['concept']
+    languages = {}
+    for lang_data in concept_data['languages']:
+        definition = lang_data['definition']
+        if definition:
+            definition = {
+                'text': definition.text,
+                'source': definition.source,
+                'is_finalized': definition.is_finalized,
+            }
+        languages[lang_data['iso_code']] = {
+            'terms': [{
+                'id': translation.pk,
+                'text': translation.translation_text,
+                'part_of_speech': tbx_representation(translation.part_of_speech),
+                'grammatical_gender': tbx_representation(translation.grammatical_gender),
+                'grammatical_number': tbx_representation(translation.grammatical_number),
+                'administrative_status': tbx_representation(translation.administrative_status),
+                'is_finalized': translation.is_finalized,
+                'note': translation.note,
+            } for translation in lang_data['translations']],
+            'definition': definition,
+            'summary': lang_data['summarymessage'] or None,
+            'resources': [resource_json(r) for r in lang_data['externalresources']],
+        }
+    return {
+        'id': concept.pk,
+        'glossary': concept.glossary_id,
+        'subject_field': concept.subject_field_id,
+        'broader_concept': concept.broader_concept_id,
+        'resources': [resource_json(r) for r in concept_data['externalresources']],
+        'languages': languages,
+    }
+
+
+def resource_json(resource):
+    return {
+        'address': resource.address,
+        'link_type': resource.link_type_id,
+        'description': resource.description,
+    }
+
+
+def render_changes_json(data, until):
+    """Render the changed and deleted concepts as a JSON document in parts."""
+    yield '{"until": %s, "deleted": %s, "concepts": [' % (
+        json.dumps(until.isoformat()),
+        json.dumps(sorted(data['deleted_concepts'])),
+    )
+    separator = ''
+    for concept_data in data['concepts']:
+        yield separator + json.dumps(concept_json(concept_data))
+        separator = ', '
+    yield ']}'
+
+
+@login_required
+def export_changes(request):
+    """Export only the concepts changed since a given time.
+
+    The glossary parameter can be given several times, and since is an ISO
+    8601 date and time. The response carries the time up to which changes
+    were included, to use as since in the next request. Deleted concepts are
+    marked explicitly. The format can be "tbx" or "json".
+    """
+    glossaries = list(Glossary.objects.filter(pk__in=[
+        pk for pk in request.GET.getlist('glossary') if pk.isdigit()
+    ]))
+    if not glossaries:
+        raise Http404
+    try:
+        since = parse_datetime(request.GET.get('since', ''))
+    except ValueError:
+        # Well formatted, but not a valid date, like month 13
+        since = None
+    if since is None:
+        return HttpResponseBadRequest(_("The since parameter must be a date and time."))
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    export_format = request.GET.get('format', 'tbx')
+    if export_format not in ('tbx', 'json'):
+        return HttpResponseBadRequest(_("The format must be tbx or json."))
+
+    # Changes made while the export runs might be exported twice, but none
+    # are lost.
+    until = timezone.now()
+    changed, deleted = changed_concepts(glossaries, since)
+    data = export_data(glossaries, [], concept_ids=changed)
+    data['deleted_concepts'] = sorted(deleted)
+
+    if export_format == 'json':
+        response = StreamingHttpResponse(render_changes_json(data, until), content_type='application/json')
+    else:
+        response = set_filename(StreamingHttpResponse(render_tbx(data), content_type='application/x-tbx'), glossaries)
+    response['X-Terminator-Changes-Until'] = until.isoformat()
+    return response
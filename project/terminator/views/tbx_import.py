@@ -17,29 +17,39 @@
 # You should have received a copy of the GNU General Public License along with
 # Terminator. If not, see <http://www.gnu.org/licenses/>.
 
-from xml.dom import minidom
+import uuid
+from datetime import timedelta
+from xml.etree import ElementTree
 
+from django.conf import settings
 from django.contrib.admin.models import LogEntry, ADDITION
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
-from django.shortcuts import render
+from django.core.exceptions import PermissionDenied
+from django.db import DatabaseError, transaction
+from django.shortcuts import get_object_or_404, redirect, render
 from django.utils.encoding import force_text
+from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
 from django.views.decorators.csrf import csrf_protect
 
 from terminator.forms import ImportForm, SearchForm
 from terminator.models import *
+from terminator.utils import update_in_bulk
 
 
-def getText(nodelist):
+# ElementTree reports the xml:lang attribute with the expanded namespace.
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+
+def getText(element):
     """
-    Extract the stripped text from all text nodes in a node list.
+    Extract the stripped text directly inside an element, ignoring the text
+    of its child elements.
     This is used for getting the text from text nodes in TBX files.
     """
-    rc = u""
-    for node in nodelist:
-        if node.nodeType == node.TEXT_NODE:
-            rc += node.data
+    rc = element.text or u""
+    for child in element:
+        rc += child.tail or u""
     return rc.strip()
 
 
@@ -50,57 +60,135 @@ def lookup_dict(model, values=True):
     return dict((x.tbx_representation.lower(), x) for x in qs)
 
 
-def import_uploaded_file(uploaded_file, imported_glossary):
-    #TODO Split this function in several shorter functions.
-    #TODO Validate the uploaded file in order to check that it is a valid TBX
-    # file, or even a text file.
-    #TODO Use lxml/etree instead of xml.dom.minidom.
-    tbx_file = minidom.parse(uploaded_file)
-
-    #TODO Perhaps add the title and description from the TBX file to the
-    # glossary instead of using the ones provided in the import form. Or maybe
-    # just append the TBX values (if provided) to the description (only the
-    # description) provided in the import form.
-
-    #glossary_name = getText(tbx_file.getElementsByTagName(u"title")[0].childNodes)
-    #glossary_description = getText(tbx_file.getElementsByTagName(u"p")[0].childNodes)
-    #imported_glossary.name = glossary_name
-    #imported_glossary.description = glossary_description
-    #imported_glossary.save()
-
-    # Keep all of these in memory for repeated use.
-    languages = set(Language.objects.all().values_list('iso_code', flat=True))
-    parts_of_speech = lookup_dict(PartOfSpeech)
-    admin_statusses = lookup_dict(AdministrativeStatus, values=False)
-    genders = lookup_dict(GrammaticalGender)
-    numbers = lookup_dict(GrammaticalNumber)
-    link_types = lookup_dict(ExternalLinkType)
-
-    concept_object = None
-    concept_list = []
-    concept_pool = {}
-    language_pool = set()
-    for concept_tag in tbx_file.getElementsByTagName(u"termEntry"):
-        concept_id = concept_tag.getAttribute(u"id")
-        # The concept id should be unique on all the TBX file.
-        if concept_id in concept_pool:
-            excp_msg = (_("There is already another \"%s\" tag with an "
-                          "\"%s\" attribute with the value \"%s\" in the "
-                          "TBX file.") %
-                        ("termEntry", "id", concept_id))
-            excp_msg += force_text(_("\n\nIf you want to import this TBX file"
-                                  " you must fix this in the TBX file."))
-            raise Exception(excp_msg)
-        concept_object = Concept(glossary=imported_glossary)
-        concept_object.save()
-        concept_pool_entry = {"object": concept_object}
+def iter_term_entries(tbx_file):
+    """Yield the termEntry elements of a TBX file one by one.
+
+    The file is parsed incrementally, and every termEntry is dropped from the
+    tree once the consumer is done with it, so that memory use doesn't depend
+    on the size of the file.
+
+    Newer TBX files put all their elements in a default namespace (for
+    example urn:iso:std:iso:30042:ed-2), so the namespace is stripped from
+    the tags to find the same elements as in files without a namespace.
+    """
+    ancestors = []
+    for event, element in ElementTree.iterparse(tbx_file, events=("start", "end")):
+        if event == "start":
+            if element.tag.startswith(u"{"):
+                element.tag = element.tag.split(u"}", 1)[1]
+            ancestors.append(element)
+            continue
+        ancestors.pop()
+        if element.tag == u"termEntry":
+            yield element
+            element.clear()
+            if ancestors:
+                ancestors[-1].remove(element)
+
+
+class TBXImporter(object):
+    """Imports the concepts in a TBX file into a glossary.
+
+    Every termEntry is parsed into unsaved model instances by parse_concept()
+    and then written by save_concept() before the next termEntry is read. Only
+    the TBX ids and the concept relationships are kept until the end of the
+    file, since termEntries can refer to termEntries that come later.
+
+    Every concept is written in its own short transaction. If progress is
+    given, it is called with the importer every now and then, and after every
+    phase of the import, so that the counters can be reported.
+    """
+    # How many concepts to parse between progress reports
+    progress_interval = 100
+
+    def __init__(self, glossary, progress=None):
+        self.glossary = glossary
+        self.progress = progress
+        self.concepts_parsed = 0
+        self.terms_inserted = 0
+        self.relations_resolved = 0
+        # Keep all of these in memory for repeated use.
+        self.languages = set(Language.objects.all().values_list('iso_code', flat=True))
+        self.parts_of_speech = lookup_dict(PartOfSpeech)
+        self.admin_statusses = lookup_dict(AdministrativeStatus, values=False)
+        self.genders = lookup_dict(GrammaticalGender)
+        self.numbers = lookup_dict(GrammaticalNumber)
+        self.link_types = lookup_dict(ExternalLinkType)
+
+        # TBX id -> concept id for all the concepts that have a TBX id
+        self.concept_ids = {}
+        # TBX id -> subject, broader and related TBX ids, if any
+        self.concept_relations = {}
+        self.language_pool = set()
+
+    def run(self, tbx_file):
+        #TODO Validate the uploaded file in order to check that it is a valid
+        # TBX file, or even a text file.
+
+        #TODO Perhaps add the title and description from the TBX file to the
+        # glossary instead of using the ones provided in the import form. Or
+        # maybe just append the TBX values (if provided) to the description
+        # (only the description) provided in the import form.
+        for concept_tag in iter_term_entries(tbx_file):
+            tbx_id = concept_tag.get(u"id", u"")
+            # The concept id should be unique on all the TBX file.
+            if tbx_id in self.concept_ids:
+                excp_msg = (_("There is already another \"%s\" tag with an "
+                              "\"%s\" attribute with the value \"%s\" in the "
+                              "TBX file.") %
+                            ("termEntry", "id", tbx_id))
+                excp_msg += force_text(_("\n\nIf you want to import this TBX file"
+                                      " you must fix this in the TBX file."))
+                raise Exception(excp_msg)
+            entry = self.parse_concept(concept_tag, tbx_id)
+            if tbx_id:
+                # The concept id is filled in once the concept is saved.
+                self.concept_ids[tbx_id] = None
+                if entry["relations"]:
+                    self.concept_relations[tbx_id] = entry["relations"]
+            self.save_concept(entry)
+            self.concepts_parsed += 1
+            if self.concepts_parsed % self.progress_interval == 0:
+                self.report_progress()
+        self.flush()
+        self.report_progress()
+        self.save_languages()
+        with transaction.atomic():
+            self.save_relations()
+        # Bulk inserts and updates don't send the signals that keep the
+        # glossary version up to date.
+        defer_glossary_version_update(glossary_ids=[self.glossary.pk], terms=True)
+        self.report_progress()
+
+    def report_progress(self):
+        if self.progress:
+            self.progress(self)
+
+    def parse_concept(self, concept_tag, concept_id):
+        """Parse a termEntry into a dictionary of unsaved model instances."""
+        # The parent of every element inside this termEntry, since
+        # ElementTree doesn't keep track of it.
+        parents = dict((child, parent) for parent in concept_tag.iter() for child in parent)
+        concept_object = Concept(glossary=self.glossary)
+        entry = {
+            "tbx_id": concept_id,
+            "concept": concept_object,
+            "relations": {},
+            "definitions": [],
+            "resources": [],
+            # (translation, context sentences, corpus examples)
+            "translations": [],
+            # for the repr_cache, once the concept has an id
+            "src_translations": [],
+        }
+        relations = entry["relations"]
 
         # Get the subject field and broader concept for the current
         # termEntry tag.
         # NOTE: Be careful because the following returns all the descrip
         # tags, even from langSet or lower levels.
-        for descrip_tag in concept_tag.getElementsByTagName(u"descrip"):
-            if descrip_tag.getAttribute("type") == "subjectField":
+        for descrip_tag in concept_tag.iter(u"descrip"):
+            if descrip_tag.get(u"type") == u"subjectField":
                 # Only accept subjectFields that are inside a descripGrp
                 # and that have a sibling ref tag pointing to a concept.
                 # NOTE: This means that the subjectFields are other
@@ -109,39 +197,29 @@ def import_uploaded_file(uploaded_file, imported_glossary):
                 #TODO Consider if it would be worth raising an exception
                 # with an explanatory message in the case that it is not
                 # inside a descripGrp tag.
-                if descrip_tag.parentNode.tagName == "descripGrp":
-                    ref_tags = descrip_tag.parentNode.getElementsByTagName(u"ref")
-                    if ref_tags:
+                if parents[descrip_tag].tag == u"descripGrp":
+                    ref_tag = parents[descrip_tag].find(u".//ref")
+                    if ref_tag is not None:
                         # Only the first ref tag in the descripGrp is used.
-                        concept_pool_entry["subject"] = ref_tags[0].getAttribute(u"target")
-            if descrip_tag.getAttribute(u"type") == u"broaderConceptGeneric":
-                broader = descrip_tag.getAttribute(u"target")
+                        relations["subject"] = ref_tag.get(u"target", u"")
+            if descrip_tag.get(u"type") == u"broaderConceptGeneric":
+                broader = descrip_tag.get(u"target")
                 if broader:
-                    concept_pool_entry["broader"] = broader
+                    relations["broader"] = broader
 
         # Get the related concepts information for the current termEntry.
-        concept_pool_entry["related"] = []
-        for ref_tag in concept_tag.getElementsByTagName(u"ref"):
-            if ref_tag.getAttribute(u"type") == u"crossReference":
-                # The crossReference should be just below the termEntry tag.
-                if ref_tag.parentNode == concept_tag:
-                    related_key = ref_tag.getAttribute(u"target")
-                    if related_key:
-                        concept_pool_entry["related"].append(related_key)
-        # If the termEntry has no related concepts remove the key related
-        # from concept_pool_entry.
-        if not concept_pool_entry["related"]:
-            concept_pool_entry.pop("related")
-
-        concept_list.append(concept_object)
-        # Save all the concept relations for setting them when the TBX file
-        # is fully readed.
-        if concept_id:
-            concept_pool[concept_id] = concept_pool_entry
-
-        src_translations = []
-        for language_tag in concept_tag.getElementsByTagName(u"langSet"):
-            lang_id = language_tag.getAttribute(u"xml:lang")
+        # The crossReference should be just below the termEntry tag.
+        related = []
+        for ref_tag in concept_tag.findall(u"ref"):
+            if ref_tag.get(u"type") == u"crossReference":
+                related_key = ref_tag.get(u"target")
+                if related_key:
+                    related.append(related_key)
+        if related:
+            relations["related"] = related
+
+        for language_tag in concept_tag.iter(u"langSet"):
+            lang_id = language_tag.get(XML_LANG)
             if not lang_id:
                 excp_msg = (_("\"%s\" tag without \"%s\" attribute in "
                               "concept \"%s\".") %
@@ -150,7 +228,7 @@ def import_uploaded_file(uploaded_file, imported_glossary):
                                       "file you must add that attribute "
                                       "to that tag in the TBX file."))
                 raise Exception(excp_msg)
-            if lang_id not in languages:
+            if lang_id not in self.languages:
                 excp_msg = (_("\"%s\" tag with code \"%s\" in its \"%s\" "
                               "attribute, found in concept \"%s\", but "
                               "there is no Language with that code in "
@@ -164,311 +242,346 @@ def import_uploaded_file(uploaded_file, imported_glossary):
                                     ("xml:lang", "langSet"))
                 raise Exception(excp_msg)
 
-            language_pool.add(lang_id)
-            # Get the definition for each language.
-            # NOTE: Be careful because the following returns all the
-            # descrip tags, and not all of them are definitions.
-            for descrip_tag in language_tag.getElementsByTagName(u"descrip"):
-                descrip_type = descrip_tag.getAttribute(u"type")
-                if descrip_type == u"definition":
-                    definition_text = getText(descrip_tag.childNodes)
-                    if definition_text:
-                        definition_object = Definition(
-                                concept=concept_object,
-                                language_id=lang_id,
-                                text=definition_text,
-                                is_finalized=False,
-                        )
-                        definition_object._history_user = None
-                        # If the definition is inside a descripGrp tag, it
-                        # may have a source.
-                        if descrip_tag.parentNode.tagName == "descripGrp":
-                            definition_source_list = descrip_tag.parentNode.getElementsByTagName(u"xref")
-                            if definition_source_list:
-                                #TODO There is no check to see if this xref
-                                # xref tag has type="xSource".
-                                definition_object.source = definition_source_list[0].getAttribute(u"target")
-                        definition_object.save()
-                    # Each langSet should have at most one definition, and
-                    # since Terminator doesn't import other descrip tags at
-                    # langSet level then stop looping.
-                    break
-
-            # Get the external resources for each language.
-            for xref_tag in language_tag.getElementsByTagName(u"xref"):
-                # If the xref tag is a child of the langSet tag, or in
-                # other words, if the xref tag is not inside a descripGrp
-                # tag alongside a definition in order to provide the source
-                # for that definition.
-                if xref_tag.parentNode == language_tag:
-                    resource_type = xref_tag.getAttribute(u"type").lower()
-                    try:
-                        resource_link_type = link_types[resource_type]
-                    except KeyError:
-                        excp_msg = (_("External Link Type \"%s\", found "
-                                      "inside a \"%s\" tag in the \"%s\" "
-                                      "language in concept \"%s\", doesn't"
-                                      " exist in Terminator.") %
-                                    (resource_type, "xref", lang_id,
-                                     concept_id))
-                        excp_msg += force_text(_("\n\nIf you want to import "
-                                              "this TBX file, either add "
-                                              "this External Link Type to "
-                                              "Terminator, or change this "
-                                              "External Link Type on the "
-                                              "TBX file."))
-                        raise Exception(excp_msg)
-                    resource_target = xref_tag.getAttribute(u"target")
-                    resource_description = getText(xref_tag.childNodes)
-                    # TODO If resource_description doesn't exist raise an
-                    # exception.
-                    if resource_target and resource_description:
-                        external_resource_object = ExternalResource(
-                                concept=concept_object,
-                                language_id=lang_id,
-                                address=resource_target,
-                                link_type_id=resource_link_type,
-                                description=resource_description,
-                        )
-                        external_resource_object.save()
+            self.language_pool.add(lang_id)
+            entry["definitions"].extend(self.parse_definition(language_tag, lang_id, concept_object, parents))
+            entry["resources"].extend(self.parse_resources(language_tag, lang_id, concept_object, concept_id))
 
             # Get the translations and related data for each language.
-            tig_tags = language_tag.getElementsByTagName(u"tig")
             #TODO Make the import work for ntig tags too.
-
-            for translation_tag in tig_tags:
-                term_tags = translation_tag.getElementsByTagName(u"term")
-                # Proceed only if there is at least one term tag inside
-                # this tig or ntig tag.
-                if not term_tags:
+            for translation_tag in language_tag.iter(u"tig"):
+                translation = self.parse_translation(translation_tag, lang_id, concept_object, concept_id, parents)
+                if translation is None:
                     continue
+                entry["translations"].append(translation)
+                if lang_id == self.glossary.source_language_id:
+                    entry["src_translations"].append(translation[0])
+        return entry
 
-                # The next line only works with the first term tag
-                # skipping other term tags if present.
-                translation_text = getText(term_tags[0].childNodes)
-                if translation_text:
-                    translation_object = Translation(
-                            concept=concept_object,
-                            language_id=lang_id,
-                            translation_text=translation_text,
-                    )
-                    if lang_id == imported_glossary.source_language_id:
-                        src_translations.append(translation_object)
-
-                for termnote_tag in translation_tag.getElementsByTagName(u"termNote"):
-                    termnote_type = termnote_tag.getAttribute(u"type")
-                    #TODO the Parts of Speech, Grammatical Genders,
-                    # Grammatical Numbers, Administrative Statuses and
-                    # Administrative Status Reasons specified in the
-                    # TBX file may not exist in the Terminator
-                    # database, so the import process will fail. Maybe
-                    # it should create those missing entities, but it
-                    # may fill the database with duplicates.
-                    #TODO the Parts of Speech, Grammatical Genders,
-                    # Grammatical Numbers, Administrative Statuses and
-                    # Administrative Status Reasons can only be used
-                    # for certain languages, and the actual importing
-                    # code doesn't respect these constraints.
-                    if termnote_type == u"partOfSpeech":
-                        #TODO Since in some TBX files the Part of
-                        # Speech is capitalized it should be converted
-                        # to lowercase in the next line in order to get
-                        # the Part of Speech import working.
-                        pos_text = getText(termnote_tag.childNodes)
-                        try:
-                            pos_id = parts_of_speech[pos_text.lower()]
-                        except KeyError:
-                            raise Exception(_("Part of Speech \"%s\", "
-                                              "found in \"%s\" "
-                                              "translation for \"%s\" "
-                                              "language in concept "
-                                              "\"%s\", doesn't exist "
-                                              "in Terminator.\n\nIf "
-                                              "you want to import this"
-                                              " TBX file, either add "
-                                              "this Part of Speech to "
-                                              "Terminator, or change "
-                                              "this Part of Speech on "
-                                              "the TBX file.") %
-                                            (pos_text,
-                                             translation_text,
-                                             lang_id, concept_id))
-
-                        translation_object.part_of_speech_id = pos_id
-                    elif termnote_type == u"grammaticalGender":
-                        gramm_gender_text = getText(termnote_tag.childNodes)
-                        try:
-                            gender_id = genders[gramm_gender_text.lower()]
-                        except KeyError:
-                            raise Exception(_("Grammatical Gender "
-                                              "\"%s\", found in \"%s\""
-                                              " translation for \"%s\""
-                                              " language in concept "
-                                              "\"%s\", doesn't exist "
-                                              "in Terminator.\n\nIf "
-                                              "you want to import this"
-                                              " TBX file, either add "
-                                              "this Grammatical Gender"
-                                              " to Terminator, or "
-                                              "change this Grammatical"
-                                              " Gender on the TBX "
-                                              "file.") %
-                                            (gramm_gender_text,
-                                             translation_text,
-                                             lang_id, concept_id))
-                        translation_object.grammatical_gender_id = gender_id
-                    elif termnote_type == u"grammaticalNumber":
-                        gramm_number_text = getText(termnote_tag.childNodes)
-                        try:
-                            number_id = numbers[gramm_number_text.lower()]
-                        except KeyError:
-                            raise Exception(_("Grammatical Number "
-                                              "\"%s\", found in \"%s\""
-                                              " translation for \"%s\""
-                                              " language in concept "
-                                              "\"%s\", doesn't exist "
-                                              "in Terminator.\n\nIf "
-                                              "you want to import this"
-                                              " TBX file, either add "
-                                              "this Grammatical Number"
-                                              " to Terminator, or "
-                                              "change this Grammatical"
-                                              " Number on the TBX "
-                                              "file.") %
-                                            (gramm_number_text,
-                                             translation_text,
-                                             lang_id, concept_id))
-                        translation_object.grammatical_number_id = number_id
-                    elif termnote_type == u"processStatus":
-                        # Values of processStatus different from
-                        # finalized are ignored.
-                        if getText(termnote_tag.childNodes) == u"finalized":
-                            translation_object.is_finalized = True
-                    elif termnote_type == u"administrativeStatus":
-                        admin_status_text = getText(termnote_tag.childNodes)
-                        try:
-                            admin_status = admin_statusses[admin_status_text.lower()]
-                        except KeyError:
-                            raise Exception(_("Administrative Status "
-                                              "\"%s\", found in \"%s\""
-                                              " translation for \"%s\""
-                                              " language in concept "
-                                              "\"%s\", doesn't exist "
-                                              "in Terminator.\n\nIf "
-                                              "you want to import this"
-                                              " TBX file, either add "
-                                              "this Administrative "
-                                              "Status to Terminator, "
-                                              "or change this "
-                                              "Administrative Status "
-                                              "on the TBX file.") %
-                                            (admin_status_text,
-                                             translation_text,
-                                             lang_id, concept_id))
-                        translation_object.administrative_status = admin_status
-                        # If the Administrative Status is inside a
-                        # termGrp tag it may have an Administrative
-                        # Status Reason.
-                        if admin_status.allows_reason and termnote_tag.parentNode != translation_tag:
-                            reason_tag_list = termnote_tag.parentNode.getElementsByTagName(u"note")
-                            if reason_tag_list:
-                                try:
-                                    reason_object = AdministrativeStatusReason.objects.get(name__iexact=getText(reason_tag_list[0].childNodes))
-                                except AdministrativeStatusReason.DoesNotExist:
-                                    pass #TODO Raise an exception
-                                else:
-                                    translation_object.administrative_status_reason = reason_object
-                    elif termnote_type == u"termType":
-                        # It might be phraseologicalUnit, acronym or
-                        # abbreviation that in Terminator are internally
-                        # represented as PartOfSpeech objects.
-                        termtype_text = getText(termnote_tag.childNodes)
+    def parse_definition(self, language_tag, lang_id, concept_object, parents):
+        # Get the definition for each language.
+        # NOTE: Be careful because the following returns all the descrip
+        # tags, and not all of them are definitions.
+        for descrip_tag in language_tag.iter(u"descrip"):
+            if descrip_tag.get(u"type") != u"definition":
+                continue
+            definition_text = getText(descrip_tag)
+            if definition_text:
+                definition_object = Definition(
+                        concept=concept_object,
+                        language_id=lang_id,
+                        text=definition_text,
+                        is_finalized=False,
+                )
+                definition_object._history_user = None
+                # If the definition is inside a descripGrp tag, it may have a
+                # source.
+                if parents[descrip_tag].tag == u"descripGrp":
+                    source_tag = parents[descrip_tag].find(u".//xref")
+                    if source_tag is not None:
+                        #TODO There is no check to see if this xref tag has
+                        # type="xSource".
+                        definition_object.source = source_tag.get(u"target", u"")
+                yield definition_object
+            # Each langSet should have at most one definition, and since
+            # Terminator doesn't import other descrip tags at langSet level
+            # then stop looping.
+            break
+
+    def parse_resources(self, language_tag, lang_id, concept_object, concept_id):
+        # Get the external resources for each language.
+        # Only the xref tags that are children of the langSet tag, or in other
+        # words, the xref tags that are not inside a descripGrp tag alongside
+        # a definition in order to provide the source for that definition.
+        for xref_tag in language_tag.findall(u"xref"):
+            resource_type = xref_tag.get(u"type", u"").lower()
+            try:
+                resource_link_type = self.link_types[resource_type]
+            except KeyError:
+                excp_msg = (_("External Link Type \"%s\", found "
+                              "inside a \"%s\" tag in the \"%s\" "
+                              "language in concept \"%s\", doesn't"
+                              " exist in Terminator.") %
+                            (resource_type, "xref", lang_id,
+                             concept_id))
+                excp_msg += force_text(_("\n\nIf you want to import "
+                                      "this TBX file, either add "
+                                      "this External Link Type to "
+                                      "Terminator, or change this "
+                                      "External Link Type on the "
+                                      "TBX file."))
+                raise Exception(excp_msg)
+            resource_target = xref_tag.get(u"target")
+            resource_description = getText(xref_tag)
+            # TODO If resource_description doesn't exist raise an exception.
+            if resource_target and resource_description:
+                yield ExternalResource(
+                        concept=concept_object,
+                        language_id=lang_id,
+                        address=resource_target,
+                        link_type_id=resource_link_type,
+                        description=resource_description,
+                )
+
+    def parse_translation(self, translation_tag, lang_id, concept_object, concept_id, parents):
+        """Returns the translation with its context sentences and corpus
+        examples, or None if the tig tag has no term."""
+        # Proceed only if there is at least one term tag inside this tig or
+        # ntig tag.
+        # The next line only works with the first term tag skipping other
+        # term tags if present.
+        term_tag = translation_tag.find(u".//term")
+        if term_tag is None:
+            return None
+        translation_text = getText(term_tag)
+        if not translation_text:
+            return None
+        translation_object = Translation(
+                concept=concept_object,
+                language_id=lang_id,
+                translation_text=translation_text,
+                # save() isn't called for bulk inserts
+                search_key=search_key(translation_text),
+        )
+
+        for termnote_tag in translation_tag.iter(u"termNote"):
+            termnote_type = termnote_tag.get(u"type")
+            #TODO the Parts of Speech, Grammatical Genders, Grammatical
+            # Numbers, Administrative Statuses and Administrative Status
+            # Reasons specified in the TBX file may not exist in the
+            # Terminator database, so the import process will fail. Maybe it
+            # should create those missing entities, but it may fill the
+            # database with duplicates.
+            #TODO the Parts of Speech, Grammatical Genders, Grammatical
+            # Numbers, Administrative Statuses and Administrative Status
+            # Reasons can only be used for certain languages, and the actual
+            # importing code doesn't respect these constraints.
+            if termnote_type == u"partOfSpeech":
+                # Since in some TBX files the Part of Speech is capitalized
+                # it is converted to lowercase.
+                pos_text = getText(termnote_tag)
+                try:
+                    pos_id = self.parts_of_speech[pos_text.lower()]
+                except KeyError:
+                    raise Exception(_("Part of Speech \"%s\", "
+                                      "found in \"%s\" "
+                                      "translation for \"%s\" "
+                                      "language in concept "
+                                      "\"%s\", doesn't exist "
+                                      "in Terminator.\n\nIf "
+                                      "you want to import this"
+                                      " TBX file, either add "
+                                      "this Part of Speech to "
+                                      "Terminator, or change "
+                                      "this Part of Speech on "
+                                      "the TBX file.") %
+                                    (pos_text,
+                                     translation_text,
+                                     lang_id, concept_id))
+                translation_object.part_of_speech_id = pos_id
+            elif termnote_type == u"grammaticalGender":
+                gramm_gender_text = getText(termnote_tag)
+                try:
+                    gender_id = self.genders[gramm_gender_text.lower()]
+                except KeyError:
+                    raise Exception(_("Grammatical Gender "
+                                      "\"%s\", found in \"%s\""
+                                      " translation for \"%s\""
+                                      " language in concept "
+                                      "\"%s\", doesn't exist "
+                                      "in Terminator.\n\nIf "
+                                      "you want to import this"
+                                      " TBX file, either add "
+                                      "this Grammatical Gender"
+                                      " to Terminator, or "
+                                      "change this Grammatical"
+                                      " Gender on the TBX "
+                                      "file.") %
+                                    (gramm_gender_text,
+                                     translation_text,
+                                     lang_id, concept_id))
+                translation_object.grammatical_gender_id = gender_id
+            elif termnote_type == u"grammaticalNumber":
+                gramm_number_text = getText(termnote_tag)
+                try:
+                    number_id = self.numbers[gramm_number_text.lower()]
+                except KeyError:
+                    raise Exception(_("Grammatical Number "
+                                      "\"%s\", found in \"%s\""
+                                      " translation for \"%s\""
+                                      " language in concept "
+                                      "\"%s\", doesn't exist "
+                                      "in Terminator.\n\nIf "
+                                      "you want to import this"
+                                      " TBX file, either add "
+                                      "this Grammatical Number"
+                                      " to Terminator, or "
+                                      "change this Grammatical"
+                                      " Number on the TBX "
+                                      "file.") %
+                                    (gramm_number_text,
+                                     translation_text,
+                                     lang_id, concept_id))
+                translation_object.grammatical_number_id = number_id
+            elif termnote_type == u"processStatus":
+                # Values of processStatus different from finalized are
+                # ignored.
+                if getText(termnote_tag) == u"finalized":
+                    translation_object.is_finalized = True
+            elif termnote_type == u"administrativeStatus":
+                admin_status_text = getText(termnote_tag)
+                try:
+                    admin_status = self.admin_statusses[admin_status_text.lower()]
+                except KeyError:
+                    raise Exception(_("Administrative Status "
+                                      "\"%s\", found in \"%s\""
+                                      " translation for \"%s\""
+                                      " language in concept "
+                                      "\"%s\", doesn't exist "
+                                      "in Terminator.\n\nIf "
+                                      "you want to import this"
+                                      " TBX file, either add "
+                                      "this Administrative "
+                                      "Status to Terminator, "
+                                      "or change this "
+                                      "Administrative Status "
+                                      "on the TBX file.") %
+                                    (admin_status_text,
+                                     translation_text,
+                                     lang_id, concept_id))
+                translation_object.administrative_status = admin_status
+                # If the Administrative Status is inside a termGrp tag it may
+                # have an Administrative Status Reason.
+                if admin_status.allows_reason and parents[termnote_tag] is not translation_tag:
+                    reason_tag = parents[termnote_tag].find(u".//note")
+                    if reason_tag is not None:
                         try:
-                            pos_id = parts_of_speech[pos_text.lower()]
-                        except KeyError:
-                            raise Exception(_("TermType \"%s\", found "
-                                              "in \"%s\" translation "
-                                              "for \"%s\" language in "
-                                              "concept \"%s\", doesn't"
-                                              " exist in Terminator.\n"
-                                              "\nIf you want to import"
-                                              " this TBX file, either "
-                                              "add this TermType as "
-                                              "another Part of Speech "
-                                              "to Terminator, or "
-                                              "change this TermType on"
-                                              " the TBX file.\n\nNote:"
-                                              " Terminator stores this"
-                                              " TermType values as "
-                                              "Part of Speech.") %
-                                            (termtype_text,
-                                             translation_text,
-                                             lang_id, concept_id))
-                        translation_object.part_of_speech_id = pos_id
-
-                for note_tag in translation_tag.getElementsByTagName(u"note"):
-                    # Ensure that this note tag is not at lower levels
-                    # inside the translation tag.
-                    if note_tag.parentNode == translation_tag:
-                        note_text = getText(note_tag.childNodes)
-                        if note_text:
-                            translation_object.note = note_text
-                        # Each translation should have at most one
-                        # translation note, so stop looping.
-                        break
-
-                # Remove the gender and number for the translation if
-                # it doesn't have a Part of Speech.
-                if (translation_object.grammatical_gender_id or translation_object.grammatical_number_id) and not translation_object.part_of_speech_id:
-                    translation_object.grammatical_gender = None
-                    translation_object.grammatical_number = None
-
-                # Save the translation because the next tags can create
-                # objects that will refer to the translation object and
-                # thus it should have an id set.
-                translation_object.save(update_repr_cache=False)
-
-                # Get the context phrase for the current translation.
-                for descrip_tag in translation_tag.getElementsByTagName(u"descrip"):
-                    descrip_type = descrip_tag.getAttribute(u"type")
-                    if descrip_type == u"context":
-                        phrase_object = ContextSentence(
-                                translation=translation_object,
-                                text=getText(descrip_tag.childNodes),
-                        )
-                        phrase_object.save()
-
-                # Get the corpus examples for the current translation.
-                for xref_tag in translation_tag.getElementsByTagName(u"xref"):
-                    xref_type = xref_tag.getAttribute(u"type")
-                    if xref_type == u"corpusTrace":
-                        xref_target = xref_tag.getAttribute(u"target")
-                        xref_description = getText(xref_tag.childNodes)
-                        if xref_target and xref_description:
-                            corpus_example_object = CorpusExample(
-                                    translation=translation_object,
-                                    address=xref_target,
-                                    description=xref_description,
-                            )
-                            corpus_example_object.save()
-
-            if src_translations:
-                concept_object.repr_cache = concept_object.repr_from(src_translations)
-
-    #populate glossary.other_languages
-    source_lang = imported_glossary.source_language_id
-    if source_lang in language_pool:
-        language_pool.remove(source_lang)
-    imported_glossary.other_languages.add(*Language.objects.filter(iso_code__in=language_pool))
-
-    # Once the file has been completely parsed is time to add the concept
-    # relationships and save the concepts. This is done this way since some
-    # termEntry refer to termEntries that haven't been parsed yet.
-    try:
-        for concept_key, current in concept_pool.items():
+                            reason_object = AdministrativeStatusReason.objects.get(name__iexact=getText(reason_tag))
+                        except AdministrativeStatusReason.DoesNotExist:
+                            pass #TODO Raise an exception
+                        else:
+                            translation_object.administrative_status_reason = reason_object
+            elif termnote_type == u"termType":
+                # It might be phraseologicalUnit, acronym or abbreviation that
+                # in Terminator are internally represented as PartOfSpeech
+                # objects.
+                termtype_text = getText(termnote_tag)
+                try:
+                    pos_id = self.parts_of_speech[termtype_text.lower()]
+                except KeyError:
+                    raise Exception(_("TermType \"%s\", found "
+                                      "in \"%s\" translation "
+                                      "for \"%s\" language in "
+                                      "concept \"%s\", doesn't"
+                                      " exist in Terminator.\n"
+                                      "\nIf you want to import"
+                                      " this TBX file, either "
+                                      "add this TermType as "
+                                      "another Part of Speech "
+                                      "to Terminator, or "
+                                      "change this TermType on"
+                                      " the TBX file.\n\nNote:"
+                                      " Terminator stores this"
+                                      " TermType values as "
+                                      "Part of Speech.") %
+                                    (termtype_text,
+                                     translation_text,
+                                     lang_id, concept_id))
+                translation_object.part_of_speech_id = pos_id
+
+        # Each translation should have at most one translation note, and it
+        # must not be at lower levels inside the translation tag.
+        note_tag = translation_tag.find(u"note")
+        if note_tag is not None:
+            note_text = getText(note_tag)
+            if note_text:
+                translation_object.note = note_text
+
+        # Remove the gender and number for the translation if it doesn't have
+        # a Part of Speech.
+        if (translation_object.grammatical_gender_id or translation_object.grammatical_number_id) and not translation_object.part_of_speech_id:
+            translation_object.grammatical_gender = None
+            translation_object.grammatical_number = None
+
+        # Get the context phrase for the current translation.
+        phrases = []
+        for descrip_tag in translation_tag.iter(u"descrip"):
+            if descrip_tag.get(u"type") == u"context":
+                phrases.append(ContextSentence(
+                        translation=translation_object,
+                        text=getText(descrip_tag),
+                ))
+
+        # Get the corpus examples for the current translation.
+        corpus_examples = []
+        for xref_tag in translation_tag.iter(u"xref"):
+            if xref_tag.get(u"type") == u"corpusTrace":
+                xref_target = xref_tag.get(u"target")
+                xref_description = getText(xref_tag)
+                if xref_target and xref_description:
+                    corpus_examples.append(CorpusExample(
+                            translation=translation_object,
+                            address=xref_target,
+                            description=xref_description,
+                    ))
+
+        return translation_object, phrases, corpus_examples
+
+    @transaction.atomic
+    def save_concept(self, entry):
+        """Save the model instances of one parsed termEntry."""
+        concept_object = entry["concept"]
+        concept_object.save()
+        if entry["tbx_id"]:
+            self.concept_ids[entry["tbx_id"]] = concept_object.pk
+        for definition_object in entry["definitions"]:
+            definition_object.concept = concept_object
+            definition_object.save()
+        for resource_object in entry["resources"]:
+            resource_object.concept = concept_object
+            resource_object.save()
+        for translation_object, phrases, corpus_examples in entry["translations"]:
+            translation_object.concept = concept_object
+            # The repr_cache is updated once for the whole concept.
+            translation_object.save(update_repr_cache=False)
+            for phrase_object in phrases:
+                phrase_object.translation = translation_object
+                phrase_object.save()
+            for corpus_example_object in corpus_examples:
+                corpus_example_object.translation = translation_object
+                corpus_example_object.save()
+        self.terms_inserted += len(entry["translations"])
+        if entry["src_translations"]:
+            concept_object.repr_cache = concept_object.repr_from(entry["src_translations"])
+            concept_object.save(update_fields=['repr_cache'])
+
+    def flush(self):
+        """Write whatever is still waiting to be saved.
+
+        Nothing is ever waiting when importing row by row.
+        """
+        pass
+
+    def save_languages(self):
+        #populate glossary.other_languages
+        source_lang = self.glossary.source_language_id
+        self.language_pool.discard(source_lang)
+        self.glossary.other_languages.add(*Language.objects.filter(iso_code__in=self.language_pool))
+
+    def resolve_relations(self):
+        """Map the concept relationships from TBX ids to concept ids.
+
+        Returns a list of (concept id, subject field id, broader concept id,
+        related concept ids). Nothing is written to the database, so that an
+        error leaves no half-set relationships behind.
+        """
+        resolved = []
+        for concept_key, current in self.concept_relations.items():
+            subject_id = None
+            broader_id = None
+            related_ids = []
             if "subject" in current:
                 try:
-                    current["object"].subject_field = concept_pool[current["subject"]]["object"]
+                    subject_id = self.concept_ids[current["subject"]]
                 except KeyError:
                     excp_msg = (_("The concept \"%s\" uses the concept"
                                   " \"%s\" as its subject field, but that "
@@ -480,7 +593,7 @@ def import_uploaded_file(uploaded_file, imported_glossary):
                     raise Exception(excp_msg)
             if "broader" in current:
                 try:
-                    current["object"].broader_concept = concept_pool[current["broader"]]["object"]
+                    broader_id = self.concept_ids[current["broader"]]
                 except KeyError:
                     excp_msg = (_("The concept \"%s\" uses the concept"
                                   " \"%s\" as its broader concept, but "
@@ -490,46 +603,307 @@ def import_uploaded_file(uploaded_file, imported_glossary):
                     excp_msg += force_text(_("\n\nIf you want to import this "
                                           "TBX file you must fix this."))
                     raise Exception(excp_msg)
-            if "related" in current:
-                for related_key in current["related"]:
-                    try:
-                        current["object"].related_concepts.add(concept_pool[related_key]["object"])
-                    except KeyError:
-                        excp_msg = (_("The concept \"%s\" uses the concept"
-                                      " \"%s\" as one of its related "
-                                      "concepts (cross reference), but "
-                                      "that concept id doesn't exist in "
-                                      "the TBX file.") %
-                                    (concept_key, related_key))
-                        excp_msg += force_text(_("\n\nIf you want to import "
-                                              "this TBX file you must fix "
-                                              "this."))
-                        raise Exception(excp_msg)
-            # Save the concept object once its relationships with other
-            # concepts in the glossary are set.
-            # TODO Save the concept object only if it is changed.
-            current["object"].save()
-    except:
-        # In case of failure during the concept relationships assignment
-        # the subject_field and broader_concept must be set to None in
-        # order to delete all the glossary data because this two fields
-        # have on_delete=models.PROTECT
-        for concept_dict in concept_pool.values():
-            concept = concept_dict["object"]
-            concept.subject_field = None
-            concept.broader_concept = None
-            # The next line is unnecessary, but keep it because in the
-            # future it might be necessary.
-            #concept.related_concepts.clear()
-            concept.save()
-        # Raise the exception again in order to show the error in the UI.
-        raise
-
-    if len(concept_pool) == 0 and concept_object:
-        # Nothing was added to the pool (no IDs?), but there was at least one
-        # concept. We still have to save for the sake of the repr_cache.
-        for concept in concept_list:
-            concept.save()
+            for related_key in current.get("related", []):
+                try:
+                    related_ids.append(self.concept_ids[related_key])
+                except KeyError:
+                    excp_msg = (_("The concept \"%s\" uses the concept"
+                                  " \"%s\" as one of its related "
+                                  "concepts (cross reference), but "
+                                  "that concept id doesn't exist in "
+                                  "the TBX file.") %
+                                (concept_key, related_key))
+                    excp_msg += force_text(_("\n\nIf you want to import "
+                                          "this TBX file you must fix "
+                                          "this."))
+                    raise Exception(excp_msg)
+            resolved.append((self.concept_ids[concept_key], subject_id, broader_id, related_ids))
+        return resolved
+
+    def save_relations(self):
+        # Once the file has been completely parsed is time to add the concept
+        # relationships. This is done this way since some termEntry refer to
+        # termEntries that haven't been parsed yet.
+        for concept_id, subject_id, broader_id, related_ids in self.resolve_relations():
+            self.relations_resolved += 1
+            if subject_id or broader_id:
+                Concept.objects.filter(pk=concept_id).update(
+                        subject_field=subject_id,
+                        broader_concept=broader_id,
+                )
+            if related_ids:
+                Concept(pk=concept_id).related_concepts.add(*related_ids)
+
+
+class BulkTBXImporter(TBXImporter):
+    """Imports a TBX file with bulk inserts.
+
+    Parsed termEntries are queued, and every batch_size concepts are written
+    with one bulk_create() per model. The foreign keys are fixed up once the
+    concepts and translations of the batch have ids, and the repr_cache is
+    calculated once per concept. The resulting database state is the same as
+    with TBXImporter, apart from the actual id values.
+    """
+
+    def __init__(self, glossary, batch_size=500, progress=None):
+        super(BulkTBXImporter, self).__init__(glossary, progress)
+        self.batch_size = batch_size
+        self.batch = []
+
+    def save_concept(self, entry):
+        self.batch.append(entry)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def bulk_create(self, model, objs, new_rows):
+        """bulk_create() that also sets the ids on all database backends.
+
+        Only PostgreSQL returns the ids of inserted rows. Elsewhere we read
+        them back from new_rows, a queryset that must match exactly the rows
+        inserted here. Rows get ascending ids in the order they are inserted.
+        """
+        model.objects.bulk_create(objs)
+        if objs and objs[0].pk is None:
+            ids = list(new_rows.order_by('pk').values_list('pk', flat=True))
+            if len(ids) != len(objs):
+                raise DatabaseError(
+                        "Inserted %d %s rows, but found %d." %
+                        (len(objs), model._meta.model_name, len(ids)))
+            for obj, pk in zip(objs, ids):
+                obj.pk = pk
+
+    @transaction.atomic
+    def flush(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        concepts = [entry["concept"] for entry in batch]
+        # Other concepts can be added to the glossary while we import, so
+        # the concepts of the batch are marked to find their ids. The mark
+        # is replaced with the real repr_cache at the end of the batch, and
+        # nobody else can add rows for these concepts before we commit.
+        batch_mark = u"import:%s" % uuid.uuid4().hex
+        for concept_object in concepts:
+            concept_object.repr_cache = batch_mark
+        in_batch = {
+            'concept__glossary': self.glossary,
+            'concept__repr_cache': batch_mark,
+        }
+        self.bulk_create(Concept, concepts, Concept.objects.filter(
+                glossary=self.glossary,
+                repr_cache=batch_mark,
+        ))
+
+        definitions = []
+        resources = []
+        translations = []
+        repr_caches = {}
+        for entry in batch:
+            concept_object = entry["concept"]
+            if entry["tbx_id"]:
+                self.concept_ids[entry["tbx_id"]] = concept_object.pk
+            # Assigning the concept again sets the now known concept_id.
+            for definition_object in entry["definitions"]:
+                definition_object.concept = concept_object
+                definitions.append(definition_object)
+            for resource_object in entry["resources"]:
+                resource_object.concept = concept_object
+                resources.append(resource_object)
+            for translation in entry["translations"]:
+                translation[0].concept = concept_object
+                translations.append(translation)
+            concept_object.repr_cache = None
+            if entry["src_translations"]:
+                concept_object.repr_cache = concept_object.repr_from(entry["src_translations"])
+            repr_caches[concept_object.pk] = concept_object.repr_cache
+
+        self.bulk_create(Definition, definitions, Definition.objects.filter(**in_batch))
+        # bulk_create() doesn't send post_save, so we need to add the
+        # history ourselves.
+        HistoricalDefinition = Definition.history.model
+        history_date = now()
+        HistoricalDefinition.objects.bulk_create([
+            HistoricalDefinition(
+                history_date=history_date,
+                history_type='+',
+                history_user=None,
+                **dict((field.attname, getattr(definition_object, field.attname))
+                       for field in Definition._meta.fields)
+            ) for definition_object in definitions
+        ])
+        ExternalResource.objects.bulk_create(resources)
+
+        self.bulk_create(Translation, [t[0] for t in translations],
+                         Translation.objects.filter(**in_batch))
+        phrases = []
+        corpus_examples = []
+        for translation_object, translation_phrases, translation_examples in translations:
+            for phrase_object in translation_phrases:
+                phrase_object.translation = translation_object
+                phrases.append(phrase_object)
+            for corpus_example_object in translation_examples:
+                corpus_example_object.translation = translation_object
+                corpus_examples.append(corpus_example_object)
+        ContextSentence.objects.bulk_create(phrases)
+        CorpusExample.objects.bulk_create(corpus_examples)
+
+        update_in_bulk(Concept, 'repr_cache', repr_caches)
+        self.terms_inserted += len(translations)
+
+    def save_relations(self):
+        subject_fields = {}
+        broader_concepts = {}
+        related_pairs = set()
+        for concept_id, subject_id, broader_id, related_ids in self.resolve_relations():
+            self.relations_resolved += 1
+            if subject_id or broader_id:
+                subject_fields[concept_id] = subject_id
+                broader_concepts[concept_id] = broader_id
+            for related_id in related_ids:
+                # related_concepts is symmetrical
+                related_pairs.add((concept_id, related_id))
+                related_pairs.add((related_id, concept_id))
+        update_in_bulk(Concept, 'subject_field', subject_fields)
+        update_in_bulk(Concept, 'broader_concept', broader_concepts)
+        Through = Concept.related_concepts.through
+        Through.objects.bulk_create([
+            Through(from_concept_id=from_id, to_concept_id=to_id)
+            for from_id, to_id in sorted(related_pairs)
+        ])
+
+
+def import_uploaded_file(uploaded_file, imported_glossary, progress=None):
+    batch_size = getattr(settings, "TBX_IMPORT_BATCH_SIZE", 500)
+    if batch_size:
+        importer = BulkTBXImporter(imported_glossary, batch_size, progress)
+    else:
+        importer = TBXImporter(imported_glossary, progress)
+    importer.run(uploaded_file)
+
+
+def delete_imported_glossary(glossary):
+    """Delete a glossary with whatever part of an import was committed."""
+    # The subject field and broader concept have on_delete=PROTECT, so they
+    # have to be cleared before deleting the concepts.
+    Concept.objects.filter(glossary=glossary).update(
+            subject_field=None,
+            broader_concept=None,
+    )
+    glossary.delete()
+
+
+def import_glossary(tbx_file, glossary, user_id, atomic=True, progress=None):
+    """Import a TBX file into a new glossary, and log the addition.
+
+    With atomic=False the concepts are committed as they are imported, instead
+    of holding a transaction open during the whole import. If the import
+    fails the glossary is deleted, and the reason of the failure is returned.
+    """
+    try:
+        if atomic:
+            with transaction.atomic():
+                import_uploaded_file(tbx_file, glossary, progress)
+        else:
+            import_uploaded_file(tbx_file, glossary, progress)
+    except Exception as e:
+        delete_imported_glossary(glossary)
+        return force_text(e.args[0])
+    LogEntry.objects.log_action(
+        user_id=user_id,
+        content_type_id=ContentType.objects.get_for_model(glossary).pk,
+        object_id=glossary.pk,
+        object_repr=force_text(glossary),
+        action_flag=ADDITION,
+    )
+    return None
+
+
+def update_job_progress(job):
+    """Returns a progress callback that stores the counters in the job."""
+    def progress(importer):
+        ImportJob.objects.filter(pk=job.pk).update(
+                concepts_parsed=importer.concepts_parsed,
+                terms_inserted=importer.terms_inserted,
+                relations_resolved=importer.relations_resolved,
+                updated=now(),
+        )
+    return progress
+
+
+def finish_import_job(job, error):
+    if error is None:
+        job.status = ImportJob.SUCCEEDED
+    else:
+        job.status = ImportJob.FAILED
+        job.message = error
+    job.finished = now()
+    job.tbx_file.delete(save=False)
+    # The counters were updated behind the back of this instance.
+    job.save(update_fields=['status', 'message', 'finished', 'tbx_file'])
+
+
+def run_import_job(job):
+    """Import the TBX file of a queued ImportJob.
+
+    Returns False if another worker already took the job. If the job can't
+    be finished, for example because the worker dies, it stays running until
+    reclaim_import_jobs() gives up on it.
+    """
+    claimed = ImportJob.objects.filter(
+            pk=job.pk,
+            status=ImportJob.QUEUED,
+    ).update(status=ImportJob.RUNNING, updated=now())
+    if not claimed:
+        return False
+    job.status = ImportJob.RUNNING
+    try:
+        if job.glossary is None:
+            error = force_text(_("The glossary was deleted before importing."))
+        else:
+            job.tbx_file.open('rb')
+            try:
+                error = import_glossary(job.tbx_file, job.glossary, job.user_id,
+                                        atomic=False, progress=update_job_progress(job))
+            finally:
+                job.tbx_file.close()
+            if error is not None:
+                # import_glossary() deleted the glossary.
+                job.glossary = None
+    except Exception as e:
+        error = force_text(e)
+        if job.glossary is not None:
+            delete_imported_glossary(job.glossary)
+            job.glossary = None
+    finish_import_job(job, error)
+    return True
+
+
+def reclaim_import_jobs():
+    """Fail the running jobs that didn't report progress for a long time.
+
+    Their glossaries are deleted with whatever part of the import was
+    committed. Returns the failed jobs.
+    """
+    timeout = getattr(settings, "TBX_IMPORT_JOB_TIMEOUT", 3600)
+    stale = ImportJob.objects.filter(
+            status=ImportJob.RUNNING,
+            updated__lt=now() - timedelta(seconds=timeout),
+    )
+    reclaimed = []
+    for job in stale:
+        # Another worker might be reclaiming the same job.
+        if not ImportJob.objects.filter(
+                pk=job.pk,
+                status=ImportJob.RUNNING,
+                updated=job.updated,
+        ).update(updated=now()):
+            continue
+        if job.glossary is not None:
+            delete_imported_glossary(job.glossary)
+            job.glossary = None
+        finish_import_job(job, force_text(_("The import was interrupted.")))
+        reclaimed.append(job)
+    return reclaimed
 
 
 # TODO: need much better permissions checking:
@@ -544,27 +918,45 @@ def import_view(request):
         import_form = ImportForm(request.POST, request.FILES)
         if import_form.is_valid():
             glossary = import_form.save()
-            try:
-                with transaction.atomic():
-                    import_uploaded_file(request.FILES['imported_file'], glossary)
-            except Exception as e:
-                glossary.delete()
+            if getattr(settings, "TBX_IMPORT_IN_BACKGROUND", False):
+                job = ImportJob.objects.create(
+                        glossary=glossary,
+                        glossary_name=glossary.name,
+                        user=request.user,
+                        tbx_file=request.FILES['imported_file'],
+                )
+                return redirect(job)
+            error = import_glossary(request.FILES['imported_file'], glossary, request.user.pk)
+            if error is not None:
                 import_error_message = _("The import process failed:\n\n")
-                import_error_message += force_text(e.args[0])
+                import_error_message += error
                 context['import_error_message'] = import_error_message
             else:
                 import_message = _("TBX file succesfully imported.")
                 context['import_message'] = import_message
                 context['glossary'] = glossary
                 import_form = ImportForm()
-                LogEntry.objects.log_action(
-                    user_id=request.user.pk,
-                    content_type_id=ContentType.objects.get_for_model(glossary).pk,
-                    object_id=glossary.pk,
-                    object_repr=force_text(glossary),
-                    action_flag=ADDITION,
-                )
     else:
         import_form = ImportForm()
     context['import_form'] = import_form
     return render(request, 'import.html', context)
+
+
+@login_required
+def import_job_view(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk)
+    if job.user_id != request.user.pk and not request.user.is_superuser:
+        raise PermissionDenied
+    context = {
+        'search_form': SearchForm(),
+        'next': request.get_full_path(),
+        'job': job,
+    }
+    if job.status == ImportJob.SUCCEEDED:
+        context['import_message'] = _("TBX file succesfully imported.")
+        context['glossary'] = job.glossary
+    elif job.status == ImportJob.FAILED:
+        import_error_message = _("The import process failed:\n\n")
+        import_error_message += job.message
+        context['import_error_message'] = import_error_message
+    return render(request, 'import_job.html', context)
@@ -28,9 +28,11 @@ class CommentThreadFeed(LatestCommentFeed):
     """Feed of latest comments on a given concept comment thread."""
 
     def get_object(self, request, concept_id, language_id):
-        from terminator.models import ConceptInLanguage
-        return get_object_or_404(ConceptInLanguage,
-                                 concept=concept_id, language=language_id)
+        from terminator.models import Concept, ConceptInLanguage, Language
+        return ConceptInLanguage.get_or_placeholder(
+                get_object_or_404(Concept, pk=concept_id),
+                get_object_or_404(Language, pk=language_id),
+        )
 
     def items(self, obj):
         qs = TerminatorComment.objects.filter(
@@ -38,7 +40,10 @@ class CommentThreadFeed(LatestCommentFeed):
             is_public = True,
             is_removed = False,
             object_pk = obj.pk,
-            content_type = ContentType.objects.get_for_model(obj.__class__)
+            content_type = ContentType.objects.get_for_model(obj.__class__),
+            # Through the index, see CommentThread
+            thread__concept = obj.concept_id,
+            thread__language = obj.language_id,
         )
         if getattr(settings, 'COMMENTS_BANNED_USERS_GROUP', None):
             inner_qs = User.objects.filter(groups__pk=settings.COMMENTS_BANNED_USERS_GROUP)
@@ -16,6 +16,8 @@
 # You should have received a copy of the GNU General Public License along with
 # Terminator. If not, see <http://www.gnu.org/licenses/>.
 
+import time
+
 from django import forms
 from django.utils.translation import ugettext_lazy as _
 from django_comments.forms import CommentForm
@@ -37,3 +39,24 @@ class TerminatorCommentForm(CommentForm):
         data = super(TerminatorCommentForm, self).get_comment_create_data()
         data['mail_me'] = self.cleaned_data['mail_me']
         return data
+
+
+def placeholder_object_pk(concept_in_lang):
+    """The object_pk of comments about an unsaved ConceptInLanguage.
+
+    It holds the concept and the language instead of the missing primary key.
+    See views.post_comment().
+    """
+    return '%s:%s' % (concept_in_lang.concept_id, concept_in_lang.language_id)
+
+
+def placeholder_security_data(form, timestamp=None):
+    """The security data of a comment form about an unsaved ConceptInLanguage."""
+    target = form.target_object
+    data = {
+        'content_type': str(target._meta),
+        'object_pk': placeholder_object_pk(target),
+        'timestamp': str(timestamp or int(time.time())),
+    }
+    data['security_hash'] = form.generate_security_hash(**data)
+    return data
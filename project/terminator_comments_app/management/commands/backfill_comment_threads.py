@@ -0,0 +1,54 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django_comments.models import Comment
+
+from terminator_comments_app.models import CommentThread, comment_threads
+
+
+class Command(BaseCommand):
+    help = ("Stores the glossary, concept and language of the comments that "
+            "were made before they were stored with every comment.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="The number of comments to update at a time.",
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help="Update all comments, not only those without a thread.",
+        )
+
+    def handle(self, *args, **options):
+        comments = Comment.objects.order_by('pk').only('content_type', 'object_pk')
+        if not options['all']:
+            comments = comments.filter(thread=None)
+        done = 0
+        last_id = 0
+        while True:
+            batch = list(comments.filter(pk__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].pk
+            with transaction.atomic():
+                CommentThread.objects.filter(comment__in=batch).delete()
+                CommentThread.objects.bulk_create(comment_threads(batch))
+            done += len(batch)
+            if options['verbosity'] > 0:
+                self.stdout.write("%d comments updated" % done)
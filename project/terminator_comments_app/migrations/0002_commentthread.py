@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 04:26
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_comments', '0003_add_submit_date_index'),
+        ('terminator', '0028_glossaryactivity'),
+        ('terminator_comments_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentThread',
+            fields=[
+                ('comment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='thread', serialize=False, to='django_comments.Comment')),
+                ('concept', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='terminator.Concept')),
+                ('glossary', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='terminator.Glossary')),
+                ('language', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='terminator.Language')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='commentthread',
+            index=models.Index(fields=['glossary', 'comment'], name='terminator_thread_glossary'),
+        ),
+        migrations.AddIndex(
+            model_name='commentthread',
+            index=models.Index(fields=['concept', 'language'], name='terminator_thread_concept'),
+        ),
+    ]
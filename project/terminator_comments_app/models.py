@@ -17,8 +17,10 @@
 # Terminator. If not, see <http://www.gnu.org/licenses/>.
 
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.core.mail import send_mail, EmailMessage
 from django.db import models
+from django.db.models.signals import post_save
 from django.utils.translation import ugettext_lazy as _
 from django_comments.models import Comment
 
@@ -83,3 +85,76 @@ class TerminatorComment(Comment):
                 #send_mail(mail_subject, self.comment,
                 #          'donotreply@donotreply.com',
                 #          list(emails_to_notify_set), fail_silently=False)
+
+
+def thread_values(Model, object_pks):
+    """The concept, language and glossary of some objects of Model.
+
+    Returns a dictionary of object pk, as text, to a tuple of (concept id,
+    language id, glossary id) for those objects that exist. Comments are only
+    made on objects with a concept and a language.
+    """
+    names = set(field.name for field in Model._meta.fields)
+    if not set(['concept', 'language']) <= names:
+        return {}
+    object_pks = [pk for pk in object_pks if str(pk).isdigit()]
+    values = Model._base_manager.filter(pk__in=object_pks).values_list(
+            'pk', 'concept', 'language', 'concept__glossary',
+    )
+    return dict((str(row[0]), row[1:]) for row in values)
+
+
+class CommentThread(models.Model):
+    """The concept, language and glossary of a comment.
+
+    Comments only store the id of the commented object as text, which can't
+    be joined efficiently, so this is copied here when a comment is saved.
+    The comments of a thread or of a glossary can then be found with an index.
+    """
+    comment = models.OneToOneField(Comment, primary_key=True, on_delete=models.CASCADE, related_name='thread')
+    glossary = models.ForeignKey('terminator.Glossary', null=True, db_index=False, on_delete=models.SET_NULL)
+    concept = models.ForeignKey('terminator.Concept', null=True, db_index=False, on_delete=models.SET_NULL)
+    language = models.ForeignKey('terminator.Language', null=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['glossary', 'comment'], name='terminator_thread_glossary'),
+            models.Index(fields=['concept', 'language'], name='terminator_thread_concept'),
+        ]
+
+
+def comment_threads(comments):
+    """Unsaved CommentThread objects for some comments."""
+    by_ctype = {}
+    for comment in comments:
+        by_ctype.setdefault(comment.content_type_id, []).append(comment)
+    threads = []
+    for ctype_id, ctype_comments in by_ctype.items():
+        Model = ContentType.objects.get_for_id(ctype_id).model_class()
+        values = {}
+        if Model is not None:
+            values = thread_values(Model, set(c.object_pk for c in ctype_comments))
+        for comment in ctype_comments:
+            concept_id, language_id, glossary_id = values.get(str(comment.object_pk), (None, None, None))
+            threads.append(CommentThread(
+                    comment_id=comment.pk,
+                    concept_id=concept_id,
+                    language_id=language_id,
+                    glossary_id=glossary_id,
+            ))
+    return threads
+
+
+def update_comment_thread(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    thread = comment_threads([instance])[0]
+    CommentThread.objects.update_or_create(comment_id=instance.pk, defaults={
+            'concept_id': thread.concept_id,
+            'language_id': thread.language_id,
+            'glossary_id': thread.glossary_id,
+    })
+# The comment form of django_comments saves Comment objects, the admin saves
+# TerminatorComment objects.
+post_save.connect(update_comment_thread, sender=Comment)
+post_save.connect(update_comment_thread, sender=TerminatorComment)
@@ -0,0 +1,93 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+"""The comment list tags of django_comments, for comment threads.
+
+Load this library after "comments". Comments are matched by object_pk, which
+is text and not indexed, so the comments of a thread are also filtered by the
+concept and language in CommentThread.
+
+The comment form can also be rendered for an unsaved ConceptInLanguage, which
+is created when the first comment is posted.
+"""
+
+from django import template
+from django_comments.templatetags import comments
+
+from terminator_comments_app.forms import placeholder_object_pk, placeholder_security_data
+
+register = template.Library()
+
+
+class ThreadQuerysetMixin(object):
+
+    def get_queryset(self, context):
+        qs = super(ThreadQuerysetMixin, self).get_queryset(context)
+        if self.object_expr:
+            try:
+                obj = self.object_expr.resolve(context)
+            except template.VariableDoesNotExist:
+                return qs
+            if getattr(obj, 'concept_id', None) and getattr(obj, 'language_id', None):
+                qs = qs.filter(thread__concept=obj.concept_id, thread__language=obj.language_id)
+        return qs
+
+
+class CommentCountNode(ThreadQuerysetMixin, comments.CommentCountNode):
+    pass
+
+
+class CommentListNode(ThreadQuerysetMixin, comments.CommentListNode):
+    pass
+
+
+class RenderCommentListNode(ThreadQuerysetMixin, comments.RenderCommentListNode):
+    pass
+
+
+class RenderCommentFormNode(comments.RenderCommentFormNode):
+
+    def get_target_ctype_pk(self, context):
+        ctype, object_pk = super(RenderCommentFormNode, self).get_target_ctype_pk(context)
+        if ctype and object_pk is None:
+            object_pk = placeholder_object_pk(self.get_object(context))
+        return ctype, object_pk
+
+    def get_form(self, context):
+        form = super(RenderCommentFormNode, self).get_form(context)
+        if form and form.target_object.pk is None:
+            form.initial.update(placeholder_security_data(form))
+        return form
+
+
+@register.tag
+def get_comment_count(parser, token):
+    return CommentCountNode.handle_token(parser, token)
+
+
+@register.tag
+def get_comment_list(parser, token):
+    return CommentListNode.handle_token(parser, token)
+
+
+@register.tag
+def render_comment_list(parser, token):
+    return RenderCommentListNode.handle_token(parser, token)
+
+
+@register.tag
+def render_comment_form(parser, token):
+    return RenderCommentFormNode.handle_token(parser, token)
@@ -2,6 +2,8 @@ from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
 from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 # later Django versions:
 #from django.utils import reverse
@@ -52,10 +54,16 @@ class TestComments(TestCase):
         response = self.client.get(reverse("terminator_feed_comments"))
         self.assertEquals(response.status_code, 200)
         response = self.client.get(reverse("terminator_feed_commentthread", kwargs={
-            "concept_id": 1,
+            "concept_id": 999,
             "language_id": 'en'
         }))
         self.assertEquals(response.status_code, 404)
+        # No comments yet
+        response = self.client.get(reverse("terminator_feed_commentthread", kwargs={
+            "concept_id": 1,
+            "language_id": 'en'
+        }))
+        self.assertEquals(response.status_code, 200)
 
         concept = Concept.objects.get(pk=1)
         language = Language.objects.get(pk='en')
@@ -65,3 +73,47 @@ class TestComments(TestCase):
             "language_id": 'en'
         }))
         self.assertEquals(response.status_code, 200)
+
+    def test_post_without_concept_in_language(self):
+        User.objects.create_user(username="test", email="test@test.com", password="test")
+        self.client.login(username="test", password="test")
+        ConceptInLanguage.objects.filter(concept=1, language='en').delete()
+        response = self.client.get('/concepts_source/1/')
+        self.assertContains(response, 'value="1:en"')
+        self.assertFalse(ConceptInLanguage.objects.filter(concept=1, language='en').exists())
+
+        form = TerminatorCommentForm(ConceptInLanguage(concept_id=1, language_id='en'))
+        data = placeholder_security_data(form)
+        data["comment"] = "first comment"
+        response = self.client.post('/comments/post/', data)
+        self.assertEqual(response.status_code, 302)
+        cil = ConceptInLanguage.objects.get(concept=1, language='en')
+        comment = Comment.objects.get(comment="first comment")
+        self.assertEqual(comment.object_pk, str(cil.pk))
+
+        data["security_hash"] = "0" * 40
+        response = self.client.post('/comments/post/', data)
+        self.assertEqual(response.status_code, 400)
+
+    def test_thread(self):
+        user = User.objects.create_user(username="test", email="test@test.com", password="test")
+        cil = ConceptInLanguage.objects.get_or_create(concept_id=1, language_id='en')[0]
+        comment = TerminatorComment.objects.create(
+            content_type=CT(ConceptInLanguage),
+            object_pk=str(cil.pk),
+            user=user,
+            site=Site.objects.get_current(),
+            comment="Is this the right term?",
+        )
+        thread = CommentThread.objects.get(comment=comment)
+        self.assertEqual((thread.concept_id, thread.language_id, thread.glossary_id), (1, 'en', 1))
+        cache.clear()  # The latest comments are cached
+        response = self.client.get('/glossaries/1/')
+        self.assertContains(response, "Is this the right term?")
+
+        CommentThread.objects.all().delete()
+        call_command('backfill_comment_threads', verbosity=0)
+        thread = CommentThread.objects.get(comment=comment)
+        self.assertEqual((thread.concept_id, thread.language_id, thread.glossary_id), (1, 'en', 1))
+        response = self.client.get('/concepts_source/1/')
+        self.assertContains(response, "Is this the right term?")
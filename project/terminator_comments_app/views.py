@@ -0,0 +1,55 @@
+# -*- coding: UTF-8 -*-
+#
+# This file is part of Terminator.
+#
+# Terminator is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# Terminator is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Terminator. If not, see <http://www.gnu.org/licenses/>.
+
+import django_comments
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_protect
+from django.views.decorators.http import require_POST
+from django_comments.views.comments import CommentPostBadRequest
+from django_comments.views.comments import post_comment as django_post_comment
+
+from terminator.models import Concept, ConceptInLanguage, Language
+
+
+@csrf_protect
+@require_POST
+def post_comment(request, next=None, using=None):
+    """Post a comment, like django_comments does.
+
+    Concept pages don't create a ConceptInLanguage when none exists yet, and
+    their comment form then has the concept and the language as object_pk.
+    The ConceptInLanguage is only created here, before the comment is posted.
+    """
+    data = request.POST
+    object_pk = data.get('object_pk', '')
+    if data.get('content_type') == 'terminator.conceptinlanguage' and ':' in object_pk:
+        concept_id, language_id = object_pk.split(':', 1)
+        form = django_comments.get_form()(
+                ConceptInLanguage(concept_id=concept_id, language_id=language_id),
+                data=data,
+        )
+        if form.security_errors():
+            return CommentPostBadRequest("The comment form failed security verification.")
+        concept_in_lang, created = ConceptInLanguage.objects.get_or_create(
+                concept=get_object_or_404(Concept, pk=concept_id),
+                language=get_object_or_404(Language, pk=language_id),
+        )
+        data = data.copy()
+        data['object_pk'] = str(concept_in_lang.pk)
+        data['security_hash'] = form.generate_security_hash(
+                data['content_type'], data['object_pk'], data['timestamp'])
+        request.POST = data
+    return django_post_comment(request, next=next, using=using)
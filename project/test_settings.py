@@ -7,4 +7,5 @@ DATABASES = {
     }
 }
 
-
+# Tests that use the export cache enable it with a temporary directory.
+TBX_EXPORT_CACHE_DIR = None
@@ -25,6 +25,7 @@ from terminator.admin import myadmin
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^myadmin/', myadmin.urls),
+    url(r'^comments/', include('terminator_comments_app.urls')),
     url(r'^comments/', include('django_comments.urls')),
     url(r'^accounts/', include('registration.backends.model_activation.urls')),
     url(r'^i18n/', include('django.conf.urls.i18n')),